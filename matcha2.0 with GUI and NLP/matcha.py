@@ -1,33 +1,144 @@
 import fitz  # PyMuPDF
 import difflib
+import hashlib
 import os
 from datetime import datetime
-import spacy
 
-# Load the English language model for spaCy
-nlp = spacy.load("en_core_web_sm")
+SPACY_MODEL = "en_core_web_sm"
+# Only the tokenizer output is used, so the statistical components that
+# make spaCy slow are never loaded.
+SPACY_EXCLUDED_PIPES = ["parser", "ner", "lemmatizer"]
 
-def extract_text_with_nlp(pdf_path):
+_nlp = None
+
+def get_nlp():
+    """Load the spaCy model on first use; later calls reuse the same pipeline."""
+    global _nlp
+    if _nlp is None:
+        import spacy
+        _nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDED_PIPES)
+    return _nlp
+
+def _page_text_digest(text):
+    return hashlib.sha256(f"{SPACY_MODEL}\0{text}".encode("utf-8")).hexdigest()
+
+def _load_cached_doc(cache_dir, digest, nlp):
+    from spacy.tokens import DocBin
+    path = os.path.join(cache_dir, f"{digest}.spacy")
+    if not os.path.exists(path):
+        return None
+    try:
+        return next(DocBin().from_disk(path).get_docs(nlp.vocab))
+    except (OSError, ValueError, StopIteration):
+        # A corrupt entry is treated as a miss and rewritten.
+        return None
+
+def _store_cached_doc(cache_dir, digest, doc_nlp):
+    from spacy.tokens import DocBin
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    path = os.path.join(cache_dir, f"{digest}.spacy")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    DocBin(docs=[doc_nlp]).to_disk(tmp_path)
+    os.replace(tmp_path, path)
+
+def tokenize_pages(texts, batch_size=32, n_process=1, cache_dir=None):
+    """Run the page texts through spaCy, returning one Doc per text.
+
+    Pages are streamed through nlp.pipe in batches. With cache_dir set,
+    each page's Doc is persisted as a DocBin keyed by the hash of its
+    text, so unchanged pages are never tokenized again.
+    """
+    nlp = get_nlp()
+    docs = [None] * len(texts)
+    digests = [None] * len(texts)
+    if cache_dir:
+        for idx, text in enumerate(texts):
+            digests[idx] = _page_text_digest(text)
+            docs[idx] = _load_cached_doc(cache_dir, digests[idx], nlp)
+
+    pending = [idx for idx in range(len(texts)) if docs[idx] is None]
+    piped = nlp.pipe((texts[idx] for idx in pending), batch_size=batch_size, n_process=n_process)
+    for idx, doc_nlp in zip(pending, piped):
+        docs[idx] = doc_nlp
+        if cache_dir:
+            _store_cached_doc(cache_dir, digests[idx], doc_nlp)
+    return docs
+
+def page_text_from_words(words):
+    """Rebuild a page's text from get_text("words") output.
+
+    Words on the same PyMuPDF line are joined with a space, lines with a
+    newline. Returns the text and a (start, end, word) character span for
+    every word, which is what lets tokens be mapped back to word boxes.
+    """
+    parts = []
+    spans = []
+    pos = 0
+    prev_line = None
+    for w in words:
+        text = w[4].strip()
+        if not text:
+            continue
+        if parts:
+            parts.append(" " if (w[5], w[6]) == prev_line else "\n")
+            pos += 1
+        spans.append((pos, pos + len(text), w))
+        parts.append(text)
+        pos += len(text)
+        prev_line = (w[5], w[6])
+    return "".join(parts), spans
+
+def align_tokens_to_words(page_num, doc_nlp, spans):
+    """Map spaCy tokens to word boxes through their character offsets.
+
+    A single cursor walks forward over the word spans, so alignment is
+    linear in tokens + words and repeated words each keep their own box.
+    A token covering only part of a PDF word (e.g. "Company" and "'s")
+    gets the matching horizontal slice of that word's box.
+    """
+    page_words = []
+    cursor = 0
+    for token in doc_nlp:
+        if token.is_space:
+            continue
+        start = token.idx
+        end = start + len(token.text)
+        while cursor < len(spans) and spans[cursor][1] <= start:
+            cursor += 1
+        if cursor == len(spans):
+            break
+        w_start, w_end, w = spans[cursor]
+        if start < w_start:
+            continue
+        x0, x1 = w[0], w[2]
+        if start > w_start or end < w_end:
+            char_width = (w[2] - w[0]) / (w_end - w_start)
+            x0 = w[0] + (start - w_start) * char_width
+            x1 = w[0] + (min(end, w_end) - w_start) * char_width
+        page_words.append((page_num, x0, w[1], x1, w[3], token.text))
+    return page_words
+
+def extract_text_with_nlp(pdf_path, batch_size=32, n_process=1, cache_dir=None):
     doc = fitz.open(pdf_path)
-    pages_content = []
+    page_spans = []
+    page_texts = []
     for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        text = page.get_text()
-        if text.strip():
-            doc_nlp = nlp(text)
-            page_words = []
-            for token in doc_nlp:
-                # We need to approximate the bounding box of each token.
-                # This is a simplified approach and might not be perfectly accurate.
-                # PyMuPDF's "words" output is more precise for bounding boxes.
-                # We'll try to find words from the raw output that match the tokens.
-                for w in page.get_text("words"):
-                    if w[4].strip() == token.text.strip():
-                        page_words.append((page_num, w[0], w[1], w[2], w[3], token.text))
-                        break # Move to the next token once a match is found
-            if page_words:
-                pages_content.append(page_words)
+        # Words are extracted once per page; the text handed to spaCy is
+        # rebuilt from them so token offsets line up with word boxes.
+        text, spans = page_text_from_words(doc.load_page(page_num).get_text("words"))
+        if spans:
+            page_spans.append((page_num, spans))
+            page_texts.append(text)
     doc.close()
+
+    docs_nlp = tokenize_pages(page_texts, batch_size=batch_size, n_process=n_process, cache_dir=cache_dir)
+
+    pages_content = []
+    for (page_num, spans), doc_nlp in zip(page_spans, docs_nlp):
+        page_words = align_tokens_to_words(page_num, doc_nlp, spans)
+        if page_words:
+            pages_content.append(page_words)
     return pages_content
 
 def compare_text_content_nlp(text_list_old, text_list_new):
@@ -45,11 +156,11 @@ def compare_text_content_nlp(text_list_old, text_list_new):
     diff_report = list(diff)
     return diff_report
 
-def create_annotated_pdfs_nlp(old_pdf_path, new_pdf_path, output_folder="annotated_pdfs"):
+def create_annotated_pdfs_nlp(old_pdf_path, new_pdf_path, output_folder="annotated_pdfs", batch_size=32, n_process=1, cache_dir=None):
     print("Extracting text from Old PDF using NLP...")
-    words_old = extract_text_with_nlp(old_pdf_path)
+    words_old = extract_text_with_nlp(old_pdf_path, batch_size=batch_size, n_process=n_process, cache_dir=cache_dir)
     print("Extracting text from New PDF using NLP...")
-    words_new = extract_text_with_nlp(new_pdf_path)
+    words_new = extract_text_with_nlp(new_pdf_path, batch_size=batch_size, n_process=n_process, cache_dir=cache_dir)
 
     flat_words_old = [word for page in words_old for word in page]
     flat_words_new = [word for page in words_new for word in page]
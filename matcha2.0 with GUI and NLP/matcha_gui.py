@@ -1,20 +1,34 @@
+import time
+STARTUP_TIME = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import sys
 import threading
 import traceback
 from datetime import datetime
-from matcha import *
-
-try:
-    import matcha
-    import matcha_reports  # Import the new reporting module
-except ImportError as e:
-    messagebox.showerror("Import Error", f"Could not find required module: {e}. Make sure matcha.py and matcha_reports.py are in the same directory.")
-    exit()
-except Exception as e:
-    messagebox.showerror("Import Error", f"An error occurred during import:\n{e}")
-    exit()
+
+# --- Deferred pipeline imports ---
+# matcha pulls in PyMuPDF and matcha_reports pulls in reportlab; together
+# with the spaCy model that is seconds of blank window. They are loaded by
+# load_pipeline() on a background thread once the window is showing.
+matcha = None
+matcha_reports = None
+
+def load_pipeline(warm_nlp=False):
+    """Import the comparison modules (once; safe to call from any thread).
+
+    With warm_nlp the spaCy model is loaded too, so the first comparison
+    doesn't pay for it.
+    """
+    global matcha, matcha_reports
+    if matcha_reports is None:
+        import matcha
+        import matcha_reports
+    if warm_nlp:
+        matcha.get_nlp()
+    return matcha, matcha_reports
 
 # --- GUI Class ---
 class PdfComparatorApp:
@@ -31,6 +45,9 @@ class PdfComparatorApp:
         default_report_output = os.path.join(os.path.dirname(__file__), "comparison_reports")
         self.output_dir_path.set(default_output)
         self.report_dir_path.set(default_report_output)
+        # Tokenized pages are cached by text hash, so the report pass and
+        # re-runs against an unchanged baseline skip spaCy for those pages.
+        self.nlp_cache_dir = os.path.join(os.path.dirname(__file__), "nlp_cache")
 
         main_frame = ttk.Frame(root, padding="10 10 10 10")
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -71,6 +88,39 @@ class PdfComparatorApp:
         self.status_label = ttk.Label(main_frame, text="Status: Ready", anchor=tk.W, wraplength=550)
         self.status_label.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E), padx=5, pady=5)
 
+    # --- Startup ---
+
+    def start_warmup(self, on_ready=None):
+        """Load the pipeline and spaCy model in the background now that the window is up."""
+        self.startup_timings = {"window": time.perf_counter() - STARTUP_TIME}
+        print(f"Window shown {self.startup_timings['window']:.2f}s after start")
+        self.update_status("Loading PDF engine and language model...")
+
+        def warm_up():
+            try:
+                load_pipeline(warm_nlp=True)
+                error = None
+            except Exception as e:
+                error = e
+            self.root.after(0, self.pipeline_ready, error, on_ready)
+
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    def pipeline_ready(self, error, on_ready=None):
+        self.startup_timings["pipeline"] = time.perf_counter() - STARTUP_TIME
+        busy = str(self.compare_button.cget("state")) == tk.DISABLED
+        if error is not None:
+            # Not fatal here: the comparison retries and reports its own error.
+            print(f"Warm-up failed: {error}")
+            if not busy:
+                self.update_status(f"Could not preload the comparison modules: {error}")
+        else:
+            print(f"PDF engine and language model ready {self.startup_timings['pipeline']:.2f}s after start")
+            if not busy:
+                self.update_status("Ready")
+        if on_ready is not None:
+            on_ready()
+
     def select_old_pdf(self):
         file_path = filedialog.askopenfilename(
             title="Select Old PDF File",
@@ -150,8 +200,10 @@ class PdfComparatorApp:
     def run_comparison_worker(self, old_pdf, new_pdf, output_dir, report_dir):
         start_time = datetime.now()
         try:
-            matcha.create_annotated_pdfs_nlp(old_pdf, new_pdf, output_folder=output_dir)
-            matcha_reports.generate_comparison_report(old_pdf, new_pdf, output_folder=report_dir)
+            # Normally already imported by the startup warm-up; waits for it if not.
+            matcha, matcha_reports = load_pipeline()
+            matcha.create_annotated_pdfs_nlp(old_pdf, new_pdf, output_folder=output_dir, cache_dir=self.nlp_cache_dir)
+            matcha_reports.generate_comparison_report(old_pdf, new_pdf, output_folder=report_dir, cache_dir=self.nlp_cache_dir)
             end_time = datetime.now()
             duration = end_time - start_time
             self.root.after(0, self.comparison_finished, f"Comparison and report generation finished successfully in {duration}. Annotated PDFs saved to '{output_dir}', report saved to '{report_dir}'")
@@ -177,4 +229,13 @@ class PdfComparatorApp:
 if __name__ == "__main__":
     root = tk.Tk()
     app = PdfComparatorApp(root)
+    root.update()  # Paint the window before the heavy imports start.
+    if "--measure-startup" in sys.argv:
+        # Print the startup timings and exit, e.g. to compare machines or releases.
+        def report_startup():
+            print(f"window_seconds={app.startup_timings['window']:.3f} pipeline_seconds={app.startup_timings['pipeline']:.3f}")
+            root.destroy()
+        app.start_warmup(on_ready=report_startup)
+    else:
+        app.start_warmup()
     root.mainloop()
\ No newline at end of file
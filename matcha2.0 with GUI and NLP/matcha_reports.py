@@ -7,7 +7,7 @@ from datetime import datetime
 import difflib
 from matcha import extract_text_with_nlp # Or from matcha import extract_text_with_nlp
 
-def generate_comparison_report(old_pdf_path, new_pdf_path, output_folder="comparison_reports"):
+def generate_comparison_report(old_pdf_path, new_pdf_path, output_folder="comparison_reports", cache_dir=None):
     """
     Generates a PDF report summarizing the differences between two PDF files.
 
@@ -15,6 +15,7 @@ def generate_comparison_report(old_pdf_path, new_pdf_path, output_folder="compar
         old_pdf_path (str): Path to the old PDF file.
         new_pdf_path (str): Path to the new PDF file.
         output_folder (str, optional): Folder to save the report. Defaults to "comparison_reports".
+        cache_dir (str, optional): spaCy page cache shared with the annotation pass.
     """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -34,8 +35,8 @@ def generate_comparison_report(old_pdf_path, new_pdf_path, output_folder="compar
 
     # --- Extract Text Content ---
     print("Extracting text for report...")
-    words_old = extract_text_with_nlp(old_pdf_path) # Or extract_text_with_nlp
-    words_new = extract_text_with_nlp(new_pdf_path) # Or extract_text_with_nlp
+    words_old = extract_text_with_nlp(old_pdf_path, cache_dir=cache_dir) # Or extract_text_with_nlp
+    words_new = extract_text_with_nlp(new_pdf_path, cache_dir=cache_dir) # Or extract_text_with_nlp
 
     flat_words_old = [word[5] for page in words_old for word in page]
     flat_words_new = [word[5] for page in words_new for word in page]
@@ -1,94 +1,659 @@
 import fitz  # PyMuPDF
-import difflib
+import logging
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-def extract_text_with_positions(pdf_path):
-    doc = fitz.open(pdf_path)
-    pages_content = []
-    for page_num in range(len(doc)):
+import matcha_cache
+import matcha_diff
+import matcha_fuzzy
+import matcha_io
+import matcha_metrics
+import matcha_moves
+import matcha_normalize
+import matcha_progress
+from matcha_words import Vocabulary, WordTable
+
+log = logging.getLogger("matcha")
+
+def extract_text_with_positions(pdf_path, cache_dir=None, workers=1):
+    # Legacy tuple format; new code should use extract_word_table().
+    return extract_word_table(pdf_path, cache_dir=cache_dir, workers=workers).pages()
+
+def extract_word_table(pdf_path, cache_dir=None, workers=1, vocab=None):
+    return extract_documents([pdf_path], cache_dir=cache_dir, workers=workers, vocab=vocab)[0]
+
+def extract_documents(pdf_paths, cache_dir=None, workers=1, vocab=None, progress=None, cancel=None,
+                      memory_cache=None, pool=None):
+    """Extract several PDFs at once into WordTables sharing one vocabulary.
+
+    pdf_paths may also hold in-memory PDFs (bytes, memoryview, BytesIO) or
+    matcha_io.PdfInputs; a PdfInput's open document is reused rather than
+    the file being opened again.
+
+    With workers > 1 each document's page range is split into chunks that
+    are extracted by separate processes (each opening its own fitz
+    document) and merged back in page order, so the result is identical to
+    the serial path. Old and new documents share one worker pool.
+    progress/cancel are as for compare_pdfs(); pages are reported as they
+    finish (per chunk when running in parallel).
+
+    Long-running callers can pass a matcha_cache.MemoryCache, consulted
+    before cache_dir, and an already running ProcessPoolExecutor, which is
+    then used (split into `workers` chunks per document) instead of
+    starting a new one.
+    """
+    report = matcha_progress.reporter(progress, cancel)
+    if vocab is None:
+        vocab = Vocabulary()
+    inputs = [matcha_io.as_input(pdf_path) for pdf_path in pdf_paths]
+    results = [None] * len(inputs)
+    digests = {}
+    pending = []
+    for idx, source in enumerate(inputs):
+        if cache_dir or memory_cache is not None:
+            digests[idx] = source.digest()
+        cached = memory_cache.get(digests[idx]) if memory_cache is not None else None
+        if cached is not None:
+            matcha_metrics.current().count("memory_cache_hits")
+        elif cache_dir:
+            cached = matcha_cache.load_extraction(cache_dir, digests[idx])
+            if cached is not None:
+                matcha_metrics.current().count("cache_hits")
+                if memory_cache is not None:
+                    memory_cache.put(digests[idx], cached)
+        if cached is not None:
+            results[idx] = cached.remapped(vocab)
+        else:
+            pending.append(idx)
+
+    page_counts = {idx: len(inputs[idx].document()) for idx in pending}
+    total_pages = sum(page_counts.values())
+    done_pages = 0
+    report("extraction", done_pages, total_pages)
+    if (workers > 1 or pool is not None) and pending:
+        own_pool = pool is None
+        if own_pool:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {}
+            for idx in pending:
+                worker_source = inputs[idx].worker_source()
+                futures[idx] = [(stop - start, pool.submit(_extract_page_range, worker_source, start, stop))
+                                for start, stop in _page_chunks(page_counts[idx], workers)]
+            try:
+                for idx in pending:
+                    results[idx] = WordTable(vocab)
+                    for chunk_pages, future in futures[idx]:
+                        results[idx].extend(future.result())
+                        done_pages += chunk_pages
+                        report("extraction", done_pages, total_pages)
+            except BaseException:
+                # Don't let the pool's shutdown wait for chunks nobody needs any more.
+                for chunks in futures.values():
+                    for _, future in chunks:
+                        future.cancel()
+                raise
+        finally:
+            if own_pool:
+                pool.shutdown()
+    else:
+        for idx in pending:
+            results[idx] = _extract_pages(inputs[idx].document(), 0, None, vocab,
+                                          lambda pages: report("extraction", done_pages + pages, total_pages))
+            done_pages += page_counts[idx]
+
+    if cache_dir or memory_cache is not None:
+        for idx in pending:
+            # Cache entries carry their own compact vocabulary, not the
+            # shared one that also holds the other documents' words.
+            entry = results[idx].compacted()
+            if memory_cache is not None:
+                memory_cache.put(digests[idx], entry)
+            if cache_dir:
+                matcha_cache.store_extraction(cache_dir, digests[idx], entry)
+    return results
+
+def _page_chunks(page_count, workers):
+    # A few chunks per worker keeps the pool busy when some pages are much
+    # heavier than others, without reopening the document too often.
+    chunk_count = max(1, min(page_count, workers * 4))
+    bounds = [page_count * k // chunk_count for k in range(chunk_count + 1)]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if start < stop]
+
+def _extract_page_range(source, start, stop, vocab=None, on_page=None):
+    # Runs in a worker process: source is a path or the PDF's bytes.
+    doc = matcha_io.open_source(source)
+    try:
+        return _extract_pages(doc, start, stop, vocab, on_page)
+    finally:
+        doc.close()
+
+def _extract_pages(doc, start, stop, vocab=None, on_page=None):
+    table = WordTable(vocab)
+    for page_num in range(start, len(doc) if stop is None else stop):
+        page = doc.load_page(page_num)
+        table.append_page(page_num, page.get_text("words"))
+        if on_page is not None:
+            on_page(page_num - start + 1)
+    return table
+
+# --- Change records ---
+
+def change_record(opcode, table_old, table_new, index=None, max_text=None):
+    """Describe one opcode as a plain dict, for reports, change logs and other tools.
+
+    Keys: op (the opcode tag), opcode (its index, if given), old / new (the
+    [start, stop) rows of table_old / table_new, as highlight_rows() takes
+    them), page (0-based page of the new document the change is on),
+    old_page / new_page (first page of each side, None if it is empty),
+    old_text / new_text (cut to max_text characters if given) and
+    old_boxes / new_boxes ([page, x0, y0, x1, y1] per text line, the
+    rectangles a highlight of the change would cover).
+    """
+    tag, i1, i2, j1, j2 = opcode
+    record = {"op": tag}
+    if index is not None:
+        record["opcode"] = index
+    record["old"] = [i1, i2]
+    record["new"] = [j1, j2]
+    record["old_page"] = table_old.page[i1] if i2 > i1 else None
+    record["new_page"] = table_new.page[j1] if j2 > j1 else None
+    if record["new_page"] is not None:
+        record["page"] = record["new_page"]
+    elif len(table_new):
+        # Nothing left in the new document: the page where the words were.
+        record["page"] = table_new.page[min(j1, len(table_new) - 1)]
+    else:
+        record["page"] = record["old_page"]
+    record["old_text"] = _span_text(table_old, i1, i2, max_text)
+    record["new_text"] = _span_text(table_new, j1, j2, max_text)
+    record["old_boxes"] = _span_boxes(table_old, i1, i2)
+    record["new_boxes"] = _span_boxes(table_new, j1, j2)
+    return record
+
+def _span_text(table, start, stop, max_text):
+    if max_text is None:
+        return " ".join(table.texts(start, stop))
+    words = []
+    length = 0
+    for row in range(start, stop):
+        words.append(table.text(row))
+        length += len(words[-1]) + 1
+        if length > max_text:
+            return " ".join(words)[:max_text] + "..."
+    return " ".join(words)
+
+def _span_boxes(table, start, stop):
+    boxes = []
+    prev_key = None
+    for row in range(start, stop):
+        key = (table.page[row], table.block[row], table.line[row])
+        if key != prev_key:
+            boxes.append([table.page[row], table.x0[row], table.y0[row], table.x1[row], table.y1[row]])
+            prev_key = key
+        else:
+            box = boxes[-1]
+            box[1], box[2] = min(box[1], table.x0[row]), min(box[2], table.y0[row])
+            box[3], box[4] = max(box[3], table.x1[row]), max(box[4], table.y1[row])
+    return [[box[0]] + [round(v, 2) for v in box[1:]] for box in boxes]
+
+# Opcode tags that mean "no change": exact and OCR-tolerant matches.
+UNCHANGED_TAGS = ('equal', 'fuzzy')
+
+def iter_changes(result, max_text=None):
+    """Yield a change_record() for every changed opcode of a ComparisonResult, in order."""
+    for index, opcode in enumerate(result.opcodes):
+        if opcode[0] not in UNCHANGED_TAGS:
+            yield change_record(opcode, result.table_old, result.table_new, index=index, max_text=max_text)
+
+def compare_text_content(text_list_old, text_list_new, engine=matcha_diff.DEFAULT_ENGINE, hierarchical=True, max_text=None):
+    """Diff two extracted documents word by word, yielding change records.
+
+    The documents are WordTables or the legacy lists of pages of word
+    tuples. Records are generated lazily, see change_record(); pass them
+    to unified_diff() for the old text form.
+    """
+    vocab = Vocabulary()
+    table_old, table_new = (
+        doc.remapped(vocab) if isinstance(doc, WordTable) else WordTable.from_pages(doc, vocab)
+        for doc in (text_list_old, text_list_new))
+    if hierarchical:
+        opcodes = matcha_diff.hierarchical_opcodes([table_old.page_blocks(k) for k in range(table_old.page_count)],
+                                                   [table_new.page_blocks(k) for k in range(table_new.page_count)],
+                                                   engine=engine)
+    else:
+        opcodes = matcha_diff.get_opcodes(table_old.token, table_new.token, engine=engine)
+    yield from iter_changes(ComparisonResult(None, None, table_old, table_new, opcodes), max_text=max_text)
+
+def unified_diff(records, fromfile='Old PDF', tofile='New PDF'):
+    """Render change records as unified-diff style text, one line at a time.
+
+    Each change gets a hunk header with its 1-based pages and word ranges,
+    followed by its removed (-) and added (+) text.
+    """
+    yield f"--- {fromfile}"
+    yield f"+++ {tofile}"
+    for record in records:
+        (i1, i2), (j1, j2) = record["old"], record["new"]
+        old_page = f"p{record['old_page'] + 1}:" if record["old_page"] is not None else ""
+        new_page = f"p{record['new_page'] + 1}:" if record["new_page"] is not None else ""
+        yield f"@@ -{old_page}{i1 + 1},{i2 - i1} +{new_page}{j1 + 1},{j2 - j1} @@ {record['op']}"
+        if record["old_text"]:
+            yield f"-{record['old_text']}"
+        if record["new_text"]:
+            yield f"+{record['new_text']}"
+
+class ComparisonResult:
+    """Extracted words of both PDFs plus the word-level diff opcodes.
+
+    Built once per comparison by compare_pdfs() and handed to both the
+    annotator and the report generator so neither has to re-parse the
+    documents or recompute the diff. Opcode indices are rows of
+    table_old / table_new. old_source / new_source are the inputs as
+    matcha_io.PdfInputs, whose open documents the annotator reuses;
+    old_pdf_path / new_pdf_path are their paths, or names when in memory.
+    Both are None for tables that did not come from PDFs (see
+    compare_text_content()).
+    """
+
+    def __init__(self, old_pdf_path, new_pdf_path, table_old, table_new, opcodes):
+        self.old_source = None if old_pdf_path is None else matcha_io.as_input(old_pdf_path)
+        self.new_source = None if new_pdf_path is None else matcha_io.as_input(new_pdf_path)
+        self.old_pdf_path = _source_path(self.old_source)
+        self.new_pdf_path = _source_path(self.new_source)
+        self.table_old = table_old
+        self.table_new = table_new
+        self.opcodes = opcodes
+
+    # Tuple views for callers written against the old list-based result.
+    @property
+    def words_old(self):
+        return self.table_old.pages()
+
+    @property
+    def words_new(self):
+        return self.table_new.pages()
+
+    @property
+    def flat_words_old(self):
+        return self.table_old.words()
+
+    @property
+    def flat_words_new(self):
+        return self.table_new.words()
+
+    def change_counts(self):
+        """Word counts per change type, as shown in the comparison report."""
+        counts = {"old_words": len(self.table_old), "new_words": len(self.table_new)}
+        counts.update(count_changes(self.opcodes))
+        return counts
+
+def _source_path(source):
+    if source is None:
+        return None
+    return source.path or source.name
+
+def count_changes(opcodes, counts=None):
+    """Add the added/removed/replaced/moved word counts of opcodes to counts.
+
+    Words matched despite OCR noise ('fuzzy') are counted too, as "fuzzy",
+    but are not changes.
+    """
+    if counts is None:
+        counts = {"added": 0, "removed": 0, "replaced": 0, "moved": 0, "fuzzy": 0}
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'insert':
+            counts["added"] += (j2 - j1)
+        elif tag == 'delete':
+            counts["removed"] += (i2 - i1)
+        elif tag == 'replace':
+            counts["replaced"] += min(i2 - i1, j2 - j1) # Consider the shorter segment for word count
+        elif tag == 'move':
+            counts["moved"] = counts.get("moved", 0) + (i2 - i1)
+        elif tag == 'fuzzy':
+            counts["fuzzy"] = counts.get("fuzzy", 0) + (i2 - i1)
+    return counts
+
+def compare_pdfs(old_pdf_path, new_pdf_path, cache_dir=None, engine=matcha_diff.DEFAULT_ENGINE, hierarchical=True, workers=1,
+                 progress=None, cancel=None, memory_cache=None, pool=None, detect_moves=False,
+                 normalization=matcha_normalize.DEFAULT_PROFILE, fuzzy_threshold=None):
+    """Extract both PDFs and diff them word by word into a ComparisonResult.
+
+    progress, if given, is called as progress(stage, done, total) while
+    pages are extracted and matched; cancel is a matcha_progress.CancelToken
+    checked at the same points, raising ComparisonCancelled once it is set.
+    memory_cache and pool are passed on to extract_documents(). With
+    detect_moves, text that was deleted in one place and inserted in another
+    becomes 'move' opcodes instead, see matcha_moves.
+
+    hierarchical (the default, as in the CLI, GUI and daemon) anchors the
+    diff on unchanged pages and only word-diffs the rest; False diffs the
+    documents as one flat word sequence.
+
+    normalization names one of matcha_normalize.PROFILES: words are matched
+    after e.g. case folding and joining hyphenated line ends, while the
+    opcodes still index the extracted words, so annotations and reports
+    show the text as it is in the PDFs.
+
+    With a fuzzy_threshold (e.g. matcha_fuzzy.DEFAULT_THRESHOLD), words in
+    replaced spans that are near-identical after folding OCR confusions
+    ("rn"/"m", "0"/"O") become 'fuzzy' opcodes, which count as unchanged;
+    see matcha_fuzzy.
+
+    Either PDF may be a path, bytes, a memoryview, a binary file object or a
+    matcha_io.PdfInput (e.g. to memory-map a path); each is opened once and
+    the open document is kept on the result for create_annotated_pdfs().
+    """
+    report = matcha_progress.reporter(progress, cancel)
+    metrics = matcha_metrics.current()
+    normalizer = None
+    if normalization != "exact":
+        normalizer = matcha_normalize.Normalizer(normalization)
+    old_pdf_path = matcha_io.as_input(old_pdf_path)
+    new_pdf_path = matcha_io.as_input(new_pdf_path)
+    with metrics.stage("extraction"):
+        table_old, table_new = extract_documents([old_pdf_path, new_pdf_path], cache_dir=cache_dir, workers=workers,
+                                                 progress=progress, cancel=cancel, memory_cache=memory_cache, pool=pool)
+    metrics.count("pages", table_old.page_count + table_new.page_count)
+    metrics.count("words", len(table_old) + len(table_new))
+
+    # --- Matching runs on the normalized tokens, if any ---
+    match_old, match_new = table_old, table_new
+    if normalizer is not None:
+        with metrics.stage("normalization"):
+            match_old, match_new = normalizer.table(table_old), normalizer.table(table_new)
+        metrics.count("tokens", len(match_old) + len(match_new))
+
+    with metrics.stage("matching"):
+        if hierarchical:
+            # Only pages (and text blocks within them) that actually changed get word-diffed.
+            opcodes = matcha_diff.hierarchical_opcodes([match_old.page_blocks(k) for k in range(match_old.page_count)],
+                                                       [match_new.page_blocks(k) for k in range(match_new.page_count)],
+                                                       engine=engine,
+                                                       on_page=lambda done, total: report("matching", done, total))
+        else:
+            report("matching", 0, 1)
+            opcodes = matcha_diff.get_opcodes(match_old.token, match_new.token, engine=engine)
+            report("matching", 1, 1)
+    if detect_moves:
+        with metrics.stage("moves"):
+            opcodes = matcha_moves.detect_moves(match_old, match_new, opcodes)
+    if fuzzy_threshold:
+        with metrics.stage("fuzzy"):
+            opcodes = matcha_fuzzy.refine_replaces(match_old, match_new, opcodes, threshold=fuzzy_threshold)
+    if normalizer is not None:
+        opcodes = matcha_normalize.to_rows(opcodes, match_old, match_new)
+    metrics.count("opcodes", len(opcodes))
+
+    return ComparisonResult(old_pdf_path, new_pdf_path, table_old, table_new, opcodes)
+
+HIGHLIGHT_GRANULARITIES = ("word", "line", "block")
+
+def highlight_rows(doc, table, spans, color, granularity="line", on_page=None):
+    """Highlight the table rows covered by spans ((start, stop) pairs, ascending).
+
+    Rows are grouped by page so each page is loaded exactly once. With
+    granularity "line", runs of changed words on the same text line become
+    one highlight; with "block", one highlight per run inside a text block,
+    carrying one quad per line; "word" keeps one highlight per word.
+    on_page(done, total) is called after each annotated page.
+    Returns the number of annotations added.
+    """
+    if granularity not in HIGHLIGHT_GRANULARITIES:
+        raise ValueError(f"Unknown highlight granularity '{granularity}'. Use one of: {', '.join(HIGHLIGHT_GRANULARITIES)}")
+
+    # --- Split changed rows into runs that stay on one page/block/line ---
+    runs_by_page = {}
+    for start, stop in spans:
+        run = []
+        for k in range(start, stop):
+            if run and not _same_run(table, run[-1], k, granularity):
+                runs_by_page.setdefault(table.page[run[0]], []).append(run)
+                run = []
+            run.append(k)
+        if run:
+            runs_by_page.setdefault(table.page[run[0]], []).append(run)
+
+    annotation_count = 0
+    for done, (page_num, runs) in enumerate(runs_by_page.items(), 1):
         page = doc.load_page(page_num)
-        words = page.get_text("words")
-        page_words = [(page_num, w[0], w[1], w[2], w[3], w[4].strip()) for w in words if w[4].strip()]
-        if page_words:
-            pages_content.append(page_words)
+        for run in runs:
+            highlight = page.add_highlight_annot(_run_quads(table, run))
+            highlight.set_colors(stroke=color)
+            highlight.update()
+            annotation_count += 1
+        if on_page is not None:
+            on_page(done, len(runs_by_page))
+    return annotation_count
+
+def _same_run(table, prev_row, row, granularity):
+    if granularity == "word" or table.page[prev_row] != table.page[row] or table.block[prev_row] != table.block[row]:
+        return False
+    return granularity == "block" or table.line[prev_row] == table.line[row]
+
+def _run_quads(table, run):
+    # One rectangle per text line in the run, spanning its first to last word.
+    rects = []
+    prev_line = None
+    for k in run:
+        rect = fitz.Rect(table.rect(k))
+        if table.line[k] == prev_line:
+            rects[-1] |= rect
+        else:
+            rects.append(rect)
+            prev_line = table.line[k]
+    return rects
+
+SAVE_MODES = ("optimized", "fast", "incremental")
+
+def save_annotated_pdf(src_pdf_path, output_path, annotate, save_mode="optimized", cancel=None):
+    """Open a PDF, let annotate(doc) add highlights, and write it to output_path.
+
+    save_mode "optimized" garbage-collects, deflates and cleans the whole
+    file (smallest output, slowest); "fast" writes it back as-is; and
+    "incremental" copies the source to output_path and appends only the
+    new annotation objects to the copy. Returns the number of annotations
+    and the save time and output size, so the modes can be compared per job.
+
+    src_pdf_path may be anything matcha_io.as_input() takes. With
+    output_path None the annotated PDF is returned as bytes in the stats'
+    "data" instead of being written (an incremental save then becomes a
+    fast one).
+
+    cancel (a matcha_progress.CancelToken) is checked once more after
+    annotating, so a cancelled job never starts writing the file.
+    """
+    metrics = matcha_metrics.current()
+    with metrics.stage("annotation"):
+        doc, save_mode = open_annotation_target(src_pdf_path, output_path, save_mode)
+        try:
+            annotation_count = annotate(doc)
+            if cancel is not None:
+                cancel.check()
+        except BaseException:
+            discard_annotation_target(doc, output_path, save_mode)
+            raise
+    with metrics.stage("save"):
+        return finish_annotation_target(doc, output_path, save_mode, annotation_count)
+
+def open_annotation_target(src_pdf_path, output_path, save_mode="optimized"):
+    """Open the document that annotations for output_path should go into.
+
+    Returns the document and the save mode that will actually be used.
+    Unless the save is incremental this is the source's own document
+    (already open if it is a PdfInput that was extracted from), which is
+    closed again once saved.
+    """
+    if save_mode not in SAVE_MODES:
+        raise ValueError(f"Unknown save mode '{save_mode}'. Use one of: {', '.join(SAVE_MODES)}")
+
+    source = matcha_io.as_input(src_pdf_path)
+    if save_mode == "incremental" and output_path is None:
+        # Nothing on disk to append to.
+        save_mode = "fast"
+    if save_mode == "incremental":
+        source.write_copy(output_path)
+        doc = fitz.open(output_path)
+        if doc.can_save_incrementally():
+            return doc, save_mode
+        # Damaged or repaired files cannot be appended to; write them out in full.
+        log.warning("Cannot save %s incrementally, falling back to a fast save.", source.name)
+        doc.close()
+        save_mode = "fast"
+    return source.document(), save_mode
+
+def discard_annotation_target(doc, output_path, save_mode):
+    """Close a target that won't be saved, e.g. after a cancel or an error.
+
+    An incremental save's copy is removed, so no half-written file is left behind.
+    """
+    doc.close()
+    if save_mode == "incremental" and os.path.exists(output_path):
+        os.remove(output_path)
+
+def finish_annotation_target(doc, output_path, save_mode, annotation_count):
+    start_time = time.perf_counter()
+    data = None
+    if save_mode == "incremental":
+        doc.saveIncr()
+    elif save_mode == "fast":
+        if output_path is None:
+            data = doc.tobytes(garbage=0, deflate=False, clean=False)
+        else:
+            doc.save(output_path, garbage=0, deflate=False, clean=False)
+    else:
+        if output_path is None:
+            data = doc.tobytes(garbage=4, deflate=True, clean=True)
+        else:
+            doc.save(output_path, garbage=4, deflate=True, clean=True)
+    save_seconds = time.perf_counter() - start_time
     doc.close()
-    return pages_content
-
-def compare_text_content(text_list_old, text_list_new):
-   
-    flat_text_old = [" ".join(word[5] for word in page) for page in text_list_old]
-    flat_text_new = [" ".join(word[5] for word in page) for page in text_list_new]
-
-    diff = difflib.unified_diff(
-        flat_text_old,
-        flat_text_new,
-        fromfile='Old PDF',
-        tofile='New PDF',
-        lineterm='', 
-        n=3 
-    )
-    diff_report = list(diff)
-
-    return diff_report
-
-def create_annotated_pdfs(old_pdf_path, new_pdf_path, output_folder="annotated_pdfs"):
-    
-    print("Extracting text from Old PDF...")
-    words_old = extract_text_with_positions(old_pdf_path)
-    print("Extracting text from New PDF...")
-    words_new = extract_text_with_positions(new_pdf_path)
-
-    flat_words_old = [word for page in words_old for word in page]
-    flat_words_new = [word for page in words_new for word in page]
-
-    matcher = difflib.SequenceMatcher(None,
-                                      [w[5] for w in flat_words_old],
-                                      [w[5] for w in flat_words_new],
-                                      autojunk=False) 
-
-    opcodes = matcher.get_opcodes()
-
-    if not os.path.exists(output_folder):
+
+    output_bytes = os.path.getsize(output_path) if data is None else len(data)
+    metrics = matcha_metrics.current()
+    metrics.count("annotations", annotation_count)
+    metrics.count("bytes_written", output_bytes)
+    stats = {
+        "path": output_path,
+        "save_mode": save_mode,
+        "annotations": annotation_count,
+        "save_seconds": save_seconds,
+        "bytes": output_bytes,
+    }
+    if data is not None:
+        stats["data"] = data
+    return stats
+
+# Highlight colour of moved text, in both documents.
+MOVED_COLOR = [0.3, 0.6, 1]
+
+def create_annotated_pdfs(old_pdf_path, new_pdf_path, output_folder="annotated_pdfs", result=None, cache_dir=None, granularity="line", save_mode="optimized",
+                          progress=None, cancel=None, visual=False, visual_dpi=None):
+    """Write copies of both PDFs with their changes highlighted; returns the save stats of each.
+
+    With visual, pages whose rendering differs are also rasterized at
+    visual_dpi and compared outside their words, see matcha_visual, so
+    changed images, charts and other graphics are framed in the same colours.
+    'move' opcodes are highlighted in MOVED_COLOR in both documents.
+
+    The PDFs may be given as for compare_pdfs(); the documents a result was
+    extracted from are reused rather than reopened. With output_folder None
+    nothing is written to disk: each side's stats carry the annotated PDF
+    as bytes under "data" (and a "path" of None).
+    """
+
+    if result is None:
+        result = compare_pdfs(old_pdf_path, new_pdf_path, cache_dir=cache_dir, progress=progress, cancel=cancel)
+    source_old = _result_source(old_pdf_path, result.old_source)
+    source_new = _result_source(new_pdf_path, result.new_source)
+
+    table_old = result.table_old
+    table_new = result.table_new
+    opcodes = result.opcodes
+    spans_old = [(i1, i2) for tag, i1, i2, j1, j2 in opcodes if tag == 'delete' or tag == 'replace']
+    spans_new = [(j1, j2) for tag, i1, i2, j1, j2 in opcodes if tag == 'insert' or tag == 'replace']
+    # Moved text: where it left (ascending already) and where it arrived.
+    moved_old = [(i1, i2) for tag, i1, i2, j1, j2 in opcodes if tag == 'move']
+    moved_new = sorted((j1, j2) for tag, i1, i2, j1, j2 in opcodes if tag == 'move')
+
+    if output_folder is not None and not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    doc_old = fitz.open(old_pdf_path)
-    print("Annotating Old PDF...")
-    for tag, i1, i2, j1, j2 in opcodes:
-        if tag == 'delete' or tag == 'replace':
-            for k in range(i1, i2):
-                word_info = flat_words_old[k]
-                page_num, x0, y0, x1, y1, _ = word_info
-                page = doc_old.load_page(int(page_num))
-                # Highlight deleted/replaced text in Red
-                highlight = page.add_highlight_annot(fitz.Rect(x0, y0, x1, y1))
-                highlight.set_colors(stroke=[1, 0, 0]) # Red
-                highlight.update()
-
-    output_old_path = os.path.join(output_folder, f"annotated_OLD_{os.path.basename(old_pdf_path)}")
-    doc_old.save(output_old_path, garbage=4, deflate=True, clean=True)
-    print(f"Saved annotated old PDF to: {output_old_path}")
-    doc_old.close()
-
-    doc_new = fitz.open(new_pdf_path)
-    print("Annotating New PDF...")
-    for tag, i1, i2, j1, j2 in opcodes:
-        if tag == 'insert' or tag == 'replace':
-            for k in range(j1, j2):
-                word_info = flat_words_new[k]
-                page_num, x0, y0, x1, y1, _ = word_info
-                page = doc_new.load_page(int(page_num))
-                 # Highlight inserted/replaced text in Green
-                highlight = page.add_highlight_annot(fitz.Rect(x0, y0, x1, y1))
-                highlight.set_colors(stroke=[0, 1, 0]) # Green
-                highlight.update()
-
-    output_new_path = os.path.join(output_folder, f"annotated_NEW_{os.path.basename(new_pdf_path)}")
-    doc_new.save(output_new_path, garbage=4, deflate=True, clean=True)
-    print(f"Saved annotated new PDF to: {output_new_path}")
-    doc_new.close()
+    # --- Progress is reported over the changed pages of both documents ---
+    report = matcha_progress.reporter(progress, cancel)
+    pages_old = len(set().union(*(table_old.page[i1:i2] for i1, i2 in spans_old + moved_old)))
+    pages_new = len(set().union(*(table_new.page[j1:j2] for j1, j2 in spans_new + moved_new)))
+    report("annotation", 0, pages_old + pages_new)
+
+    regions_old, regions_new, visual_stats = {}, {}, None
+    if visual:
+        # numpy is only needed for this mode.
+        import matcha_visual
+        with matcha_metrics.current().stage("visual"):
+            regions_old, regions_new, visual_stats = matcha_visual.compare_pages(
+                source_old.document(), source_new.document(), dpi=visual_dpi or matcha_visual.VISUAL_DPI,
+                masks_old=matcha_visual.word_rects(table_old), masks_new=matcha_visual.word_rects(table_new),
+                on_page=lambda done, total: report("visual", done, total))
+
+    def annotate(doc, table, spans, color, moved, regions, region_color, on_page):
+        annotation_count = highlight_rows(doc, table, spans, color, granularity, on_page=on_page)
+        if moved:
+            annotation_count += highlight_rows(doc, table, moved, MOVED_COLOR, granularity)
+        if regions:
+            annotation_count += matcha_visual.add_region_annotations(doc, regions, region_color)
+        return annotation_count
+
+    log.info("Annotating Old PDF...")
+    output_old_path = _output_path(output_folder, "annotated_OLD_", source_old)
+    # Highlight deleted/replaced text in Red
+    old_stats = save_annotated_pdf(
+        source_old, output_old_path,
+        lambda doc: annotate(doc, table_old, spans_old, [1, 0, 0], moved_old, regions_old, matcha_visual.REGION_COLOR_OLD if visual else None,
+                             on_page=lambda done, total: report("annotation", done, pages_old + pages_new)),
+        save_mode, cancel=cancel)
+    report("save", 1, 2)
+    log.info("Saved annotated old PDF to: %s (%s save: %.2fs, %d bytes)", output_old_path or "memory", old_stats['save_mode'], old_stats['save_seconds'], old_stats['bytes'])
+
+    log.info("Annotating New PDF...")
+    output_new_path = _output_path(output_folder, "annotated_NEW_", source_new)
+    # Highlight inserted/replaced text in Green
+    new_stats = save_annotated_pdf(
+        source_new, output_new_path,
+        lambda doc: annotate(doc, table_new, spans_new, [0, 1, 0], moved_new, regions_new, matcha_visual.REGION_COLOR_NEW if visual else None,
+                             on_page=lambda done, total: report("annotation", pages_old + done, pages_old + pages_new)),
+        save_mode, cancel=cancel)
+    report("save", 2, 2)
+    log.info("Saved annotated new PDF to: %s (%s save: %.2fs, %d bytes)", output_new_path or "memory", new_stats['save_mode'], new_stats['save_seconds'], new_stats['bytes'])
+
+    stats = {"old": old_stats, "new": new_stats}
+    if visual_stats is not None:
+        stats["visual"] = visual_stats
+    return stats
+
+def _result_source(pdf, source):
+    # The result's own PdfInput, so its open document is reused, unless pdf
+    # is a path to some other file. In-memory PDFs can't be told apart
+    # cheaply, and a file object has already been read to its end.
+    if source is None:
+        return matcha_io.as_input(pdf)
+    if isinstance(pdf, (str, os.PathLike)) and os.fspath(pdf) != source.path:
+        return matcha_io.as_input(pdf)
+    return source
+
+def _output_path(output_folder, prefix, source):
+    return None if output_folder is None else os.path.join(output_folder, prefix + source.name)
 
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        # Any arguments switch to the batch command line, see matcha_cli.py,
+        # which sets up logging according to -v itself.
+        import matcha_cli
+        sys.exit(matcha_cli.main())
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     old_pdf = "sample_pdf/old_document.pdf" # CHANGE THIS
     new_pdf = "sample_pdf/new_document.pdf" # CHANGE THIS
     output_dir = "pdf_comparison_output"
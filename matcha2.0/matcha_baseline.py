@@ -0,0 +1,270 @@
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import matcha
+import matcha_diff
+import matcha_metrics
+import matcha_progress
+import matcha_reports
+
+log = logging.getLogger("matcha")
+
+SUMMARY_FILENAME = "baseline_summary.json"
+
+
+class PreparedBaseline:
+    """One baseline PDF, extracted and indexed once, to diff revisions against.
+
+    Each revision is extracted into a copy of the baseline's vocabulary,
+    so its token IDs are directly comparable and the baseline table is
+    never rebuilt, while the words only that revision uses go away with it
+    instead of piling up in the baseline over a long run.
+    """
+
+    def __init__(self, pdf_path, table, engine=matcha_diff.DEFAULT_ENGINE, hierarchical=True):
+        self.pdf_path = pdf_path
+        self.table = table
+        self.engine = engine
+        self.hierarchical = hierarchical
+        self.index = matcha_diff.BaselineIndex([table.page_blocks(k) for k in range(table.page_count)], engine=engine)
+
+    @classmethod
+    def load(cls, pdf_path, cache_dir=None, engine=matcha_diff.DEFAULT_ENGINE, hierarchical=True, workers=1):
+        table = matcha.extract_word_table(pdf_path, cache_dir=cache_dir, workers=workers)
+        return cls(pdf_path, table, engine=engine, hierarchical=hierarchical)
+
+    def compare(self, revision_pdf, cache_dir=None, progress=None, cancel=None):
+        """Diff one revision against the baseline; returns a ComparisonResult."""
+        metrics = matcha_metrics.current()
+        with metrics.stage("extraction"):
+            table_new = matcha.extract_documents([revision_pdf], cache_dir=cache_dir, vocab=self.table.vocab.copy(),
+                                                 progress=progress, cancel=cancel)[0]
+        with metrics.stage("matching"):
+            if self.hierarchical:
+                opcodes = self.index.hierarchical_opcodes([table_new.page_blocks(k) for k in range(table_new.page_count)])
+            else:
+                opcodes = self.index.opcodes(table_new.token)
+        return matcha.ComparisonResult(self.pdf_path, revision_pdf, self.table, table_new, opcodes)
+
+
+# --- Per-revision work (executed in a worker process) ---
+
+_baseline = None
+_cancel = None
+
+
+def _init_worker(pdf_path, table, engine, hierarchical, log_level=logging.WARNING, cancel_event=None):
+    # Runs once per worker: the baseline is shipped and indexed once per
+    # process rather than once per revision.
+    global _baseline, _cancel
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=log_level, format="%(message)s")
+    _baseline = PreparedBaseline(pdf_path, table, engine=engine, hierarchical=hierarchical)
+    _cancel = matcha_progress.CancelToken(cancel_event) if cancel_event is not None else None
+
+
+def _compare_revision(revision_id, revision_pdf, output_folder, options, progress=None, cancel=None):
+    # A cancelled comparison stops the whole run rather than being
+    # recorded as a failed revision.
+    if cancel is None:
+        cancel = _cancel
+    report = matcha_progress.reporter(progress, cancel)
+    summary = {"id": revision_id, "revision": revision_pdf}
+    start_time = time.perf_counter()
+    metrics = matcha_metrics.Metrics(job_name=revision_id)
+    try:
+        with metrics.job():
+            result = _baseline.compare(revision_pdf, cache_dir=options["cache_dir"], progress=progress, cancel=cancel)
+            revision_dir = os.path.join(output_folder, revision_id)
+            if not os.path.exists(revision_dir):
+                os.makedirs(revision_dir)
+            spans_new = [(j1, j2) for tag, i1, i2, j1, j2 in result.opcodes if tag in ('insert', 'replace')]
+            spans_old = [(i1, i2) for tag, i1, i2, j1, j2 in result.opcodes if tag in ('delete', 'replace')]
+            new_path = os.path.join(revision_dir, f"annotated_NEW_{os.path.basename(revision_pdf)}")
+            matcha.save_annotated_pdf(
+                revision_pdf, new_path,
+                lambda doc: matcha.highlight_rows(doc, result.table_new, spans_new, [0, 1, 0], options["granularity"],
+                                                  on_page=lambda done, total: report("annotation", done, total)),
+                options["save_mode"], cancel=cancel)
+            summary["annotated"] = new_path
+            if options["annotate_baseline"]:
+                old_path = os.path.join(revision_dir, f"annotated_OLD_{os.path.basename(_baseline.pdf_path)}")
+                matcha.save_annotated_pdf(
+                    _baseline.pdf_path, old_path,
+                    lambda doc: matcha.highlight_rows(doc, result.table_old, spans_old, [1, 0, 0], options["granularity"],
+                                                      on_page=lambda done, total: report("annotation", done, total)),
+                    options["save_mode"], cancel=cancel)
+                summary["annotated_baseline"] = old_path
+            if options["report"]:
+                summary["report"] = matcha_reports.generate_comparison_report(_baseline.pdf_path, revision_pdf,
+                                                                              output_folder=revision_dir, result=result,
+                                                                              progress=progress, cancel=cancel,
+                                                                              report_format=options["report_format"])
+        counts = result.change_counts()
+        summary.update(counts)
+        summary["changed_words"] = counts["added"] + counts["removed"] + counts["replaced"]
+        summary["deviation"] = summary["changed_words"] / max(counts["old_words"], counts["new_words"], 1)
+        summary["changed_pages"] = len(set().union(*(result.table_new.page[j1:j2] for j1, j2 in spans_new)))
+        summary["status"] = "ok"
+    except matcha_progress.ComparisonCancelled:
+        raise
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+        log.debug(traceback.format_exc())
+    summary["stages"] = {stage: round(seconds, 3) for stage, seconds in metrics.stages.items()}
+    summary["seconds"] = round(time.perf_counter() - start_time, 3)
+    return summary
+
+
+# --- Driver ---
+
+def compare_baseline(baseline_pdf, revision_pdfs, output_folder="baseline_comparison", jobs=1, cache_dir=None,
+                     engine=matcha_diff.DEFAULT_ENGINE, hierarchical=True, granularity="line", save_mode="optimized",
+                     report=False, annotate_baseline=False, summary_report=True, progress=None, cancel=None,
+                     report_format="pdf"):
+    """Compare one baseline PDF against many revisions of it.
+
+    The baseline is extracted once (from cache_dir if possible) and handed
+    to each of `jobs` worker processes once; revisions are then extracted,
+    diffed and annotated in parallel. Each revision gets a folder with its
+    annotated PDF (plus the annotated baseline and a report if asked for).
+    Returns the combined summary, which ranks revisions by deviation --
+    the share of words added, removed or replaced -- and is also written
+    to baseline_summary.json/.csv and, with summary_report, a PDF table.
+    progress("revisions", done, total) is called as revisions finish;
+    with jobs 1 the stages of each revision are reported as well. cancel
+    is checked between pages, inside the worker processes too.
+    """
+    global _baseline
+    report_progress = matcha_progress.reporter(progress, cancel)
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    start_time = time.perf_counter()
+    metrics = matcha_metrics.current()
+    with metrics.stage("extraction"):
+        baseline = PreparedBaseline.load(baseline_pdf, cache_dir=cache_dir, engine=engine, hierarchical=hierarchical)
+    log.info("Baseline %s: %d pages, %d words", baseline_pdf, baseline.table.page_count, len(baseline.table))
+
+    options = {"cache_dir": cache_dir, "granularity": granularity, "save_mode": save_mode,
+               "report": report, "report_format": report_format, "annotate_baseline": annotate_baseline}
+    todo = [(f"{index + 1:04d}_{os.path.splitext(os.path.basename(path))[0]}", path)
+            for index, path in enumerate(revision_pdfs)]
+    results = []
+    report_progress("revisions", 0, len(todo))
+    if jobs > 1 and len(todo) > 1:
+        cancel_event = multiprocessing.Event()
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(baseline_pdf, baseline.table, engine, hierarchical, logging.getLogger().level,
+                                           cancel_event)) as pool:
+            queue = iter(todo)
+            running = set()
+            try:
+                while True:
+                    # Bounded submission, as in matcha_cli.run_batch().
+                    for revision_id, path in queue:
+                        running.add(pool.submit(_compare_revision, revision_id, path, output_folder, options))
+                        if len(running) >= jobs * 2:
+                            break
+                    if not running:
+                        break
+                    # Wake up now and then, so a cancel reaches the workers.
+                    done, running = wait(running, timeout=None if cancel is None else 0.2, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                    report_progress("revisions", len(results), len(todo))
+            except BaseException:
+                # Stops the revisions already running at their next page.
+                cancel_event.set()
+                for future in running:
+                    future.cancel()
+                raise
+    else:
+        _baseline = baseline
+        try:
+            for revision_id, path in todo:
+                results.append(_compare_revision(revision_id, path, output_folder, options, progress=progress, cancel=cancel))
+                report_progress("revisions", len(results), len(todo))
+        finally:
+            _baseline = None
+
+    ranked = sorted(results, key=lambda r: (r["status"] != "ok", -r.get("deviation", 0.0), r["id"]))
+    for rank, entry in enumerate(ranked, 1):
+        entry["rank"] = rank
+    summary = {
+        "baseline": os.path.abspath(baseline_pdf),
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "baseline_words": len(baseline.table),
+        "revisions": ranked,
+        "failed": sum(1 for entry in ranked if entry["status"] != "ok"),
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+    summary["summary_json"] = write_summary(summary, output_folder)
+    if summary_report:
+        summary["summary_report"] = matcha_reports.generate_baseline_summary_report(summary, output_folder=output_folder)
+    return summary
+
+
+def write_summary(summary, output_folder):
+    """Write the ranked summary as JSON and CSV; returns the JSON path."""
+    json_path = os.path.join(output_folder, SUMMARY_FILENAME)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    columns = ["rank", "id", "revision", "status", "deviation", "changed_words", "added", "removed", "replaced",
+               "changed_pages", "new_words", "seconds", "error"]
+    with open(os.path.splitext(json_path)[0] + ".csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(summary["revisions"])
+    return json_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="matcha_baseline",
+                                     description="Compare one baseline PDF against many revisions and rank them.")
+    parser.add_argument("baseline", help="the master/template PDF")
+    parser.add_argument("revisions", nargs="+", help="revision PDFs, or directories of them")
+    parser.add_argument("-o", "--output-dir", default="baseline_comparison")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="revisions compared concurrently")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--engine", default=matcha_diff.DEFAULT_ENGINE, choices=sorted(matcha_diff.DIFF_ENGINES))
+    parser.add_argument("--flat", action="store_true", help="diff whole documents instead of anchoring on unchanged pages")
+    parser.add_argument("--granularity", default="line", choices=matcha.HIGHLIGHT_GRANULARITIES)
+    parser.add_argument("--save-mode", default="optimized", choices=matcha.SAVE_MODES)
+    parser.add_argument("--reports", action="store_true", help="also write a comparison report per revision")
+    parser.add_argument("--report-format", default="pdf", choices=sorted(matcha_reports.REPORT_BACKENDS))
+    parser.add_argument("--annotate-baseline", action="store_true", help="also write an annotated baseline per revision")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+
+    revisions = []
+    for path in args.revisions:
+        if os.path.isdir(path):
+            revisions.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(".pdf"))
+        else:
+            revisions.append(path)
+    summary = compare_baseline(args.baseline, revisions, output_folder=args.output_dir, jobs=max(1, args.jobs),
+                               cache_dir=args.cache_dir, engine=args.engine, hierarchical=not args.flat,
+                               granularity=args.granularity, save_mode=args.save_mode, report=args.reports,
+                               annotate_baseline=args.annotate_baseline, report_format=args.report_format)
+    for entry in summary["revisions"][:10]:
+        if entry["status"] == "ok":
+            print(f"{entry['rank']:>4}. {entry['id']}: {entry['deviation']:.2%} changed "
+                  f"({entry['changed_words']} words on {entry['changed_pages']} pages)")
+        else:
+            print(f"{entry['rank']:>4}. {entry['id']}: failed: {entry['error']}")
+    print(f"Summary written to: {summary['summary_json']}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
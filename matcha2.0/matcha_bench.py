@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+import fitz  # PyMuPDF
+
+import matcha
+import matcha_diff
+import matcha_metrics
+import matcha_reports
+
+BOILERPLATE = (
+    "This Agreement shall be governed by and construed in accordance with the laws of the State "
+    "and the parties hereby submit to the exclusive jurisdiction of its courts."
+).split()
+
+STAGES = ("extraction", "matching", "annotation", "save", "report")
+
+
+# --- Synthetic corpus ---
+
+def _vocabulary(rng, size=5000):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(2, 10))) for _ in range(size)]
+
+
+def _write_pdf(path, pages, fontsize):
+    doc = fitz.open()
+    for words in pages:
+        page = doc.new_page()
+        if page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36),
+                               " ".join(words), fontsize=fontsize) < 0:
+            print(f"Warning: text overflowed a page of {path}; lower words_per_page or fontsize")
+    doc.save(path)
+    doc.close()
+
+
+def generate_pair(folder, pages=50, words_per_page=300, edit_rate=0.01, moved_blocks=0,
+                  boilerplate=0.2, seed=0, fontsize=8):
+    """Write a reproducible old/new PDF pair into folder and return their paths.
+
+    The old document mixes random words with a repeated boilerplate clause
+    (a `boilerplate` fraction of each page). The new one applies word
+    replacements, deletions and insertions at `edit_rate` and relocates
+    `moved_blocks` 40-word passages to other pages.
+    """
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng)
+    old_pages = []
+    for _ in range(pages):
+        words = []
+        while len(words) < words_per_page:
+            if rng.random() < boilerplate:
+                words.extend(BOILERPLATE)
+            else:
+                words.extend(rng.choice(vocab) for _ in range(len(BOILERPLATE)))
+        old_pages.append(words[:words_per_page])
+
+    new_pages = []
+    for words in old_pages:
+        edited = []
+        for word in words:
+            roll = rng.random()
+            if roll < edit_rate / 3:
+                edited.append(rng.choice(vocab))
+            elif roll < edit_rate * 2 / 3:
+                continue
+            elif roll < edit_rate:
+                edited.extend((word, rng.choice(vocab)))
+            else:
+                edited.append(word)
+        new_pages.append(edited)
+    for _ in range(moved_blocks if pages > 1 else 0):
+        src, dst = rng.sample(range(pages), 2)
+        start = rng.randrange(max(1, len(new_pages[src]) - 40))
+        block = new_pages[src][start:start + 40]
+        del new_pages[src][start:start + 40]
+        at = rng.randrange(len(new_pages[dst]) + 1)
+        new_pages[dst][at:at] = block
+
+    old_path = os.path.join(folder, f"bench_old_{pages}p_seed{seed}.pdf")
+    new_path = os.path.join(folder, f"bench_new_{pages}p_seed{seed}.pdf")
+    _write_pdf(old_path, old_pages, fontsize)
+    _write_pdf(new_path, new_pages, fontsize)
+    return old_path, new_path
+
+
+# --- Stage timing ---
+
+def time_stages(old_pdf, new_pdf, output_folder, engine=matcha_diff.DEFAULT_ENGINE, hierarchical=True,
+                workers=1, granularity="line", save_mode="optimized"):
+    """Run one comparison through the real pipeline; returns its stage timings (seconds) and counts.
+
+    compare_pdfs(), create_annotated_pdfs() and the report run inside a
+    matcha_metrics job, and the job's own stage timers are reported, so
+    the benchmark measures exactly what a comparison spends.
+    """
+    metrics = matcha_metrics.Metrics(job_name=os.path.basename(new_pdf))
+    with metrics.job():
+        result = matcha.compare_pdfs(old_pdf, new_pdf, engine=engine, hierarchical=hierarchical, workers=workers)
+        matcha.create_annotated_pdfs(old_pdf, new_pdf, output_folder=output_folder, result=result,
+                                     granularity=granularity, save_mode=save_mode)
+        matcha_reports.generate_comparison_report(old_pdf, new_pdf, output_folder=output_folder, result=result)
+    timings = dict.fromkeys(STAGES, 0.0)
+    timings.update(metrics.stages)
+
+    counts = result.change_counts()
+    counts["opcodes"] = len(result.opcodes)
+    return timings, counts
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(cases, repeat=3, workdir=None, **pipeline_options):
+    """Time every case `repeat` times; the best run of each stage is reported."""
+    results = {
+        "revision": _git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "options": pipeline_options,
+        "cases": [],
+    }
+    with tempfile.TemporaryDirectory(dir=workdir) as folder:
+        for case in cases:
+            old_pdf, new_pdf = generate_pair(folder, **case)
+            best = {}
+            for _ in range(repeat):
+                timings, counts = time_stages(old_pdf, new_pdf, folder, **pipeline_options)
+                for stage, seconds in timings.items():
+                    best[stage] = min(seconds, best.get(stage, seconds))
+            best["total"] = sum(best.values())
+            results["cases"].append({"case": case, "seconds": best, "counts": counts})
+            print(f"{case}: " + ", ".join(f"{stage} {best[stage]:.3f}s" for stage in STAGES + ("total",)))
+    return results
+
+
+def find_regressions(results, baseline, tolerance=0.2, min_seconds=0.05):
+    """List stages that got more than `tolerance` slower than in baseline.
+
+    Cases are matched on their parameters; stages faster than min_seconds
+    in the baseline are ignored as timer noise.
+    """
+    baseline_cases = {json.dumps(entry["case"], sort_keys=True): entry for entry in baseline["cases"]}
+    regressions = []
+    for entry in results["cases"]:
+        previous = baseline_cases.get(json.dumps(entry["case"], sort_keys=True))
+        if previous is None:
+            continue
+        for stage, seconds in entry["seconds"].items():
+            before = previous["seconds"].get(stage)
+            if before is not None and before >= min_seconds and seconds > before * (1 + tolerance):
+                regressions.append({"case": entry["case"], "stage": stage, "before": before, "after": seconds})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the matcha pipeline on synthetic PDF pairs.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100], help="page counts to generate")
+    parser.add_argument("--words-per-page", type=int, nargs="+", default=[300])
+    parser.add_argument("--edit-rate", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--moved-blocks", type=int, default=0)
+    parser.add_argument("--boilerplate", type=float, default=0.2, help="fraction of each page made of a repeated clause")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", default=matcha_diff.DEFAULT_ENGINE, choices=sorted(matcha_diff.DIFF_ENGINES))
+    parser.add_argument("--flat", action="store_true", help="benchmark the flat diff instead of the page-anchored one")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--granularity", default="line", choices=matcha.HIGHLIGHT_GRANULARITIES)
+    parser.add_argument("--save-mode", default="optimized", choices=matcha.SAVE_MODES)
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="results JSON from an earlier commit to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against --baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    cases = [{"pages": pages, "words_per_page": words, "edit_rate": rate, "moved_blocks": args.moved_blocks,
+              "boilerplate": args.boilerplate, "seed": args.seed}
+             for pages in args.pages for words in args.words_per_page for rate in args.edit_rate]
+    results = run_benchmarks(cases, repeat=args.repeat, engine=args.engine, hierarchical=not args.flat,
+                             workers=args.workers, granularity=args.granularity, save_mode=args.save_mode)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote benchmark results to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f), tolerance=args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['stage']}: {r['before']:.3f}s -> {r['after']:.3f}s")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
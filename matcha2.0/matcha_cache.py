@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# Bump this whenever the layout of the cached extraction changes so stale
+# entries written by an older matcha are ignored instead of misread.
+CACHE_VERSION = 2
+
+
+def file_digest(pdf_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents."""
+    sha = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_file_path(cache_dir, digest):
+    return os.path.join(cache_dir, f"{digest}.v{CACHE_VERSION}.pkl")
+
+
+def load_extraction(cache_dir, digest):
+    """Return the cached extraction for a digest, or None on a cache miss."""
+    path = cache_file_path(cache_dir, digest)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        # A truncated or corrupt entry is treated as a miss and rewritten.
+        return None
+
+
+def store_extraction(cache_dir, digest, table):
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    path = cache_file_path(cache_dir, digest)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Atomic rename so a concurrent reader never sees a half-written entry.
+    os.replace(tmp_path, path)
+
+
+class MemoryCache:
+    """In-process LRU of extracted WordTables keyed by file digest.
+
+    Meant for long-running processes (see matcha_daemon.py) that compare
+    against the same baselines over and over. Capacity is counted in words
+    rather than entries since documents differ wildly in size; the least
+    recently used tables are dropped once max_words is exceeded. Tables
+    are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_words=5_000_000):
+        self.max_words = max_words
+        self.words = 0
+        self.hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            table = self._tables.get(digest)
+            if table is None:
+                self.misses += 1
+                return None
+            self._tables.move_to_end(digest)
+            self.hits += 1
+            return table
+
+    def put(self, digest, table):
+        with self._lock:
+            previous = self._tables.pop(digest, None)
+            if previous is not None:
+                self.words -= len(previous)
+            self._tables[digest] = table
+            self.words += len(table)
+            while self.words > self.max_words and len(self._tables) > 1:
+                _, evicted = self._tables.popitem(last=False)
+                self.words -= len(evicted)
+
+    def __len__(self):
+        return len(self._tables)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._tables), "words": self.words, "max_words": self.max_words,
+                    "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,334 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import matcha
+import matcha_diff
+import matcha_fuzzy
+import matcha_metrics
+import matcha_normalize
+import matcha_reports
+import matcha_stream
+
+log = logging.getLogger("matcha")
+
+SUMMARY_FILENAME = "summary.json"
+
+
+# --- Building the list of pairs ---
+
+def read_manifest(manifest_path):
+    """Read old/new pairs from a CSV (header: old,new[,id]) or JSONL manifest.
+
+    Relative paths are resolved against the manifest's own directory. An
+    id names the pair's output folder, so it must be a plain folder name
+    (no path separators or "..") and unique within the manifest.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith((".jsonl", ".json")):
+        with open(manifest_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(manifest_path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+    pairs = []
+    seen_ids = set()
+    for index, row in enumerate(rows):
+        if not row.get("old") or not row.get("new"):
+            raise ValueError(f"{manifest_path}: entry {index + 1} needs both 'old' and 'new'")
+        old_pdf = os.path.join(base_dir, row["old"])
+        new_pdf = os.path.join(base_dir, row["new"])
+        pair_id = row.get("id") or f"{index + 1:06d}_{os.path.splitext(os.path.basename(new_pdf))[0]}"
+        if not _is_plain_name(pair_id):
+            raise ValueError(f"{manifest_path}: entry {index + 1} has an id that is not a plain folder name: {pair_id!r}")
+        if pair_id in seen_ids:
+            raise ValueError(f"{manifest_path}: entry {index + 1} repeats the id {pair_id!r}")
+        seen_ids.add(pair_id)
+        pairs.append({"id": pair_id, "old": old_pdf, "new": new_pdf})
+    return pairs
+
+
+def _is_plain_name(name):
+    # Rejects "", ".", "..", absolute paths, drive letters and separators of
+    # either platform, so the pair folder stays inside output_dir.
+    return (isinstance(name, str) and name not in ("", ".", "..")
+            and not any(c in name for c in '/\\:\0') and os.path.basename(name) == name)
+
+
+def pair_directories(old_dir, new_dir):
+    """Pair every PDF under old_dir with the file at the same relative path under new_dir."""
+    pairs = []
+    for dirpath, _, filenames in os.walk(old_dir):
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(".pdf"):
+                continue
+            old_pdf = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(old_pdf, old_dir)
+            new_pdf = os.path.join(new_dir, rel_path)
+            if not os.path.exists(new_pdf):
+                log.warning("Skipping %s: no counterpart in %s", rel_path, new_dir)
+                continue
+            pair_id = os.path.splitext(rel_path)[0].replace(os.sep, "__")
+            pairs.append({"id": pair_id, "old": old_pdf, "new": new_pdf})
+    pairs.sort(key=lambda pair: pair["id"])
+    return pairs
+
+
+# --- Running one pair (executed in a worker process) ---
+
+def _pair_metrics(pair, pair_dir, options):
+    sinks = [matcha_metrics.LoggingSink()]
+    if options.get("metrics_jsonl"):
+        sinks.append(matcha_metrics.JsonLinesSink(options["metrics_jsonl"]))
+    if options.get("metrics_prom"):
+        sinks.append(matcha_metrics.PrometheusTextSink(os.path.join(pair_dir, "metrics.prom")))
+    return matcha_metrics.Metrics(job_name=pair["id"], sinks=sinks,
+                                  profile_path=os.path.join(pair_dir, "profile.prof") if options.get("profile") else None,
+                                  trace_malloc=options.get("trace_malloc", False))
+
+
+def run_pair(pair, output_dir, options):
+    pair_dir = os.path.join(output_dir, pair["id"])
+    if not os.path.exists(pair_dir):
+        os.makedirs(pair_dir)
+    metrics = _pair_metrics(pair, pair_dir, options)
+    with metrics.job():
+        summary = _run_pair(pair, pair_dir, options)
+    summary["stages"] = {stage: round(seconds, 3) for stage, seconds in metrics.stages.items()}
+    summary["peak_rss_bytes"] = metrics.peak_rss
+    return _write_summary(pair_dir, summary)
+
+
+def _run_pair(pair, pair_dir, options):
+    summary = {"id": pair["id"], "old": pair["old"], "new": pair["new"]}
+    start_time = time.perf_counter()
+    try:
+        if options.get("stream_window"):
+            streamed = matcha_stream.stream_compare(pair["old"], pair["new"], output_folder=pair_dir,
+                                                    report_folder=pair_dir if options["report"] else None,
+                                                    window=options["stream_window"], engine=options["engine"],
+                                                    granularity=options["granularity"], save_mode=options["save_mode"],
+                                                    report_format=options["report_format"],
+                                                    normalization=options["normalization"])
+            summary["annotated"] = {"old": streamed["old"]["path"], "new": streamed["new"]["path"]}
+            summary["changes"] = streamed["changes"]
+            if "report" in streamed:
+                summary["report"] = streamed["report"]
+            summary.update(streamed["counts"])
+        else:
+            result = matcha.compare_pdfs(pair["old"], pair["new"], cache_dir=options["cache_dir"],
+                                         engine=options["engine"], hierarchical=options["hierarchical"],
+                                         detect_moves=options["detect_moves"], normalization=options["normalization"],
+                                         fuzzy_threshold=options["fuzzy_threshold"])
+            save_stats = matcha.create_annotated_pdfs(pair["old"], pair["new"], output_folder=pair_dir, result=result,
+                                                      granularity=options["granularity"], save_mode=options["save_mode"],
+                                                      visual=options["visual"], visual_dpi=options["visual_dpi"])
+            summary["annotated"] = {"old": save_stats["old"]["path"], "new": save_stats["new"]["path"]}
+            if "visual" in save_stats:
+                summary["visual"] = save_stats["visual"]
+            if options["report"]:
+                summary["report"] = matcha_reports.generate_comparison_report(pair["old"], pair["new"], output_folder=pair_dir, result=result,
+                                                                              report_format=options["report_format"])
+            summary.update(result.change_counts())
+            summary["opcodes"] = len(result.opcodes)
+        summary["status"] = "ok"
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+        summary["traceback"] = traceback.format_exc()
+    summary["seconds"] = round(time.perf_counter() - start_time, 3)
+    return summary
+
+
+def _failed_summary(pair, error):
+    # For pairs whose worker never returned a summary (crashed process,
+    # unpicklable arguments, ...).
+    return {"id": pair["id"], "old": pair["old"], "new": pair["new"], "status": "error",
+            "error": f"{type(error).__name__}: {error}"}
+
+
+def _write_summary(pair_dir, summary):
+    summary_path = os.path.join(pair_dir, SUMMARY_FILENAME)
+    tmp_path = f"{summary_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    # The summary is written last and atomically: its presence marks the pair done.
+    os.replace(tmp_path, summary_path)
+    return summary
+
+
+def is_complete(pair, output_dir):
+    summary_path = os.path.join(output_dir, pair["id"], SUMMARY_FILENAME)
+    try:
+        with open(summary_path, encoding="utf-8") as f:
+            return json.load(f).get("status") == "ok"
+    except (OSError, ValueError):
+        return False
+
+
+# --- Command line ---
+
+def run_batch(pairs, output_dir, options, jobs=1, resume=True):
+    """Compare all pairs with at most `jobs` running at once.
+
+    Per-pair summaries land in <output_dir>/<id>/summary.json and every
+    finished pair is appended to <output_dir>/results.jsonl. With resume,
+    pairs whose summary already says "ok" are skipped, so a crashed run
+    can simply be restarted.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    todo = [pair for pair in pairs if not (resume and is_complete(pair, output_dir))]
+    print(f"{len(pairs)} pairs, {len(pairs) - len(todo)} already complete, {len(todo)} to run with {jobs} workers")
+
+    failures = 0
+    results_path = os.path.join(output_dir, "results.jsonl")
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(logging.getLogger().level,))
+    with open(results_path, "a", encoding="utf-8") as results_file, pool:
+        queue = iter(todo)
+        running = {}
+        finished = []
+        while True:
+            # Keep only a couple of pairs queued per worker so thousands of
+            # pairs never sit in memory as pending futures.
+            for pair in queue:
+                try:
+                    running[pool.submit(run_pair, pair, output_dir, options)] = pair
+                except Exception as e:
+                    # A broken pool refuses new work; record the pair as failed.
+                    finished.append(_record_failure(pair, output_dir, e))
+                if len(running) >= jobs * 2:
+                    break
+            for summary in finished:
+                failures += _log_result(results_file, summary)
+            finished = []
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                pair = running.pop(future)
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    # The worker died or the pair could not be sent to it:
+                    # record it and carry on with the rest of the batch.
+                    summary = _record_failure(pair, output_dir, e)
+                failures += _log_result(results_file, summary)
+    return failures
+
+
+def _record_failure(pair, output_dir, error):
+    summary = _failed_summary(pair, error)
+    pair_dir = os.path.join(output_dir, pair["id"])
+    try:
+        if not os.path.exists(pair_dir):
+            os.makedirs(pair_dir)
+        _write_summary(pair_dir, summary)
+    except OSError as e:
+        log.warning("Could not write the summary of %s: %s", pair["id"], e)
+    return summary
+
+
+def _log_result(results_file, summary):
+    # Appends one finished pair to results.jsonl; returns 1 if it failed.
+    summary.pop("traceback", None)
+    results_file.write(json.dumps(summary) + "\n")
+    results_file.flush()
+    if summary["status"] != "ok":
+        print(f"[{summary['id']}] failed: {summary['error']}")
+        return 1
+    print(f"[{summary['id']}] done in {summary['seconds']}s")
+    return 0
+
+
+def _init_worker(log_level):
+    # Spawned workers (Windows, macOS) do not inherit the parent's logging setup.
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=log_level, format="%(message)s")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="matcha", description="Compare many old/new PDF pairs without the GUI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="CSV (old,new[,id]) or JSONL file listing the pairs to compare")
+    source.add_argument("--old-dir", help="directory of old PDFs, mirrored by --new-dir")
+    parser.add_argument("--new-dir", help="directory of new PDFs with the same relative paths as --old-dir")
+    parser.add_argument("-o", "--output-dir", default="pdf_comparison_output", help="where per-pair outputs and results.jsonl are written")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of pairs compared concurrently")
+    parser.add_argument("--cache-dir", default=None, help="extraction cache shared by all pairs")
+    parser.add_argument("--engine", default=matcha_diff.DEFAULT_ENGINE, choices=sorted(matcha_diff.DIFF_ENGINES))
+    parser.add_argument("--flat", action="store_true", help="diff whole documents instead of anchoring on unchanged pages")
+    parser.add_argument("--granularity", default="line", choices=matcha.HIGHLIGHT_GRANULARITIES)
+    parser.add_argument("--save-mode", default="optimized", choices=matcha.SAVE_MODES)
+    parser.add_argument("--stream-window", type=int, default=0, metavar="PAGES",
+                        help="compare in bounded memory, holding at most this many pages per document")
+    parser.add_argument("--normalize", default=matcha_normalize.DEFAULT_PROFILE, choices=list(matcha_normalize.PROFILES),
+                        help="compare words ignoring case, ligatures and line-end hyphens (text), also punctuation "
+                             "(punctuation), or also numbers (loose)")
+    parser.add_argument("--fuzzy", type=float, nargs="?", const=matcha_fuzzy.DEFAULT_THRESHOLD, default=None, metavar="THRESHOLD",
+                        help="OCR-tolerant matching: treat words at least this similar (0-1, default "
+                             f"{matcha_fuzzy.DEFAULT_THRESHOLD}) inside replaced text as unchanged")
+    parser.add_argument("--detect-moves", action="store_true",
+                        help="highlight text that moved elsewhere in its own colour instead of as removed and added")
+    parser.add_argument("--visual", action="store_true",
+                        help="also rasterize pages whose drawing changed and frame changed images and graphics")
+    parser.add_argument("--visual-dpi", type=int, default=72, help="resolution of the visual comparison")
+    parser.add_argument("--no-report", action="store_true", help="skip the comparison report")
+    parser.add_argument("--report-format", default="pdf", choices=sorted(matcha_reports.REPORT_BACKENDS),
+                        help="pdf for people, json for other tools, html for a fast browsable report")
+    parser.add_argument("--metrics-jsonl", metavar="PATH", help="append per-pair stage timings and counters to this JSON lines file")
+    parser.add_argument("--metrics-prom", action="store_true", help="write a Prometheus text file (metrics.prom) into each pair folder")
+    parser.add_argument("--profile", action="store_true", help="capture a cProfile dump (profile.prof) for each pair")
+    parser.add_argument("--trace-malloc", action="store_true", help="record the peak of Python allocations with tracemalloc")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log per-stage progress")
+    parser.add_argument("--no-resume", action="store_true", help="re-run pairs that already completed")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.old_dir and not args.new_dir:
+        parser.error("--old-dir requires --new-dir")
+    if (args.visual or args.detect_moves or args.fuzzy) and args.stream_window:
+        parser.error("--visual, --detect-moves and --fuzzy cannot be combined with --stream-window")
+    if args.fuzzy is not None and not 0 < args.fuzzy <= 1:
+        parser.error("--fuzzy takes a similarity between 0 and 1")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format="%(message)s")
+
+    try:
+        pairs = read_manifest(args.manifest) if args.manifest else pair_directories(args.old_dir, args.new_dir)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    options = {
+        "cache_dir": args.cache_dir,
+        "engine": args.engine,
+        "hierarchical": not args.flat,
+        "granularity": args.granularity,
+        "save_mode": args.save_mode,
+        "detect_moves": args.detect_moves,
+        "normalization": args.normalize,
+        "fuzzy_threshold": args.fuzzy,
+        "visual": args.visual,
+        "visual_dpi": args.visual_dpi,
+        "report": not args.no_report,
+        "report_format": args.report_format,
+        "stream_window": args.stream_window,
+        "metrics_jsonl": os.path.abspath(args.metrics_jsonl) if args.metrics_jsonl else None,
+        "metrics_prom": args.metrics_prom,
+        "profile": args.profile,
+        "trace_malloc": args.trace_malloc,
+    }
+    failures = run_batch(pairs, args.output_dir, options, jobs=max(1, args.jobs), resume=not args.no_resume)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
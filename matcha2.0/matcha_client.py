@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Deliberately free of PyMuPDF/reportlab imports: this is the thin side of
+# matcha_daemon.py, cheap enough to load from the GUI or a web service.
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+# Every request carries the daemon's token in this header. The token lives
+# in a file only the user can read, so other local users and web pages
+# (which can send simple POSTs to localhost) cannot queue jobs.
+TOKEN_HEADER = "X-Matcha-Token"
+
+
+def default_token_file():
+    """Where the daemon writes its token and the client reads it: the user's config folder."""
+    if os.name == "nt":
+        config_dir = os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        config_dir = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(config_dir, "matcha", "daemon_token")
+
+
+def read_token(token_file=None):
+    """Return the token stored in token_file, or None if there is none yet."""
+    try:
+        with open(token_file or default_token_file(), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def ensure_token(token_file=None):
+    """Return the token in token_file, creating it (readable by the user only) if missing."""
+    token_file = token_file or default_token_file()
+    token = read_token(token_file)
+    if token is None:
+        os.makedirs(os.path.dirname(token_file) or ".", exist_ok=True)
+        token = secrets.token_urlsafe(32)
+        fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(token)
+    return token
+
+
+class DaemonError(Exception):
+    """The daemon could not be reached or rejected a request."""
+
+
+class DaemonClient:
+    def __init__(self, url=DEFAULT_URL, timeout=10, token=None, token_file=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.token = token if token is not None else read_token(token_file)
+
+    def _request(self, method, path, payload=None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise DaemonError(f"{method} {path}: {message}") from None
+        except (urllib.error.URLError, OSError) as e:
+            raise DaemonError(f"Cannot reach the matcha daemon at {self.url}: {e}") from None
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def submit(self, old_pdf, new_pdf, output_dir, **options):
+        """Queue a comparison; options are the job fields listed in matcha_daemon.job_spec().
+
+        Paths are made absolute here: the daemon runs in its own working
+        directory.
+        """
+        if options.get("report_dir"):
+            options["report_dir"] = os.path.abspath(options["report_dir"])
+        return self._request("POST", "/jobs", dict(options, old=os.path.abspath(old_pdf), new=os.path.abspath(new_pdf),
+                                                   output_dir=os.path.abspath(output_dir)))
+
+    def job(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def jobs(self):
+        return self._request("GET", "/jobs")
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def wait(self, job_id, poll_interval=0.25, progress=None, cancel=None):
+        """Poll a job until it finishes and return its final state.
+
+        progress(stage, done, total) is called with the job's latest
+        progress; if the matcha_progress.CancelToken cancel gets set, the
+        job is cancelled on the daemon and waited for as usual.
+        """
+        cancel_sent = False
+        while True:
+            job = self.job(job_id)
+            if job["status"] in FINISHED_STATES:
+                return job
+            if progress is not None and job.get("progress"):
+                progress(job["progress"]["stage"], job["progress"]["done"], job["progress"]["total"])
+            if cancel is not None and cancel.cancelled and not cancel_sent:
+                self.cancel(job_id)
+                cancel_sent = True
+            time.sleep(poll_interval)
+
+
+# --- Command line ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="matcha_client", description="Talk to a running matcha daemon.")
+    parser.add_argument("--url", default=DEFAULT_URL, help="daemon address")
+    parser.add_argument("--token-file", help=f"file holding the daemon's access token (default: {default_token_file()})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", help="queue one comparison")
+    submit.add_argument("old")
+    submit.add_argument("new")
+    submit.add_argument("-o", "--output-dir", default="pdf_comparison_output")
+    submit.add_argument("--report-dir", help="where to write the report (default: the output dir)")
+    submit.add_argument("--no-report", action="store_true")
+    submit.add_argument("--report-format", help="pdf, json or html")
+    submit.add_argument("--engine")
+    submit.add_argument("--flat", action="store_true", help="diff whole documents instead of anchoring on unchanged pages")
+    submit.add_argument("--granularity")
+    submit.add_argument("--save-mode")
+    submit.add_argument("--visual", action="store_true", help="also compare the pages' rendering")
+    submit.add_argument("--detect-moves", action="store_true", help="report moved text as moved")
+    submit.add_argument("--normalize", dest="normalization", help="exact, text, punctuation or loose")
+    submit.add_argument("--fuzzy", dest="fuzzy_threshold", type=float, metavar="THRESHOLD",
+                        help="treat words at least this similar (0-1) as unchanged OCR noise")
+    submit.add_argument("--wait", action="store_true", help="block until the job has finished")
+    status = commands.add_parser("status", help="show one job, or all jobs")
+    status.add_argument("job_id", nargs="?")
+    cancel = commands.add_parser("cancel", help="cancel a queued or running job")
+    cancel.add_argument("job_id")
+    commands.add_parser("health", help="show queue and cache statistics")
+    args = parser.parse_args(argv)
+
+    client = DaemonClient(args.url, token_file=args.token_file)
+    try:
+        if args.command == "submit":
+            options = {"report": not args.no_report, "hierarchical": not args.flat, "visual": args.visual,
+                       "detect_moves": args.detect_moves}
+            for name in ("report_dir", "report_format", "engine", "normalization", "fuzzy_threshold", "granularity", "save_mode"):
+                if getattr(args, name):
+                    options[name] = getattr(args, name)
+            job = client.submit(args.old, args.new, args.output_dir, **options)
+            if args.wait:
+                job = client.wait(job["id"])
+        elif args.command == "status":
+            job = client.job(args.job_id) if args.job_id else client.jobs()
+        elif args.command == "cancel":
+            job = client.cancel(args.job_id)
+        else:
+            job = client.health()
+    except DaemonError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(json.dumps(job, indent=2))
+    return 1 if isinstance(job, dict) and job.get("status") in ("failed", "cancelled") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
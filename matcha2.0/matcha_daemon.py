@@ -0,0 +1,398 @@
+import argparse
+import hmac
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import matcha
+import matcha_cache
+import matcha_client
+import matcha_diff
+import matcha_metrics
+import matcha_normalize
+import matcha_progress
+import matcha_reports
+
+log = logging.getLogger("matcha")
+
+MAX_REQUEST_BYTES = 64 * 1024
+
+
+def job_spec(payload):
+    """Validate a submitted job and fill in the defaults.
+
+    Required: old, new (PDF paths) and output_dir. Optional: report_dir
+    (defaults to output_dir), report (default true), report_format (default
+    pdf), engine, hierarchical (default true), detect_moves (default false),
+    normalization (default exact), fuzzy_threshold (default none: off),
+    granularity, save_mode, visual (default false) and visual_dpi.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+    for key in ("old", "new", "output_dir"):
+        if not payload.get(key):
+            raise ValueError(f"Missing '{key}'")
+    for key in ("old", "new"):
+        if not os.path.isfile(payload[key]):
+            raise ValueError(f"No such file: {payload[key]}")
+    spec = {
+        "old": os.path.abspath(payload["old"]),
+        "new": os.path.abspath(payload["new"]),
+        "output_dir": os.path.abspath(payload["output_dir"]),
+        "report_dir": os.path.abspath(payload.get("report_dir") or payload["output_dir"]),
+        "report": bool(payload.get("report", True)),
+        "report_format": payload.get("report_format", "pdf"),
+        "engine": payload.get("engine", matcha_diff.DEFAULT_ENGINE),
+        "hierarchical": bool(payload.get("hierarchical", True)),
+        "detect_moves": bool(payload.get("detect_moves", False)),
+        "normalization": payload.get("normalization", matcha_normalize.DEFAULT_PROFILE),
+        "fuzzy_threshold": payload.get("fuzzy_threshold"),
+        "granularity": payload.get("granularity", "line"),
+        "save_mode": payload.get("save_mode", "optimized"),
+        "visual": bool(payload.get("visual", False)),
+        "visual_dpi": payload.get("visual_dpi", 72),
+    }
+    if spec["report_format"] not in matcha_reports.REPORT_BACKENDS:
+        raise ValueError(f"Unknown report format '{spec['report_format']}'")
+    if spec["engine"] not in matcha_diff.DIFF_ENGINES:
+        raise ValueError(f"Unknown engine '{spec['engine']}'")
+    if spec["normalization"] not in matcha_normalize.PROFILES:
+        raise ValueError(f"Unknown normalization profile '{spec['normalization']}'")
+    if spec["fuzzy_threshold"] is not None and (isinstance(spec["fuzzy_threshold"], bool)
+                                                or not isinstance(spec["fuzzy_threshold"], (int, float))
+                                                or not 0 < spec["fuzzy_threshold"] <= 1):
+        raise ValueError("fuzzy_threshold must be a number between 0 and 1")
+    if spec["granularity"] not in matcha.HIGHLIGHT_GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{spec['granularity']}'")
+    if spec["save_mode"] not in matcha.SAVE_MODES:
+        raise ValueError(f"Unknown save mode '{spec['save_mode']}'")
+    if not isinstance(spec["visual_dpi"], int) or not 18 <= spec["visual_dpi"] <= 600:
+        raise ValueError("visual_dpi must be an integer between 18 and 600")
+    return spec
+
+
+def _warm_worker():
+    # Runs in each pool process so the first real job doesn't pay for imports.
+    import matcha  # noqa: F401
+    return os.getpid()
+
+
+class ComparisonService:
+    """Job queue, scheduler and warm shared state behind the daemon.
+
+    `jobs` dispatcher threads take comparisons off a FIFO queue. All of
+    them share one MemoryCache of extracted documents (backed by cache_dir
+    if given) and, with workers > 1, one long-lived process pool for page
+    extraction, so neither imports nor baselines are paid for per job.
+    """
+
+    def __init__(self, jobs=2, workers=1, cache_dir=None, cache_words=5_000_000, keep_jobs=1000, metrics_jsonl=None):
+        self.job_slots = jobs
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.memory_cache = matcha_cache.MemoryCache(max_words=cache_words)
+        self.keep_jobs = keep_jobs
+        self.metrics_sinks = [matcha_metrics.LoggingSink()]
+        if metrics_jsonl:
+            self.metrics_sinks.append(matcha_metrics.JsonLinesSink(metrics_jsonl))
+        self.pool = None
+        self.started = None
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = []
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self.workers > 1:
+            # Spawned rather than forked: forking a process that already runs
+            # HTTP and dispatcher threads can deadlock on inherited locks.
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            for future in [self.pool.submit(_warm_worker) for _ in range(self.workers)]:
+                future.result()
+        for n in range(self.job_slots):
+            thread = threading.Thread(target=self._dispatch_loop, name=f"matcha-job-{n + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.started = time.time()
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                if job["status"] in ("queued", "running"):
+                    job["cancel"].cancel()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    # --- Jobs ---
+
+    def submit(self, payload):
+        spec = job_spec(payload)
+        with self._lock:
+            job = {
+                "id": f"{next(self._ids):06d}",
+                "status": "queued",
+                "spec": spec,
+                "submitted": time.time(),
+                "cancel": matcha_progress.CancelToken(),
+            }
+            self._jobs[job["id"]] = job
+            self._prune()
+        self._queue.put(job)
+        log.info("Queued job %s: %s vs %s", job["id"], spec["old"], spec["new"])
+        return self._view(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+
+    def list_jobs(self):
+        with self._lock:
+            return [self._view(job) for job in self._jobs.values()]
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                job["status"] = "cancelled"
+                job["finished"] = time.time()
+            job["cancel"].cancel()
+            return self._view(job)
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job["status"]] = states.get(job["status"], 0) + 1
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1) if self.started else None,
+            "job_slots": self.job_slots,
+            "extraction_workers": self.workers,
+            "queued": self._queue.qsize(),
+            "jobs": states,
+            "memory_cache": self.memory_cache.stats(),
+        }
+
+    def _view(self, job):
+        return {key: value for key, value in job.items() if key != "cancel"}
+
+    def _prune(self):
+        # Forget the oldest finished jobs once more than keep_jobs are known.
+        excess = len(self._jobs) - self.keep_jobs
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job["status"] in matcha_client.FINISHED_STATES][:max(0, excess)]:
+            del self._jobs[job_id]
+
+    # --- Scheduling ---
+
+    def _dispatch_loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job["status"] != "queued":
+                    continue
+                job["status"] = "running"
+                job["started"] = time.time()
+            self._run(job)
+
+    def _run(self, job):
+        spec = job["spec"]
+
+        def progress(stage, done, total):
+            job["progress"] = {"stage": stage, "done": done, "total": total}
+
+        metrics = matcha_metrics.Metrics(job_name=f"job {job['id']}", sinks=self.metrics_sinks)
+        outcome = {}
+        try:
+            with metrics.job():
+                result = matcha.compare_pdfs(spec["old"], spec["new"], cache_dir=self.cache_dir, engine=spec["engine"],
+                                             hierarchical=spec["hierarchical"], detect_moves=spec["detect_moves"],
+                                             normalization=spec["normalization"], fuzzy_threshold=spec["fuzzy_threshold"],
+                                             workers=self.workers,
+                                             progress=progress, cancel=job["cancel"],
+                                             memory_cache=self.memory_cache, pool=self.pool)
+                save_stats = matcha.create_annotated_pdfs(spec["old"], spec["new"], output_folder=spec["output_dir"],
+                                                          result=result, granularity=spec["granularity"],
+                                                          save_mode=spec["save_mode"], progress=progress, cancel=job["cancel"],
+                                                          visual=spec["visual"], visual_dpi=spec["visual_dpi"])
+                outcome["annotated"] = {"old": save_stats["old"]["path"], "new": save_stats["new"]["path"]}
+                if "visual" in save_stats:
+                    outcome["visual"] = save_stats["visual"]
+                if spec["report"]:
+                    outcome["report"] = matcha_reports.generate_comparison_report(
+                        spec["old"], spec["new"], output_folder=spec["report_dir"], result=result,
+                        progress=progress, cancel=job["cancel"], report_format=spec["report_format"])
+                outcome.update(result.change_counts())
+                outcome["opcodes"] = len(result.opcodes)
+            status = "done"
+        except matcha_progress.ComparisonCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status = "failed"
+            job["error"] = f"{type(e).__name__}: {e}"
+            log.error("Job %s failed:\n%s", job["id"], traceback.format_exc())
+        with self._lock:
+            job["result"] = outcome
+            job["stages"] = {stage: round(seconds, 3) for stage, seconds in metrics.stages.items()}
+            job["finished"] = time.time()
+            job["status"] = status
+
+
+# --- HTTP front end ---
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = "matcha-daemon"
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_id(self):
+        path = urlparse(self.path).path.rstrip("/")
+        return path[len("/jobs/"):] if path.startswith("/jobs/") else None
+
+    def _authorized(self):
+        # Checked before anything else is looked at; see matcha_client.TOKEN_HEADER.
+        token = self.server.token
+        if token is None or hmac.compare_digest(self.headers.get(matcha_client.TOKEN_HEADER, ""), token):
+            return True
+        self._send(401, {"error": "Missing or wrong access token"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        service = self.server.service
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/health":
+            self._send(200, service.stats())
+        elif path == "/jobs":
+            self._send(200, service.list_jobs())
+        elif self._job_id():
+            job = service.get(self._job_id())
+            if job:
+                self._send(200, job)
+            else:
+                self._send(404, {"error": "No such job"})
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            return self._send(404, {"error": "Not found"})
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            return self._send(415, {"error": "Expected Content-Type: application/json"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._send(400, {"error": "Invalid Content-Length"})
+        if length < 0:
+            # rfile.read(-1) would read until the client hangs up.
+            return self._send(400, {"error": "Invalid Content-Length"})
+        if length > MAX_REQUEST_BYTES:
+            return self._send(413, {"error": "Request too large"})
+        try:
+            job = self.server.service.submit(json.loads(self.rfile.read(length) or b"null"))
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        self._send(202, job)
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        job = self.server.service.cancel(self._job_id()) if self._job_id() else None
+        if job:
+            self._send(200, job)
+        else:
+            self._send(404, {"error": "No such job"})
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(service, host="127.0.0.1", port=8765, token=None):
+    """Bind the HTTP front end for service; requests must carry token unless it is None."""
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.token = token
+    return server
+
+
+def serve(service, host="127.0.0.1", port=8765, token=None):
+    """Run the HTTP front end for service until interrupted."""
+    server = make_server(service, host=host, port=port, token=token)
+    service.start()
+    # SIGTERM (service managers, `kill`) stops the server like Ctrl+C does;
+    # shutdown() must come from another thread than serve_forever().
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    log.info("matcha daemon listening on http://%s:%d (%d job slots, %d extraction workers)",
+             host, server.server_address[1], service.job_slots, service.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.info("Shutting down...")
+        server.server_close()
+        service.shutdown()
+
+
+def main(argv=None):
+    default = urlparse(matcha_client.DEFAULT_URL)
+    parser = argparse.ArgumentParser(prog="matcha_daemon",
+                                     description="Serve PDF comparisons from a long-running process with warm caches.")
+    parser.add_argument("--host", default=default.hostname,
+                        help="address to bind; keep it on loopback, jobs read and write local paths")
+    parser.add_argument("--port", type=int, default=default.port)
+    parser.add_argument("--jobs", type=int, default=2, help="comparisons run concurrently")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="size of the shared page-extraction process pool")
+    parser.add_argument("--cache-dir", default=None, help="on-disk extraction cache behind the in-memory one")
+    parser.add_argument("--cache-words", type=int, default=5_000_000,
+                        help="capacity of the in-memory extraction cache, in words")
+    parser.add_argument("--token-file", default=matcha_client.default_token_file(),
+                        help="access token clients must send; created on first start (default: %(default)s)")
+    parser.add_argument("--metrics-jsonl", metavar="PATH", help="append per-job stage timings to this JSON lines file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+
+    service = ComparisonService(jobs=max(1, args.jobs), workers=max(1, args.workers), cache_dir=args.cache_dir,
+                                cache_words=args.cache_words, metrics_jsonl=args.metrics_jsonl)
+    serve(service, host=args.host, port=args.port, token=matcha_client.ensure_token(args.token_file))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
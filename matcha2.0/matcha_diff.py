@@ -0,0 +1,344 @@
+import difflib
+from bisect import bisect_left
+
+# Regions with no unique anchor token fall back to difflib, but only while
+# len(a) * len(b) stays below this; beyond it difflib's quadratic behaviour
+# on repeated tokens is what we are trying to avoid in the first place.
+MAX_FALLBACK_CELLS = 250000
+
+# Anchor sizes tried in turn by the patience engine, see _unique_anchors().
+ANCHOR_GRAM_SIZES = (1, 2, 4, 8)
+
+DEFAULT_ENGINE = "patience"
+
+
+def intern_tokens(seq_a, seq_b):
+    """Map the tokens of both sequences to shared integer IDs."""
+    vocab = {}
+    ids_a = [vocab.setdefault(t, len(vocab)) for t in seq_a]
+    ids_b = [vocab.setdefault(t, len(vocab)) for t in seq_b]
+    return ids_a, ids_b
+
+
+def opcodes_from_blocks(blocks, len_a, len_b):
+    """Turn sorted, non-overlapping (i, j, size) matches into difflib opcodes.
+
+    Adjacent blocks are merged first so 'equal' spans come out maximal,
+    exactly like SequenceMatcher.get_opcodes().
+    """
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1][2] += size
+        elif size:
+            merged.append([i, j, size])
+    merged.append([len_a, len_b, 0])
+
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in merged:
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+def difflib_opcodes(seq_a, seq_b):
+    return difflib.SequenceMatcher(None, seq_a, seq_b, autojunk=False).get_opcodes()
+
+
+def patience_opcodes(seq_a, seq_b):
+    """Patience diff over interned token IDs.
+
+    Common prefixes/suffixes are peeled off, then tokens occurring exactly
+    once on both sides (or, failing that, unique k-grams) are chained into
+    anchors with a longest increasing subsequence and the gaps between
+    anchors are diffed recursively. Regions without any unique anchor are
+    handed to difflib when small, or split on their rarest shared token
+    when large, so the run stays close to linear even on boilerplate-heavy
+    documents.
+    """
+    ids_a, ids_b = intern_tokens(seq_a, seq_b)
+    blocks = []
+    stack = [(0, len(ids_a), 0, len(ids_b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        # --- Peel off the common prefix and suffix ---
+        start = 0
+        while alo + start < ahi and blo + start < bhi and ids_a[alo + start] == ids_b[blo + start]:
+            start += 1
+        if start:
+            blocks.append((alo, blo, start))
+            alo += start
+            blo += start
+        end = 0
+        while ahi - end > alo and bhi - end > blo and ids_a[ahi - end - 1] == ids_b[bhi - end - 1]:
+            end += 1
+        if end:
+            ahi -= end
+            bhi -= end
+            blocks.append((ahi, bhi, end))
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(ids_a, alo, ahi, ids_b, blo, bhi)
+        if not anchors:
+            if (ahi - alo) * (bhi - blo) <= MAX_FALLBACK_CELLS:
+                matcher = difflib.SequenceMatcher(None, ids_a[alo:ahi], ids_b[blo:bhi], autojunk=False)
+                blocks.extend((alo + i, blo + j, n) for i, j, n in matcher.get_matching_blocks() if n)
+                continue
+            anchors = _rarest_anchors(ids_a, alo, ahi, ids_b, blo, bhi)
+            if not anchors:
+                continue
+
+        # --- Recurse into the gaps between anchors ---
+        prev_a, prev_b = alo, blo
+        for i, j, size in anchors:
+            blocks.append((i, j, size))
+            if prev_a < i or prev_b < j:
+                stack.append((prev_a, i, prev_b, j))
+            prev_a, prev_b = i + size, j + size
+        if prev_a < ahi or prev_b < bhi:
+            stack.append((prev_a, ahi, prev_b, bhi))
+
+    blocks.sort()
+    return opcodes_from_blocks(blocks, len(ids_a), len(ids_b))
+
+
+def _unique_anchors(ids_a, alo, ahi, ids_b, blo, bhi):
+    # Single tokens first; if none is unique on both sides (boilerplate,
+    # repeated clause numbers) try progressively longer k-grams, which are
+    # almost always unique within a region of natural-language text.
+    for k in ANCHOR_GRAM_SIZES:
+        if ahi - alo < k or bhi - blo < k:
+            break
+        if k == 1:
+            keys_a = ids_a[alo:ahi]
+            keys_b = ids_b[blo:bhi]
+        else:
+            keys_a = list(zip(*(ids_a[alo + d:ahi - k + 1 + d] for d in range(k))))
+            keys_b = list(zip(*(ids_b[blo + d:bhi - k + 1 + d] for d in range(k))))
+        first_a = {}
+        for i, key in enumerate(keys_a):
+            first_a[key] = i if key not in first_a else -1
+        first_b = {}
+        for j, key in enumerate(keys_b):
+            if first_a.get(key, -1) >= 0:
+                first_b[key] = j if key not in first_b else -1
+        pairs = sorted((first_a[key], j) for key, j in first_b.items() if j >= 0)
+        anchors = []
+        for i, j in _longest_increasing(pairs):
+            # k-gram anchors may overlap their predecessor; keep them disjoint.
+            if anchors and (alo + i < anchors[-1][0] + k or blo + j < anchors[-1][1] + k):
+                continue
+            anchors.append((alo + i, blo + j, k))
+        if anchors:
+            return anchors
+    return []
+
+
+def _rarest_anchors(ids_a, alo, ahi, ids_b, blo, bhi):
+    positions_a = {}
+    for i in range(alo, ahi):
+        positions_a.setdefault(ids_a[i], []).append(i)
+    positions_b = {}
+    for j in range(blo, bhi):
+        if ids_b[j] in positions_a:
+            positions_b.setdefault(ids_b[j], []).append(j)
+    if not positions_b:
+        return []
+    rarest = min(positions_b, key=lambda t: max(len(positions_a[t]), len(positions_b[t])))
+    # Pair the k-th occurrence on each side; good enough to split the region.
+    return [(i, j, 1) for i, j in zip(positions_a[rarest], positions_b[rarest])]
+
+
+def _longest_increasing(pairs):
+    """Longest chain of pairs increasing in both coordinates (pairs sorted by i)."""
+    tails = []
+    tail_index = []
+    back = [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        back[k] = tail_index[pos - 1] if pos else None
+    chain = []
+    k = tail_index[-1] if tail_index else None
+    while k is not None:
+        chain.append(pairs[k])
+        k = back[k]
+    chain.reverse()
+    return chain
+
+
+DIFF_ENGINES = {
+    "difflib": difflib_opcodes,
+    "patience": patience_opcodes,
+}
+
+
+def get_opcodes(seq_a, seq_b, engine=DEFAULT_ENGINE):
+    """Return difflib-style (tag, i1, i2, j1, j2) opcodes from the named engine."""
+    try:
+        diff_func = DIFF_ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Unknown diff engine '{engine}'. Available: {', '.join(sorted(DIFF_ENGINES))}")
+    return diff_func(seq_a, seq_b)
+
+
+def hierarchical_opcodes(pages_a, pages_b, engine=DEFAULT_ENGINE, on_page=None):
+    """Page-anchored two-level diff.
+
+    pages_a and pages_b are lists of pages, each page a list of blocks and
+    each block a list of tokens. Whole pages are aligned first on their
+    content, then blocks inside changed page spans, and the word-level
+    engine only runs inside blocks that still differ. The result is the
+    same flat (tag, i1, i2, j1, j2) opcode list over the concatenated
+    tokens that get_opcodes() would return. on_page(done, total) is called
+    as the pages of pages_a are consumed.
+    """
+    page_keys_a = _page_keys(pages_a)
+    page_keys_b = _page_keys(pages_b)
+    return _refine_pages(pages_a, page_keys_a, pages_b, page_keys_b,
+                         get_opcodes(page_keys_a, page_keys_b, engine=engine), engine, on_page)
+
+
+def _page_keys(pages):
+    return [tuple(t for block in page for t in block) for page in pages]
+
+
+def _refine_pages(pages_a, page_keys_a, pages_b, page_keys_b, page_opcodes, engine, on_page):
+    # Turn page-level opcodes into word-level ones, see hierarchical_opcodes().
+    page_starts_a = _offsets(len(k) for k in page_keys_a)
+    page_starts_b = _offsets(len(k) for k in page_keys_b)
+
+    opcodes = []
+    for tag, p1, p2, q1, q2 in page_opcodes:
+        if on_page is not None:
+            on_page(p1, len(pages_a))
+        i1, i2 = page_starts_a[p1], page_starts_a[p2]
+        j1, j2 = page_starts_b[q1], page_starts_b[q2]
+        if tag != 'replace':
+            opcodes.append((tag, i1, i2, j1, j2))
+            continue
+
+        # --- Changed page span: align blocks, word-diff what is left ---
+        blocks_a = [tuple(block) for page in pages_a[p1:p2] for block in page]
+        blocks_b = [tuple(block) for page in pages_b[q1:q2] for block in page]
+        block_starts_a = _offsets((len(b) for b in blocks_a), i1)
+        block_starts_b = _offsets((len(b) for b in blocks_b), j1)
+        for btag, b1, b2, c1, c2 in get_opcodes(blocks_a, blocks_b, engine=engine):
+            k1, k2 = block_starts_a[b1], block_starts_a[b2]
+            l1, l2 = block_starts_b[c1], block_starts_b[c2]
+            if btag != 'replace':
+                opcodes.append((btag, k1, k2, l1, l2))
+                continue
+            words_a = [t for block in blocks_a[b1:b2] for t in block]
+            words_b = [t for block in blocks_b[c1:c2] for t in block]
+            opcodes.extend((wtag, k1 + w1, k1 + w2, l1 + v1, l1 + v2)
+                           for wtag, w1, w2, v1, v2 in get_opcodes(words_a, words_b, engine=engine))
+    if on_page is not None:
+        on_page(len(pages_a), len(pages_a))
+    return normalize_opcodes(opcodes)
+
+
+class BaselineIndex:
+    """The baseline side of many diffs against one document, indexed once.
+
+    pages is in hierarchical_opcodes() form. The page keys are built once
+    instead of per revision, and with the difflib engine the baseline's
+    SequenceMatcher is kept too: difflib indexes its *second* sequence
+    (b2j), so revisions are passed as the first one and the opcodes are
+    swapped back. Results are always baseline (a) vs revision (b); with
+    difflib they are an equally valid diff but may break ties differently
+    than a fresh get_opcodes(baseline, revision) call.
+    """
+
+    def __init__(self, pages, engine=DEFAULT_ENGINE):
+        if engine not in DIFF_ENGINES:
+            raise ValueError(f"Unknown diff engine '{engine}'. Available: {', '.join(sorted(DIFF_ENGINES))}")
+        self.pages = pages
+        self.engine = engine
+        self.page_keys = _page_keys(pages)
+        self._tokens = None
+        self._matchers = {}
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = [t for key in self.page_keys for t in key]
+        return self._tokens
+
+    def _opcodes(self, name, seq_a, seq_b):
+        if self.engine != "difflib":
+            return get_opcodes(seq_a, seq_b, engine=self.engine)
+        matcher = self._matchers.get(name)
+        if matcher is None:
+            matcher = self._matchers[name] = difflib.SequenceMatcher(None, autojunk=False)
+            matcher.set_seq2(seq_a)
+        matcher.set_seq1(seq_b)
+        return swap_opcodes(matcher.get_opcodes())
+
+    def opcodes(self, seq_b):
+        """Flat word-level opcodes of the whole baseline against seq_b."""
+        return self._opcodes("tokens", self.tokens, seq_b)
+
+    def hierarchical_opcodes(self, pages_b, on_page=None):
+        page_keys_b = _page_keys(pages_b)
+        return _refine_pages(self.pages, self.page_keys, pages_b, page_keys_b,
+                             self._opcodes("pages", self.page_keys, page_keys_b), self.engine, on_page)
+
+
+def swap_opcodes(opcodes):
+    """Opcodes of (b, a) from those of (a, b)."""
+    swapped_tags = {'insert': 'delete', 'delete': 'insert'}
+    return [(swapped_tags.get(tag, tag), j1, j2, i1, i2) for tag, i1, i2, j1, j2 in opcodes]
+
+
+def normalize_opcodes(opcodes):
+    """Drop empty spans and merge neighbours into SequenceMatcher's normal form.
+
+    Stitching per-span results can leave two 'equal' runs, or two changes,
+    next to each other; difflib never emits either, and neither should we.
+    """
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if i1 == i2 and j1 == j2:
+            continue
+        if result:
+            ptag, pi1, pi2, pj1, pj2 = result[-1]
+            if ptag == 'equal' and tag == 'equal':
+                result[-1] = ('equal', pi1, i2, pj1, j2)
+                continue
+            if ptag != 'equal' and tag != 'equal':
+                if pi1 < i2 and pj1 < j2:
+                    merged = 'replace'
+                elif pi1 < i2:
+                    merged = 'delete'
+                else:
+                    merged = 'insert'
+                result[-1] = (merged, pi1, i2, pj1, j2)
+                continue
+        result.append((tag, i1, i2, j1, j2))
+    return result
+
+
+def _offsets(lengths, start=0):
+    offsets = [start]
+    for n in lengths:
+        offsets.append(offsets[-1] + n)
+    return offsets
@@ -0,0 +1,251 @@
+import logging
+
+log = logging.getLogger("matcha")
+
+# Words whose similarity (1 - edit distance / length of the longer word,
+# after OCR folding) reaches this are taken to be the same word misread.
+DEFAULT_THRESHOLD = 0.8
+
+# Characters OCR engines confuse, folded to one form before words are
+# compared: letters that look like digits ("O"/"0", "l"/"1", "S"/"5")
+# first, then sequences read as one letter ("rn"/"m", "cl"/"d", "vv"/"w";
+# written as they look after the first step).
+OCR_LOOKALIKES = str.maketrans({"o": "0", "l": "1", "i": "1", "|": "1", "s": "5"})
+OCR_CONFUSIONS = (("rn", "m"), ("c1", "d"), ("vv", "w"))
+
+# Within a replace span, old word i is only paired with new words within
+# BAND_WORDS of where the span's diagonal puts it, so aligning a span is
+# linear in its length rather than quadratic.
+BAND_WORDS = 16
+
+# Changes separated by fewer unchanged words than this are refined as one
+# span: the word-level diff often turns a misread word that also occurs
+# nearby into a delete here and an insert a few words on.
+MERGE_GAP_WORDS = 4
+
+# Spans whose band would still exceed this many cells are left as they
+# are (a whole rewritten chapter is not OCR noise).
+MAX_ALIGN_CELLS = 2000000
+
+
+def ocr_fold(text):
+    """Case-fold text and fold OCR confusions and look-alike characters to one form."""
+    text = text.casefold().translate(OCR_LOOKALIKES)
+    for confused, folded in OCR_CONFUSIONS:
+        text = text.replace(confused, folded)
+    return text
+
+
+def bounded_distance(a, b, limit):
+    """Levenshtein distance of a and b, or limit + 1 once it is known to exceed limit.
+
+    Only the diagonal band of width limit is computed, and the DP stops as
+    soon as a whole row exceeds limit.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = [min(j, over) for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [over] * (len(b) + 1)
+        current[0] = min(i, over)
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            value = min(previous[j - 1] + (char_a != b[j - 1]), previous[j] + 1, current[j - 1] + 1, over)
+            current[j] = value
+            best = min(best, value)
+        if best > limit:
+            return over
+        previous = current
+    return previous[len(b)]
+
+
+def similarity(a, b):
+    """Similarity of two words in [0, 1] after ocr_fold()."""
+    a, b = ocr_fold(a), ocr_fold(b)
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    return 1 - bounded_distance(a, b, longest) / longest
+
+
+class WordMatcher:
+    """Decides whether two token IDs are near-identical, caching by ID.
+
+    The same misread word recurs across a scanned document, so each
+    distinct pair of token IDs is compared once. Words that both contain
+    digits must also agree on their digits after folding: "2O24" is
+    "2024" misread, "2025" is a different year.
+    """
+
+    def __init__(self, strings, threshold=DEFAULT_THRESHOLD):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Fuzzy threshold must be in (0, 1], not {threshold}")
+        self.strings = strings
+        self.threshold = threshold
+        self._folded = {}
+        self._pairs = {}
+
+    def _fold(self, token_id):
+        entry = self._folded.get(token_id)
+        if entry is None:
+            text = self.strings[token_id]
+            folded = ocr_fold(text)
+            digits = "".join(c for c in folded if c.isdigit()) if any(c.isdigit() for c in text) else None
+            entry = self._folded[token_id] = (folded, digits)
+        return entry
+
+    def similar(self, token_a, token_b):
+        if token_a == token_b:
+            return True
+        key = (token_a, token_b)
+        result = self._pairs.get(key)
+        if result is None:
+            (folded_a, digits_a), (folded_b, digits_b) = self._fold(token_a), self._fold(token_b)
+            if digits_a is not None and digits_b is not None and digits_a != digits_b:
+                result = False
+            elif folded_a == folded_b:
+                result = True
+            else:
+                limit = int((1 - self.threshold) * max(len(folded_a), len(folded_b)) + 1e-9)
+                result = limit > 0 and bounded_distance(folded_a, folded_b, limit) <= limit
+            self._pairs[key] = result
+        return result
+
+
+def _band(i, m, n, band):
+    # Columns of row i: around the diagonal from (0, 0) to (m, n), wide
+    # enough that neighbouring rows always overlap.
+    return max(0, i * n // m - band), min(n, -(-(i + 1) * n // m) + band)
+
+
+def align(tokens_a, tokens_b, similar, band=BAND_WORDS):
+    """Pair words of tokens_a and tokens_b in order, maximizing the similar pairs.
+
+    A longest-common-subsequence DP where "common" means similar(a, b),
+    restricted to a band around the diagonal. Returns (i, j) index pairs.
+    """
+    m, n = len(tokens_a), len(tokens_b)
+    unreachable = -1
+    rows = [(0, [0] * (_band(0, m, n, band)[1] + 1))]
+    for i in range(1, m + 1):
+        lo, hi = _band(i, m, n, band)
+        prev_lo, prev = rows[-1]
+        prev_hi = prev_lo + len(prev) - 1
+        row = [unreachable] * (hi - lo + 1)
+        token_a = tokens_a[i - 1]
+        for j in range(lo, hi + 1):
+            if j == 0:
+                row[0] = 0
+                continue
+            value = row[j - 1 - lo] if j > lo else unreachable
+            if prev_lo <= j <= prev_hi:
+                value = max(value, prev[j - prev_lo])
+            if prev_lo <= j - 1 <= prev_hi and prev[j - 1 - prev_lo] >= 0 and similar(token_a, tokens_b[j - 1]):
+                value = max(value, prev[j - 1 - prev_lo] + 1)
+            row[j - lo] = value
+        rows.append((lo, row))
+
+    # --- Walk back from (m, n) ---
+    pairs = []
+    i, j = m, n
+    while i > 0 and j > 0:
+        lo, row = rows[i]
+        prev_lo, prev = rows[i - 1]
+        value = row[j - lo]
+        diagonal = prev[j - 1 - prev_lo] if 0 <= j - 1 - prev_lo < len(prev) else unreachable
+        if diagonal >= 0 and value == diagonal + 1 and similar(tokens_a[i - 1], tokens_b[j - 1]):
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif 0 <= j - prev_lo < len(prev) and prev[j - prev_lo] == value:
+            i -= 1
+        else:
+            j -= 1
+    pairs.reverse()
+    return pairs
+
+
+def _span_opcodes(i1, i2, j1, j2, pairs, tokens_a, tokens_b):
+    # Rebuild one replace span from its paired words: runs of identical
+    # words are 'equal', runs of near-identical ones 'fuzzy', the rest
+    # stays replace / delete / insert.
+    pieces = []
+    pos_a, pos_b = i1, j1
+    for a, b in pairs:
+        a, b = i1 + a, j1 + b
+        if a > pos_a or b > pos_b:
+            gap_tag = 'replace' if a > pos_a and b > pos_b else ('delete' if a > pos_a else 'insert')
+            pieces.append((gap_tag, pos_a, a, pos_b, b))
+        pair_tag = 'equal' if tokens_a[a] == tokens_b[b] else 'fuzzy'
+        if pieces and pieces[-1][0] == pair_tag and pieces[-1][2] == a and pieces[-1][4] == b:
+            pieces[-1] = (pair_tag, pieces[-1][1], a + 1, pieces[-1][3], b + 1)
+        else:
+            pieces.append((pair_tag, a, a + 1, b, b + 1))
+        pos_a, pos_b = a + 1, b + 1
+    if i2 > pos_a or j2 > pos_b:
+        gap_tag = 'replace' if i2 > pos_a and j2 > pos_b else ('delete' if i2 > pos_a else 'insert')
+        pieces.append((gap_tag, pos_a, i2, pos_b, j2))
+    return pieces
+
+
+def _change_regions(opcodes, gap):
+    # Runs of opcodes that start and end with a delete, insert or replace
+    # and hold nothing else but such changes and 'equal' runs shorter than
+    # gap, each opcode starting where the one before it ended on both
+    # sides; as (first, last) indices into opcodes. apply_moves() leaves
+    # gaps where moved words were taken out, and a region must not span
+    # them or the moved words would be realigned as well.
+    regions = []
+    start = last = end = None
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if start is not None and (i1, j1) != end:
+            regions.append((start, last))
+            start = None
+        if tag in ('delete', 'insert', 'replace'):
+            if start is None:
+                start = index
+            last = index
+            end = (i2, j2)
+        elif tag == 'equal' and start is not None and i2 - i1 < gap:
+            end = (i2, j2)
+        elif start is not None:
+            regions.append((start, last))
+            start = None
+    if start is not None:
+        regions.append((start, last))
+    return regions
+
+
+def refine_replaces(table_old, table_new, opcodes, threshold=DEFAULT_THRESHOLD, band=BAND_WORDS, gap=MERGE_GAP_WORDS):
+    """Split replaced text into near-identical word runs and real changes.
+
+    Each replace span (together with the deletes, inserts and replaces
+    within gap words of it) is aligned with align(), and words that a
+    WordMatcher finds near-identical become ('fuzzy', i1, i2, j1, j2)
+    opcodes, one old word per new word, which are treated as unchanged:
+    not highlighted and not counted as changes. Other opcodes, moves
+    included, are kept. Both tables need the same vocabulary. Returns the
+    new opcode list.
+    """
+    if table_new.vocab is not table_old.vocab:
+        table_new = table_new.remapped(table_old.vocab)
+    matcher = WordMatcher(table_old.vocab.strings, threshold)
+    tokens_a, tokens_b = table_old.token, table_new.token
+    result = []
+    pos = 0
+    for first, last in _change_regions(opcodes, gap):
+        i1, i2, j1, j2 = opcodes[first][1], opcodes[last][2], opcodes[first][3], opcodes[last][4]
+        m, n = i2 - i1, j2 - j1
+        if not m or not n:
+            continue
+        if n + m * (2 * band + 2) > MAX_ALIGN_CELLS:
+            log.debug("Fuzzy matching skipped a %d x %d word replace span", m, n)
+            continue
+        result.extend(opcodes[pos:first])
+        pairs = align(tokens_a[i1:i2], tokens_b[j1:j2], matcher.similar, band)
+        result.extend(_span_opcodes(i1, i2, j1, j2, pairs, tokens_a, tokens_b))
+        pos = last + 1
+    result.extend(opcodes[pos:])
+    return result
@@ -1,35 +1,80 @@
+import time
+STARTUP_TIME = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+import logging
 import os
+import sys
 import threading
 import traceback
 from datetime import datetime
 
 try:
-    import matcha
-    import matcha_reports  # Import the new reporting module
+    import matcha_client
+    import matcha_fuzzy
+    import matcha_metrics
+    import matcha_normalize
+    import matcha_progress
 except ImportError as e:
     messagebox.showerror("Import Error", f"Could not find required module: {e}. Make sure matcha.py and matcha_reports.py are in the same directory.")
     exit()
-except Exception as e:
-    messagebox.showerror("Import Error", f"An error occurred during import:\n{e}")
-    exit()
+
+log = logging.getLogger("matcha")
+
+# --- Deferred pipeline imports ---
+# matcha pulls in PyMuPDF and matcha_reports pulls in reportlab, which can
+# take seconds on slow machines. They are imported by load_pipeline() on a
+# background thread once the window is showing, not at startup.
+matcha = None
+matcha_reports = None
+
+def load_pipeline():
+    """Import the comparison modules (once; safe to call from any thread)."""
+    global matcha, matcha_reports
+    if matcha_reports is None:
+        import matcha
+        import matcha_reports
+    return matcha, matcha_reports
+
+# Share of the progress bar given to each pipeline stage.
+PROGRESS_STAGE_WEIGHTS = {"extraction": 40, "matching": 15, "visual": 10, "annotation": 30, "save": 10, "report": 5}
 
 # --- GUI Class ---
 class PdfComparatorApp:
     def __init__(self, root):
         self.root = root
         self.root.title("PDF Comparator - Matcha")
-        self.root.geometry("600x300")  # Increased height to accommodate report path
+        self.root.geometry("600x670")  # Increased height to accommodate report path, options and progress
 
         self.old_pdf_path = tk.StringVar()
         self.new_pdf_path = tk.StringVar()
         self.output_dir_path = tk.StringVar()
         self.report_dir_path = tk.StringVar()  # For the report output
+        self.hierarchical_diff = tk.BooleanVar(value=True)
+        self.visual_diff = tk.BooleanVar(value=False)
+        self.detect_moves = tk.BooleanVar(value=False)
+        self.normalization = tk.StringVar(value=matcha_normalize.DEFAULT_PROFILE)
+        self.fuzzy_matching = tk.BooleanVar(value=False)
+        self.fuzzy_threshold = tk.DoubleVar(value=matcha_fuzzy.DEFAULT_THRESHOLD)
+        self.extraction_workers = tk.IntVar(value=min(4, os.cpu_count() or 1))
+        self.highlight_granularity = tk.StringVar(value="line")
+        self.save_mode = tk.StringVar(value="optimized")
+        self.report_format = tk.StringVar(value="pdf")
+        # Blank runs comparisons in this process; a URL hands them to matcha_daemon.py.
+        self.daemon_url = tk.StringVar(value=os.environ.get("MATCHA_DAEMON_URL", ""))
         default_output = os.path.join(os.path.dirname(__file__), "pdf_comparison_output")
         default_report_output = os.path.join(os.path.dirname(__file__), "comparison_reports")
         self.output_dir_path.set(default_output)
         self.report_dir_path.set(default_report_output)
+        # Extractions are cached by file content hash so re-running against
+        # an unchanged baseline skips PyMuPDF parsing entirely.
+        self.cache_dir = os.path.join(os.path.dirname(__file__), "extraction_cache")
+        # Stage timings are logged; set MATCHA_METRICS_JSONL to also append them to a file.
+        self.metrics_jsonl = os.environ.get("MATCHA_METRICS_JSONL") or None
+        self.cancel_token = None
+        self.stage_progress = {}
+        self.last_progress_update = 0.0
 
         main_frame = ttk.Frame(root, padding="10 10 10 10")
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -63,12 +108,92 @@ class PdfComparatorApp:
         self.browse_report_button = ttk.Button(main_frame, text="Select...", command=self.select_report_dir)
         self.browse_report_button.grid(row=3, column=2, sticky=tk.E, padx=5, pady=5)
 
-        # --- Comparison Button and Status ---
-        self.compare_button = ttk.Button(main_frame, text="Compare PDFs & Generate Report", command=self.start_comparison_thread)
-        self.compare_button.grid(row=4, column=0, columnspan=3, pady=15)
+        # --- Comparison Options ---
+        options_frame = ttk.LabelFrame(main_frame, text="Options", padding="5 5 5 5")
+        options_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E), padx=5, pady=5)
+        self.hierarchical_check = ttk.Checkbutton(options_frame, text="Page-anchored diff (only word-diff changed pages)", variable=self.hierarchical_diff)
+        self.hierarchical_check.grid(row=0, column=0, columnspan=2, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Extraction workers:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=2)
+        self.workers_spinbox = ttk.Spinbox(options_frame, from_=1, to=os.cpu_count() or 1, width=5, textvariable=self.extraction_workers)
+        self.workers_spinbox.grid(row=1, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Highlight merging:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=2)
+        # Choices are filled in by pipeline_ready() once matcha is imported.
+        self.granularity_combo = ttk.Combobox(options_frame, textvariable=self.highlight_granularity, state=tk.DISABLED, width=8)
+        self.granularity_combo.grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Save mode:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
+        self.save_mode_combo = ttk.Combobox(options_frame, textvariable=self.save_mode, state=tk.DISABLED, width=12)
+        self.save_mode_combo.grid(row=3, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Report format:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=2)
+        self.report_format_combo = ttk.Combobox(options_frame, textvariable=self.report_format, state=tk.DISABLED, width=8)
+        self.report_format_combo.grid(row=4, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Daemon URL (optional):").grid(row=5, column=0, sticky=tk.W, padx=5, pady=2)
+        self.daemon_url_entry = ttk.Entry(options_frame, textvariable=self.daemon_url, width=30)
+        self.daemon_url_entry.grid(row=5, column=1, sticky=tk.W, padx=5, pady=2)
+        self.visual_check = ttk.Checkbutton(options_frame, text="Visual diff (also frame changed images and graphics)", variable=self.visual_diff)
+        self.visual_check.grid(row=6, column=0, columnspan=2, sticky=tk.W, padx=5, pady=2)
+        self.moves_check = ttk.Checkbutton(options_frame, text="Detect moved text (highlighted in blue)", variable=self.detect_moves)
+        self.moves_check.grid(row=7, column=0, columnspan=2, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Normalize words:").grid(row=8, column=0, sticky=tk.W, padx=5, pady=2)
+        self.normalization_combo = ttk.Combobox(options_frame, textvariable=self.normalization, values=list(matcha_normalize.PROFILES),
+                                                state="readonly", width=12)
+        self.normalization_combo.grid(row=8, column=1, sticky=tk.W, padx=5, pady=2)
+        self.fuzzy_check = ttk.Checkbutton(options_frame, text="OCR-tolerant matching, similarity at least:", variable=self.fuzzy_matching)
+        self.fuzzy_check.grid(row=9, column=0, sticky=tk.W, padx=5, pady=2)
+        self.fuzzy_spinbox = ttk.Spinbox(options_frame, from_=0.5, to=1.0, increment=0.05, width=5, textvariable=self.fuzzy_threshold)
+        self.fuzzy_spinbox.grid(row=9, column=1, sticky=tk.W, padx=5, pady=2)
+
+        # --- Comparison Buttons, Progress and Status ---
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=5, column=0, columnspan=3, pady=15)
+        self.compare_button = ttk.Button(button_frame, text="Compare PDFs & Generate Report", command=self.start_comparison_thread)
+        self.compare_button.grid(row=0, column=0, padx=5)
+        self.baseline_button = ttk.Button(button_frame, text="Compare Old PDF with Many Revisions...", command=self.start_baseline_thread)
+        self.baseline_button.grid(row=0, column=1, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_comparison, state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=2, padx=5)
+
+        self.progress_bar = ttk.Progressbar(main_frame, orient=tk.HORIZONTAL, mode="determinate", maximum=100)
+        self.progress_bar.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E), padx=5, pady=5)
 
         self.status_label = ttk.Label(main_frame, text="Status: Ready", anchor=tk.W, wraplength=550)
-        self.status_label.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E), padx=5, pady=5)
+        self.status_label.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E), padx=5, pady=5)
+
+    # --- Startup ---
+
+    def start_warmup(self, on_ready=None):
+        """Import the pipeline in the background now that the window is up."""
+        self.startup_timings = {"window": time.perf_counter() - STARTUP_TIME}
+        log.info("Window shown %.2fs after start", self.startup_timings["window"])
+        self.update_status("Loading PDF engine...")
+
+        def warm_up():
+            try:
+                load_pipeline()
+                error = None
+            except Exception as e:
+                error = e
+            self.root.after(0, self.pipeline_ready, error, on_ready)
+
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    def pipeline_ready(self, error, on_ready=None):
+        self.startup_timings["pipeline"] = time.perf_counter() - STARTUP_TIME
+        if error is not None:
+            self.update_status(f"Could not load the comparison modules: {error}")
+            messagebox.showerror("Import Error", f"Could not load the comparison modules:\n{error}")
+            self.compare_button.config(state=tk.DISABLED)
+        else:
+            log.info("PDF engine ready %.2fs after start", self.startup_timings["pipeline"])
+            self.granularity_combo.config(values=matcha.HIGHLIGHT_GRANULARITIES)
+            self.save_mode_combo.config(values=matcha.SAVE_MODES)
+            self.report_format_combo.config(values=list(matcha_reports.REPORT_BACKENDS))
+            if self.cancel_token is None:
+                self.granularity_combo.config(state="readonly")
+                self.save_mode_combo.config(state="readonly")
+                self.report_format_combo.config(state="readonly")
+                self.update_status("Ready")
+        if on_ready is not None:
+            on_ready()
 
     def select_old_pdf(self):
         file_path = filedialog.askopenfilename(
@@ -115,7 +240,20 @@ class PdfComparatorApp:
         self.browse_new_button.config(state=state)
         self.browse_output_button.config(state=state)
         self.browse_report_button.config(state=state)
+        self.hierarchical_check.config(state=state)
+        self.visual_check.config(state=state)
+        self.moves_check.config(state=state)
+        self.fuzzy_check.config(state=state)
+        self.fuzzy_spinbox.config(state=state)
+        self.workers_spinbox.config(state=state)
+        self.granularity_combo.config(state="readonly" if enabled else tk.DISABLED)
+        self.save_mode_combo.config(state="readonly" if enabled else tk.DISABLED)
+        self.report_format_combo.config(state="readonly" if enabled else tk.DISABLED)
+        self.normalization_combo.config(state="readonly" if enabled else tk.DISABLED)
+        self.daemon_url_entry.config(state=state)
         self.compare_button.config(state=state)
+        self.baseline_button.config(state=state)
+        self.cancel_button.config(state=tk.DISABLED if enabled else tk.NORMAL)
 
     def start_comparison_thread(self):
         old_pdf = self.old_pdf_path.get()
@@ -135,38 +273,194 @@ class PdfComparatorApp:
         if not report_dir:
             messagebox.showerror("Error", "Output directory for comparison report not selected.")
             return
+        try:
+            workers = max(1, self.extraction_workers.get())
+        except tk.TclError:
+            messagebox.showerror("Error", "Extraction workers must be a whole number.")
+            return
+        fuzzy_threshold = None
+        if self.fuzzy_matching.get():
+            try:
+                fuzzy_threshold = self.fuzzy_threshold.get()
+            except tk.TclError:
+                fuzzy_threshold = -1
+            if not 0 < fuzzy_threshold <= 1:
+                messagebox.showerror("Error", "The OCR similarity threshold must be a number between 0 and 1.")
+                return
 
         self.set_ui_state(False)
-        self.update_status("Starting comparison and report generation... This may take a moment.")
+        self.update_status("Starting comparison and report generation...")
+        self.cancel_token = matcha_progress.CancelToken()
+        # Stages that won't run count as done, so the bar still reaches the end.
+        self.stage_progress = {} if self.visual_diff.get() else {"visual": 1.0}
+        self.progress_bar.config(value=0)
 
         comparison_thread = threading.Thread(
             target=self.run_comparison_worker,
-            args=(old_pdf, new_pdf, output_dir, report_dir),
+            args=(old_pdf, new_pdf, output_dir, report_dir, self.hierarchical_diff.get(), workers, self.highlight_granularity.get(), self.save_mode.get(), self.report_format.get(), self.visual_diff.get(), self.detect_moves.get(), self.normalization.get(), fuzzy_threshold, self.cancel_token, self.daemon_url.get().strip()),
             daemon=True
         )
         comparison_thread.start()
 
-    def run_comparison_worker(self, old_pdf, new_pdf, output_dir, report_dir):
+    def start_baseline_thread(self):
+        old_pdf = self.old_pdf_path.get()
+        output_dir = self.output_dir_path.get()
+        if not old_pdf or not os.path.exists(old_pdf):
+            messagebox.showerror("Error", "Select the baseline as the Old PDF first.")
+            return
+        if not output_dir:
+            messagebox.showerror("Error", "Output directory for annotated PDFs not selected.")
+            return
+        try:
+            jobs = max(1, self.extraction_workers.get())
+        except tk.TclError:
+            messagebox.showerror("Error", "Extraction workers must be a whole number.")
+            return
+        revisions = filedialog.askopenfilenames(
+            title="Select Revisions to Compare with the Old PDF",
+            filetypes=[("PDF Files", "*.pdf"), ("All Files", "*.*")]
+        )
+        if not revisions:
+            return
+        # Baseline runs only highlight word changes; say so rather than drop these silently.
+        unsupported = [name for name, selected in (("visual comparison", self.visual_diff.get()),
+                                                   ("moved text", self.detect_moves.get()),
+                                                   ("text normalization", self.normalization.get() != "exact"),
+                                                   ("OCR-tolerant matching", self.fuzzy_matching.get())) if selected]
+        if unsupported and not messagebox.askokcancel(
+                "Baseline comparison",
+                f"Comparing with a baseline does not support {', '.join(unsupported)}; these options will be ignored."):
+            return
+
+        self.set_ui_state(False)
+        self.update_status(f"Comparing {len(revisions)} revisions with the baseline...")
+        self.cancel_token = matcha_progress.CancelToken()
+        self.stage_progress = {}
+        self.progress_bar.config(value=0)
+        threading.Thread(
+            target=self.run_baseline_worker,
+            args=(old_pdf, list(revisions), output_dir, self.hierarchical_diff.get(), jobs, self.highlight_granularity.get(), self.save_mode.get(), self.report_format.get(), self.cancel_token),
+            daemon=True
+        ).start()
+
+    def run_baseline_worker(self, old_pdf, revisions, output_dir, hierarchical, jobs, granularity, save_mode, report_format, cancel_token):
+        start_time = datetime.now()
+        try:
+            load_pipeline()
+            import matcha_baseline
+            summary = matcha_baseline.compare_baseline(old_pdf, revisions, output_folder=output_dir, jobs=jobs, cache_dir=self.cache_dir,
+                                                       hierarchical=hierarchical, granularity=granularity, save_mode=save_mode,
+                                                       report=True, report_format=report_format,
+                                                       progress=self.report_progress, cancel=cancel_token)
+            top = [entry for entry in summary["revisions"] if entry["status"] == "ok"][:3]
+            most_changed = ", ".join(f"{os.path.basename(entry['revision'])} ({entry['deviation']:.1%})" for entry in top)
+            failed = f", {summary['failed']} failed" if summary["failed"] else ""
+            self.root.after(0, self.comparison_finished, f"Compared {len(revisions)} revisions in {datetime.now() - start_time}{failed}. Most changed: {most_changed or 'none'}. Summary saved to '{summary['summary_json']}'")
+
+        except matcha_progress.ComparisonCancelled:
+            self.root.after(0, self.comparison_cancelled)
+
+        except Exception as e:
+            logging.getLogger("matcha").error(traceback.format_exc())
+            self.root.after(0, self.comparison_failed, f"Error during baseline comparison: {e}")
+
+    def cancel_comparison(self):
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.update_status("Cancelling after the current page...")
+
+    def report_progress(self, stage, done, total):
+        # Runs on the worker thread: throttle, then hand the update to the Tk thread.
+        now = time.monotonic()
+        if done < total and now - self.last_progress_update < 0.1:
+            return
+        self.last_progress_update = now
+        self.root.after(0, self.update_progress, stage, done, total)
+
+    def update_progress(self, stage, done, total):
+        if self.cancel_token is None or self.cancel_token.cancelled:
+            return
+        self.stage_progress[stage] = done / total if total else 1.0
+        if "revisions" in self.stage_progress:
+            # Baseline runs: the bar counts revisions, the stages of each one only show in the status.
+            if stage == "revisions":
+                self.progress_bar.config(value=self.stage_progress[stage] * 100)
+        else:
+            overall = sum(PROGRESS_STAGE_WEIGHTS.get(name, 0) * fraction for name, fraction in self.stage_progress.items())
+            self.progress_bar.config(value=overall * 100 / sum(PROGRESS_STAGE_WEIGHTS.values()))
+        self.update_status(f"{stage.capitalize()}: {done}/{total}")
+
+    def run_on_daemon(self, daemon_url, old_pdf, new_pdf, output_dir, report_dir, hierarchical, granularity, save_mode, report_format, visual, detect_moves, normalization, fuzzy_threshold, cancel_token):
+        """Run the comparison on a matcha daemon, relaying its progress; returns the status message."""
+        start_time = datetime.now()
+        client = matcha_client.DaemonClient(daemon_url)
+        job = client.submit(old_pdf, new_pdf, output_dir, report_dir=report_dir, hierarchical=hierarchical,
+                            granularity=granularity, save_mode=save_mode, report_format=report_format, visual=visual,
+                            detect_moves=detect_moves, normalization=normalization, fuzzy_threshold=fuzzy_threshold)
+        job = client.wait(job["id"], progress=self.report_progress, cancel=cancel_token)
+        if job["status"] == "cancelled":
+            raise matcha_progress.ComparisonCancelled("Comparison cancelled")
+        if job["status"] == "failed":
+            raise matcha_client.DaemonError(job["error"])
+        slowest, slowest_seconds = max(job["stages"].items(), key=lambda item: item[1])
+        return (f"Comparison and report generation finished on the daemon in {datetime.now() - start_time} "
+                f"(slowest stage: {slowest}, {slowest_seconds:.2f}s). Annotated PDFs saved to '{output_dir}', report saved to '{report_dir}'")
+
+    def run_comparison_worker(self, old_pdf, new_pdf, output_dir, report_dir, hierarchical, workers, granularity, save_mode, report_format, visual, detect_moves, normalization, fuzzy_threshold, cancel_token, daemon_url=""):
         start_time = datetime.now()
+        sinks = [matcha_metrics.LoggingSink()]
+        if self.metrics_jsonl:
+            sinks.append(matcha_metrics.JsonLinesSink(self.metrics_jsonl))
+        metrics = matcha_metrics.Metrics(job_name=os.path.basename(new_pdf), sinks=sinks)
         try:
-            matcha.create_annotated_pdfs(old_pdf, new_pdf, output_folder=output_dir)
-            matcha_reports.generate_comparison_report(old_pdf, new_pdf, output_folder=report_dir)
+            if daemon_url:
+                message = self.run_on_daemon(daemon_url, old_pdf, new_pdf, output_dir, report_dir, hierarchical, granularity, save_mode, report_format, visual, detect_moves, normalization, fuzzy_threshold, cancel_token)
+                self.root.after(0, self.comparison_finished, message)
+                return
+            # Normally already imported by the startup warm-up; waits for it if not.
+            matcha, matcha_reports = load_pipeline()
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            with metrics.job():
+                result = matcha.compare_pdfs(old_pdf, new_pdf, cache_dir=self.cache_dir, hierarchical=hierarchical, workers=workers,
+                                             progress=self.report_progress, cancel=cancel_token, detect_moves=detect_moves,
+                                             normalization=normalization, fuzzy_threshold=fuzzy_threshold)
+                save_stats = matcha.create_annotated_pdfs(old_pdf, new_pdf, output_folder=output_dir, result=result, granularity=granularity, save_mode=save_mode,
+                                                          progress=self.report_progress, cancel=cancel_token, visual=visual)
+                matcha_reports.generate_comparison_report(old_pdf, new_pdf, output_folder=report_dir, result=result,
+                                                          progress=self.report_progress, cancel=cancel_token, report_format=report_format)
             end_time = datetime.now()
             duration = end_time - start_time
-            self.root.after(0, self.comparison_finished, f"Comparison and report generation finished successfully in {duration}. Annotated PDFs saved to '{output_dir}', report saved to '{report_dir}'")
+            save_seconds = save_stats["old"]["save_seconds"] + save_stats["new"]["save_seconds"]
+            save_bytes = save_stats["old"]["bytes"] + save_stats["new"]["bytes"]
+            slowest, slowest_seconds = metrics.slowest_stage()
+            self.root.after(0, self.comparison_finished, f"Comparison and report generation finished successfully in {duration} (slowest stage: {slowest}, {slowest_seconds:.2f}s). Annotated PDFs saved to '{output_dir}' ({save_mode} save: {save_seconds:.2f}s, {save_bytes / 1024:.0f} KB), report saved to '{report_dir}'")
+
+        except matcha_progress.ComparisonCancelled:
+            self.root.after(0, self.comparison_cancelled)
 
         except Exception as e:
             tb_str = traceback.format_exc()
             error_message = f"An error occurred during comparison or report generation: {e}\n\n{tb_str}"
-            print(error_message)
+            logging.getLogger("matcha").error(error_message)
             self.root.after(0, self.comparison_failed, f"Error during comparison or report generation: {e}")
 
     def comparison_finished(self, message):
+        self.cancel_token = None
+        self.progress_bar.config(value=100)
         self.update_status(message)
         self.set_ui_state(True)
         messagebox.showinfo("Success", "PDF comparison and report generation completed successfully!")
 
+    def comparison_cancelled(self):
+        self.cancel_token = None
+        self.progress_bar.config(value=0)
+        self.update_status("Comparison cancelled.")
+        self.set_ui_state(True)
+
     def comparison_failed(self, error_message):
+        self.cancel_token = None
         self.update_status(error_message)
         self.set_ui_state(True)
         messagebox.showerror("Comparison Failed", error_message)
@@ -174,6 +468,16 @@ class PdfComparatorApp:
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     root = tk.Tk()
     app = PdfComparatorApp(root)
+    root.update()  # Paint the window before the heavy imports start.
+    if "--measure-startup" in sys.argv:
+        # Print the startup timings and exit, e.g. to compare machines or releases.
+        def report_startup():
+            print(f"window_seconds={app.startup_timings['window']:.3f} pipeline_seconds={app.startup_timings['pipeline']:.3f}")
+            root.destroy()
+        app.start_warmup(on_ready=report_startup)
+    else:
+        app.start_warmup()
     root.mainloop()
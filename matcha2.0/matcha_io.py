@@ -0,0 +1,126 @@
+import hashlib
+import mmap
+import os
+
+import fitz
+
+import matcha_cache
+
+
+class PdfInput:
+    """One input PDF, given as a path, a bytes-like object or a binary file object.
+
+    The document is opened on first use and then shared by every stage of a
+    comparison (page count, extraction, visual diff, annotation) instead of
+    each stage opening it again. In-memory PDFs are handed to PyMuPDF with
+    fitz.open(stream=...) and never written to disk; with use_mmap a path
+    is memory-mapped rather than read. name is what output files are named
+    after; it defaults to the file's base name.
+
+    Close it (or use it as a context manager) to release the document and
+    any mapping; an annotated (and therefore closed) document is reopened
+    on the next use.
+    """
+
+    def __init__(self, source, name=None, use_mmap=False):
+        self.path = None
+        self._data = None
+        self._mmap = None
+        self._doc = None
+        self._digest = None
+        if isinstance(source, (str, os.PathLike)):
+            self.path = os.fspath(source)
+            if use_mmap:
+                with open(self.path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data = memoryview(self._mmap)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._data = source
+        elif hasattr(source, "getvalue"):
+            # BytesIO: getvalue() shares the buffer until the BytesIO is written to.
+            self._data = source.getvalue()
+        elif hasattr(source, "read"):
+            self._data = source.read()
+        else:
+            raise TypeError(f"Expected a path, bytes or a binary file object, not {type(source).__name__}")
+        if name is None:
+            name = self.path or getattr(source, "name", None)
+            name = os.path.basename(name) if isinstance(name, str) else "document.pdf"
+        self.name = name
+
+    @property
+    def in_memory(self):
+        return self.path is None
+
+    def document(self):
+        """The open fitz document, opened on the first call."""
+        if self._doc is None or self._doc.is_closed:
+            if self._data is not None:
+                self._doc = fitz.open(stream=self._data, filetype="pdf")
+            else:
+                self._doc = fitz.open(self.path)
+        return self._doc
+
+    def worker_source(self):
+        """What to send to an extraction worker process: the path, or a copy of the bytes."""
+        return self.path if self.path is not None else bytes(self._data)
+
+    def digest(self):
+        """SHA-256 of the PDF's bytes, as used to key the extraction caches."""
+        if self._digest is None:
+            if self._data is not None:
+                self._digest = hashlib.sha256(self._data).hexdigest()
+            else:
+                self._digest = matcha_cache.file_digest(self.path)
+        return self._digest
+
+    def write_copy(self, output_path):
+        """Write the unmodified PDF to output_path (for incremental saves)."""
+        if self._data is not None:
+            with open(output_path, "wb") as f:
+                f.write(self._data)
+        elif os.path.abspath(self.path) != os.path.abspath(output_path):
+            with open(self.path, "rb") as src, open(output_path, "wb") as dst:
+                for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                    dst.write(chunk)
+
+    def close(self):
+        if self._doc is not None and not self._doc.is_closed:
+            self._doc.close()
+        self._doc = None
+        if self._mmap is not None:
+            self._data.release()
+            self._data = None
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f"PdfInput({self.path or self.name!r})"
+
+
+def as_input(source, use_mmap=False):
+    """Wrap a path, bytes or file object in a PdfInput; PdfInputs are returned as they are."""
+    return source if isinstance(source, PdfInput) else PdfInput(source, use_mmap=use_mmap)
+
+
+def open_source(source):
+    """Open a path or PDF bytes as a fitz document (see PdfInput.worker_source())."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def source_name(source):
+    """Base name to use for outputs derived from a path, PdfInput or in-memory PDF."""
+    if isinstance(source, PdfInput):
+        return source.name
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(os.fspath(source))
+    name = getattr(source, "name", None)
+    return os.path.basename(name) if isinstance(name, str) else "document.pdf"
@@ -0,0 +1,222 @@
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+log = logging.getLogger("matcha")
+
+_current = contextvars.ContextVar("matcha_metrics", default=None)
+
+
+def current():
+    """The Metrics of the job running in this context (a detached one if none is)."""
+    metrics = _current.get()
+    if metrics is None:
+        metrics = Metrics()
+        _current.set(metrics)
+    return metrics
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Only the lifetime peak is available here; kilobytes on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """Stage timers, counters and memory peaks for one comparison job.
+
+    Pipeline code reports into whatever current() returns; a job becomes
+    current inside `with metrics.job():`, which also starts the memory
+    sampler and the optional cProfile / tracemalloc capture, and hands the
+    collected record to every sink when the job ends.
+    """
+
+    def __init__(self, job_name="comparison", sinks=(), sample_interval=0.1, profile_path=None, trace_malloc=False):
+        self.job_name = job_name
+        self.sinks = list(sinks)
+        self.sample_interval = sample_interval
+        self.profile_path = profile_path
+        self.trace_malloc = trace_malloc
+        self.stages = {}
+        self.counters = {}
+        self.stage_peak_rss = {}
+        self.peak_rss = None
+        self.peak_traced = None
+        self.wall_seconds = None
+        self._open_stages = []
+        self._lock = threading.Lock()
+        self._stop_sampling = threading.Event()
+
+    # --- Recording ---
+
+    @contextmanager
+    def stage(self, name):
+        log.info("%s: %s...", self.job_name, name)
+        with self._lock:
+            self._open_stages.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._sample()
+            with self._lock:
+                self._open_stages.remove(name)
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            log.debug("%s: %s took %.3fs", self.job_name, name, elapsed)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is None:
+            return
+        with self._lock:
+            self.peak_rss = max(rss, self.peak_rss or 0)
+            for name in self._open_stages:
+                self.stage_peak_rss[name] = max(rss, self.stage_peak_rss.get(name, 0))
+
+    def _sample_loop(self):
+        while not self._stop_sampling.wait(self.sample_interval):
+            self._sample()
+
+    # --- Job lifecycle ---
+
+    @contextmanager
+    def job(self):
+        token = _current.set(self)
+        sampler = threading.Thread(target=self._sample_loop, name="matcha-memory-sampler", daemon=True)
+        profiler = cProfile.Profile() if self.profile_path else None
+        if self.trace_malloc:
+            tracemalloc.start()
+        sampler.start()
+        if profiler:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall_seconds = time.perf_counter() - start
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(self.profile_path)
+            self._stop_sampling.set()
+            sampler.join()
+            self._sample()
+            if self.trace_malloc:
+                self.peak_traced = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            _current.reset(token)
+            self.emit()
+
+    def record(self):
+        return {
+            "job": self.job_name,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "wall_seconds": self.wall_seconds,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+            "peak_rss_bytes": self.peak_rss,
+            "stage_peak_rss_bytes": dict(self.stage_peak_rss),
+            "peak_traced_bytes": self.peak_traced,
+            "profile": self.profile_path,
+        }
+
+    def slowest_stage(self):
+        return max(self.stages.items(), key=lambda item: item[1]) if self.stages else None
+
+    def emit(self):
+        record = self.record()
+        for sink in self.sinks:
+            try:
+                sink.write(record)
+            except OSError as e:
+                log.warning("Could not write metrics to %s: %s", sink, e)
+
+
+# --- Sinks ---
+
+class LoggingSink:
+    def __init__(self, logger=log, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def write(self, record):
+        stages = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in record["stages"].items())
+        counters = ", ".join(f"{name}={value}" for name, value in record["counters"].items())
+        peak = f"{record['peak_rss_bytes'] / 2**20:.1f} MiB" if record["peak_rss_bytes"] else "n/a"
+        self.logger.log(self.level, "%s finished in %.3fs [%s] (%s) peak RSS %s",
+                        record["job"], record["wall_seconds"] or 0.0, stages, counters, peak)
+
+
+class JsonLinesSink:
+    """Appends one JSON object per job; safe to share between worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, record):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def __repr__(self):
+        return f"JsonLinesSink({self.path!r})"
+
+
+class PrometheusTextSink:
+    """Writes the last job's metrics in the Prometheus text exposition format.
+
+    Meant for node_exporter's textfile collector: the file is replaced
+    atomically so a scrape never sees it half written.
+    """
+
+    def __init__(self, path, prefix="matcha"):
+        self.path = path
+        self.prefix = prefix
+
+    def write(self, record):
+        job = record["job"].replace("\\", "\\\\").replace('"', '\\"')
+        lines = [f"# TYPE {self.prefix}_stage_seconds gauge"]
+        for name, seconds in record["stages"].items():
+            lines.append(f'{self.prefix}_stage_seconds{{job="{job}",stage="{_metric_name(name)}"}} {seconds:.6f}')
+        for name, value in record["counters"].items():
+            metric = f"{self.prefix}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f'{metric}{{job="{job}"}} {value}')
+        if record["wall_seconds"] is not None:
+            lines.append(f"# TYPE {self.prefix}_job_seconds gauge")
+            lines.append(f'{self.prefix}_job_seconds{{job="{job}"}} {record["wall_seconds"]:.6f}')
+        if record["peak_rss_bytes"]:
+            lines.append(f"# TYPE {self.prefix}_peak_rss_bytes gauge")
+            lines.append(f'{self.prefix}_peak_rss_bytes{{job="{job}"}} {record["peak_rss_bytes"]}')
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def __repr__(self):
+        return f"PrometheusTextSink({self.path!r})"
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
@@ -0,0 +1,114 @@
+from itertools import zip_longest
+
+# Moves are seeded from runs of SHINGLE_WORDS identical words and kept
+# once they extend to MIN_MOVE_WORDS; shorter coincidences ("of the
+# agreement shall") are left as ordinary changes.
+SHINGLE_WORDS = 6
+MIN_MOVE_WORDS = 12
+
+# Candidate positions looked at per shingle. Boilerplate shingles can occur
+# hundreds of times; beyond this many, the first ones are as good as any.
+MAX_SEED_CANDIDATES = 32
+
+
+def find_moves(tokens_a, spans_a, tokens_b, spans_b, shingle=SHINGLE_WORDS, min_words=MIN_MOVE_WORDS):
+    """Find runs of words removed from spans_a and inserted in spans_b.
+
+    spans_a / spans_b are (start, stop) ranges of tokens_a / tokens_b, e.g.
+    the deleted and inserted sides of a diff. Every shingle of spans_a is
+    indexed once; spans_b is then scanned left to right, each shingle hit is
+    extended as far as both sides agree, and the longest extension is taken
+    if it reaches min_words. Linear in the number of changed words, apart
+    from the MAX_SEED_CANDIDATES bound per shingle. Returns (i, j, size)
+    triples, each word of either side used at most once.
+    """
+    index = {}
+    for start, stop in spans_a:
+        for i in range(start, stop - shingle + 1):
+            index.setdefault(tuple(tokens_a[i:i + shingle]), []).append((i, stop))
+
+    used_a = bytearray(len(tokens_a))
+    moves = []
+    for start, stop in spans_b:
+        j = start
+        while j <= stop - shingle:
+            best_i, best_size = None, 0
+            for i, stop_a in index.get(tuple(tokens_b[j:j + shingle]), ())[:MAX_SEED_CANDIDATES]:
+                if used_a[i]:
+                    continue
+                size = 0
+                while i + size < stop_a and j + size < stop and tokens_a[i + size] == tokens_b[j + size] and not used_a[i + size]:
+                    size += 1
+                if size > best_size:
+                    best_i, best_size = i, size
+            if best_size >= min_words:
+                used_a[best_i:best_i + best_size] = b"\1" * best_size
+                moves.append((best_i, j, best_size))
+                j += best_size
+            else:
+                j += 1
+    return moves
+
+
+def _subtract(start, stop, ranges):
+    # Parts of [start, stop) not covered by the sorted, disjoint ranges.
+    parts = []
+    for r1, r2 in ranges:
+        if r2 <= start or r1 >= stop:
+            continue
+        if r1 > start:
+            parts.append((start, r1))
+        start = max(start, r2)
+    if start < stop:
+        parts.append((start, stop))
+    return parts
+
+
+def apply_moves(opcodes, moves):
+    """Rewrite opcodes so the words of each move get a ('move', i1, i2, j1, j2) opcode.
+
+    A move is listed where its words were in the old document, so i stays
+    ascending throughout; j is ascending over all other opcodes, while a
+    move's j points to where the words went. What is left of a changed
+    span around moved words stays a replace (pieces paired in order), a
+    delete or an insert.
+    """
+    if not moves:
+        return list(opcodes)
+    moved_a = sorted((i, i + size) for i, j, size in moves)
+    moved_b = sorted((j, j + size) for i, j, size in moves)
+    move_at = {i: j for i, j, size in moves}
+
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            result.append((tag, i1, i2, j1, j2))
+            continue
+        rest_a = _subtract(i1, i2, moved_a)
+        rest_b = _subtract(j1, j2, moved_b)
+        if rest_a == ([(i1, i2)] if i2 > i1 else []) and rest_b == ([(j1, j2)] if j2 > j1 else []):
+            result.append((tag, i1, i2, j1, j2))
+            continue
+        pieces = []
+        pos_a, pos_b = i1, j1
+        for part_a, part_b in zip_longest(rest_a, rest_b):
+            a1, a2 = part_a if part_a else (pos_a, pos_a)
+            b1, b2 = part_b if part_b else (pos_b, pos_b)
+            piece_tag = 'replace' if part_a and part_b else ('delete' if part_a else 'insert')
+            pieces.append((piece_tag, a1, a2, b1, b2))
+            pos_a, pos_b = a2, b2
+        pieces.extend(('move', a1, a2, move_at[a1], move_at[a1] + (a2 - a1))
+                      for a1, a2 in moved_a if i1 <= a1 < i2)
+        # Stable sort: pieces keep their order, moves slot in by old position.
+        result.extend(sorted(pieces, key=lambda op: op[1]))
+    return result
+
+
+def detect_moves(table_old, table_new, opcodes, shingle=SHINGLE_WORDS, min_words=MIN_MOVE_WORDS):
+    """Return opcodes with text moved between changed spans turned into 'move' opcodes."""
+    if table_new.vocab is not table_old.vocab:
+        table_new = table_new.remapped(table_old.vocab)
+    spans_old = [(i1, i2) for tag, i1, i2, j1, j2 in opcodes if tag in ('delete', 'replace')]
+    spans_new = [(j1, j2) for tag, i1, i2, j1, j2 in opcodes if tag in ('insert', 'replace')]
+    moves = find_moves(table_old.token, spans_old, table_new.token, spans_new, shingle=shingle, min_words=min_words)
+    return apply_moves(opcodes, moves)
@@ -0,0 +1,161 @@
+import re
+import unicodedata
+from array import array
+
+from matcha_words import Vocabulary, WordTable
+
+# Normalization profiles, selectable per comparison. Each is a set of the
+# steps below; "exact" compares the extracted words as they are.
+#   nfkc        Unicode NFKC: ligatures (ﬁ -> fi), full-width forms, ...
+#   casefold    ignore case
+#   dehyphenate drop soft hyphens and join words hyphenated at a line end
+#   punctuation ignore punctuation; words that are nothing else are dropped
+#   numbers     mask digit runs, so "page 12" matches "page 13"
+PROFILES = {
+    "exact": frozenset(),
+    "text": frozenset({"nfkc", "casefold", "dehyphenate"}),
+    "punctuation": frozenset({"nfkc", "casefold", "dehyphenate", "punctuation"}),
+    "loose": frozenset({"nfkc", "casefold", "dehyphenate", "punctuation", "numbers"}),
+}
+
+DEFAULT_PROFILE = "exact"
+
+_SOFT_HYPHEN = "\u00ad"
+_LINE_END_HYPHENS = ("-", "\u2010", _SOFT_HYPHEN)
+_DIGITS = re.compile(r"\d+")
+
+
+class NormalizedTable:
+    """The matching view of a WordTable after normalization.
+
+    One entry per normalized token, which can stand for several words (a
+    word hyphenated across a line break) or swallow words dropped by the
+    profile (a lone dash); token, block and page_starts are laid out as in
+    WordTable, so page_blocks() and the diff engines work unchanged.
+    source_rows[k] is the first row of the table behind token k, and
+    source_rows[len(self)] its end. Use to_rows() to turn opcodes over
+    tokens into opcodes over the table's rows.
+    """
+
+    def __init__(self, vocab, token, block, page_starts, source_rows):
+        self.vocab = vocab
+        self.token = token
+        self.block = block
+        self.page_starts = page_starts
+        self.source_rows = source_rows
+
+    def __len__(self):
+        return len(self.token)
+
+    @property
+    def page_count(self):
+        return len(self.page_starts) - 1
+
+    page_blocks = WordTable.page_blocks
+
+
+class Normalizer:
+    """Normalizes WordTables with one profile into a shared vocabulary.
+
+    Normalizing is a function of the word, so each distinct string of the
+    source vocabulary is normalized once and the result cached as a token
+    ID; a table is then mapped through that list. Only line-end
+    hyphenation looks at neighbouring words. Tables normalized by the same
+    Normalizer are comparable as plain integers.
+    """
+
+    def __init__(self, profile=DEFAULT_PROFILE, vocab=None):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown normalization profile '{profile}'. Available: {', '.join(PROFILES)}")
+        self.profile = profile
+        self.steps = PROFILES[profile]
+        self.vocab = vocab if vocab is not None else Vocabulary()
+        self._source_vocab = None
+        self._token_map = []
+
+    def normalize_text(self, text):
+        """Normalized form of one word; empty if the profile drops it."""
+        steps = self.steps
+        if "nfkc" in steps:
+            text = unicodedata.normalize("NFKC", text)
+        if "dehyphenate" in steps:
+            text = text.replace(_SOFT_HYPHEN, "")
+        if "casefold" in steps:
+            text = text.casefold()
+        if "punctuation" in steps:
+            text = "".join(c for c in text if not unicodedata.category(c).startswith("P"))
+        if "numbers" in steps:
+            text = _DIGITS.sub("#", text)
+        return text
+
+    def _map_for(self, vocab):
+        # Source token ID -> normalized token ID (-1: dropped). Vocabularies
+        # only ever grow, so the map is extended rather than rebuilt.
+        if vocab is not self._source_vocab:
+            self._source_vocab = vocab
+            self._token_map = []
+        token_map = self._token_map
+        intern = self.vocab.intern
+        for text in vocab.strings[len(token_map):]:
+            text = self.normalize_text(text)
+            token_map.append(intern(text) if text else -1)
+        return token_map
+
+    def table(self, table):
+        """Return the NormalizedTable of a WordTable (or a page view of one)."""
+        token_map = self._map_for(table.vocab)
+        tokens = array('i', (token_map[t] for t in table.token))
+        if "dehyphenate" not in self.steps and (not tokens or min(tokens) >= 0):
+            # One token per word: the table's own layout applies as it is.
+            return NormalizedTable(self.vocab, tokens, table.block, table.page_starts, array('i', range(len(table) + 1)))
+
+        strings = table.vocab.strings
+        dehyphenate = "dehyphenate" in self.steps
+        token, block, page_starts, source_rows = array('i'), array('i'), array('i', [0]), array('i')
+        for start, stop in zip(table.page_starts, table.page_starts[1:]):
+            row = start
+            while row < stop:
+                token_id = tokens[row]
+                first = row
+                if dehyphenate and row + 1 < stop and self._joins(table, strings, row):
+                    text = self.normalize_text(strings[table.token[row]][:-1] + strings[table.token[row + 1]])
+                    token_id = self.vocab.intern(text) if text else -1
+                    row += 1
+                row += 1
+                if token_id < 0:
+                    # Dropped words belong to the token before them.
+                    continue
+                token.append(token_id)
+                block.append(table.block[first])
+                source_rows.append(first if len(source_rows) else 0)
+            if len(token) > page_starts[-1]:
+                page_starts.append(len(token))
+        source_rows.append(len(table))
+        return NormalizedTable(self.vocab, token, block, page_starts, source_rows)
+
+    @staticmethod
+    def _joins(table, strings, row):
+        # "concur-" at the end of a line followed by "rence" on the next
+        # line of the same block is one word.
+        text = strings[table.token[row]]
+        following = strings[table.token[row + 1]]
+        return (len(text) > 1 and text.endswith(_LINE_END_HYPHENS) and text[-2].isalpha()
+                and following[:1].islower()
+                and table.block[row + 1] == table.block[row] and table.line[row + 1] != table.line[row])
+
+
+def normalize_tables(tables, profile=DEFAULT_PROFILE):
+    """Normalize several WordTables into one vocabulary; returns their NormalizedTables."""
+    normalizer = Normalizer(profile)
+    return [normalizer.table(table) for table in tables]
+
+
+def to_rows(opcodes, normalized_a, normalized_b):
+    """Map opcodes over normalized tokens back to rows of the source tables.
+
+    Each token covers a contiguous run of rows and runs are in order, so
+    the mapped opcodes still tile both tables.
+    """
+    rows_a = normalized_a.source_rows
+    rows_b = normalized_b.source_rows
+    return [(tag, rows_a[i1], rows_a[i2], rows_b[j1], rows_b[j2]) for tag, i1, i2, j1, j2 in opcodes]
@@ -0,0 +1,44 @@
+import threading
+
+
+class ComparisonCancelled(Exception):
+    """Raised inside the pipeline once its CancelToken has been cancelled."""
+
+
+class CancelToken:
+    """Thread-safe flag a UI thread sets to stop a running comparison.
+
+    The pipeline polls it between pages, so cancelling takes effect at the
+    next page boundary rather than immediately. A multiprocessing Event
+    may be passed in as event, so worker processes can share the flag.
+    """
+
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise ComparisonCancelled("Comparison cancelled")
+
+
+def reporter(progress=None, cancel=None):
+    """Combine an optional progress callback and cancel token into one function.
+
+    The returned report(stage, done, total) raises ComparisonCancelled if
+    cancel was cancelled, then calls progress(stage, done, total). Stages
+    are the same names matcha_metrics times: extraction, matching,
+    annotation, save and report.
+    """
+    def report(stage, done, total):
+        if cancel is not None:
+            cancel.check()
+        if progress is not None:
+            progress(stage, done, total)
+    return report
@@ -1,60 +1,99 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
+import html
+import io
+import json
 import os
+import logging
+from contextlib import contextmanager
 from datetime import datetime  # Add this line
-import difflib
-from matcha import extract_text_with_positions # Make sure this import works correctly
+from matcha import compare_pdfs, iter_changes as iter_change_records
+import matcha_io
+import matcha_metrics
+import matcha_progress
 
-def generate_comparison_report(old_pdf_path, new_pdf_path, output_folder="comparison_reports"):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+# reportlab is imported by the PDF backend only: JSON and HTML reports
+# (and the GUI's start-up) shouldn't pay for loading it.
 
-    base_name_old = os.path.splitext(os.path.basename(old_pdf_path))[0]
-    base_name_new = os.path.splitext(os.path.basename(new_pdf_path))[0]
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    report_filename = os.path.join(output_folder, f"ComparisonReport_{base_name_old}_vs_{base_name_new}_{timestamp}.pdf")
+log = logging.getLogger("matcha")
 
-    doc = SimpleDocTemplate(report_filename, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
+CHANGE_TYPES = {'insert': 'added', 'delete': 'removed', 'replace': 'replaced', 'move': 'moved'}
 
-    title = Paragraph(f"PDF Comparison Report: {base_name_old} vs {base_name_new}", styles['h1'])
-    story.append(title)
-    story.append(Spacer(1, 0.2*inch))
+# Longest text kept per side of one change; whole rewritten chapters are
+# one span, and nobody reads them in a report cell anyway.
+MAX_CHANGE_TEXT = 2000
 
-    # --- Extract Text Content ---
-    print("Extracting text for report...")
-    words_old = extract_text_with_positions(old_pdf_path)
-    words_new = extract_text_with_positions(new_pdf_path)
+# Rows per table in the PDF change list. reportlab lays a table out as a
+# whole before splitting it across pages, so one big table is quadratic in
+# practice; many small ones keep the build linear in the number of changes.
+DETAIL_ROWS_PER_TABLE = 100
+# Text cells wrap, so this only bounds how tall one row can get.
+DETAIL_TEXT_CHARS = 300
 
-    flat_words_old = [word[5] for page in words_old for word in page]
-    flat_words_new = [word[5] for page in words_new for word in page]
+# --- Change listing shared by all backends ---
 
-    # --- Perform Detailed Comparison ---
-    matcher = difflib.SequenceMatcher(None, flat_words_old, flat_words_new, autojunk=False)
-    opcodes = matcher.get_opcodes()
+def iter_changes(result, max_text=MAX_CHANGE_TEXT):
+    """matcha.iter_changes() with the text cut short and a report type added.
 
-    added_count = 0
-    removed_count = 0
-    replaced_count = 0
+    The type is the word the report uses for the change: added, removed,
+    replaced or moved.
+    """
+    for change in iter_change_records(result, max_text=max_text):
+        change["type"] = CHANGE_TYPES[change["op"]]
+        yield change
 
-    for tag, i1, i2, j1, j2 in opcodes:
-        if tag == 'insert':
-            added_count += (j2 - j1)
-        elif tag == 'delete':
-            removed_count += (i2 - i1)
-        elif tag == 'replace':
-            replaced_count += min(i2 - i1, j2 - j1) # Consider the shorter segment for word count
+def _percentages(counts):
+    total_old_words = counts["old_words"]
+    total_new_words = counts["new_words"]
+    return {
+        "added": (counts["added"] / total_new_words * 100) if total_new_words > 0 else 0,
+        "removed": (counts["removed"] / total_old_words * 100) if total_old_words > 0 else 0,
+        "replaced": (counts["replaced"] / max(total_old_words, total_new_words) * 100) if max(total_old_words, total_new_words) > 0 else 0,
+        "moved": (counts.get("moved", 0) / total_old_words * 100) if total_old_words > 0 else 0,
+    }
 
-    total_old_words = len(flat_words_old)
-    total_new_words = len(flat_words_new)
+def _base_name(source):
+    return os.path.splitext(matcha_io.source_name(source))[0]
 
-    added_percentage = (added_count / total_new_words * 100) if total_new_words > 0 else 0
-    removed_percentage = (removed_count / total_old_words * 100) if total_old_words > 0 else 0
-    replaced_percentage = (replaced_count / max(total_old_words, total_new_words) * 100) if max(total_old_words, total_new_words) > 0 else 0
+def _source_label(source):
+    # Absolute path of a file on disk; just the name of an in-memory PDF.
+    path = source.path if isinstance(source, matcha_io.PdfInput) else source
+    if isinstance(path, (str, os.PathLike)):
+        return os.path.abspath(path)
+    return matcha_io.source_name(source)
+
+@contextmanager
+def _text_output(output):
+    # Open a report path, or wrap a binary file object, for writing UTF-8 text.
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, "w", encoding="utf-8") as f:
+            yield f
+    else:
+        f = io.TextIOWrapper(output, encoding="utf-8", newline="")
+        try:
+            yield f
+        finally:
+            # Flush, but leave the caller's file object open.
+            f.detach()
+
+# --- Backends ---
+
+def write_pdf_report(output, old_pdf_path, new_pdf_path, counts, result, details, report):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+
+    base_name_old = _base_name(old_pdf_path)
+    base_name_new = _base_name(new_pdf_path)
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    title = Paragraph(f"PDF Comparison Report: {base_name_old} vs {base_name_new}", styles['h1'])
+    story.append(title)
+    story.append(Spacer(1, 0.2*inch))
 
+    percentages = _percentages(counts)
 
     # --- Build Report Content ---
     story.append(Paragraph(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
@@ -63,18 +102,235 @@ def generate_comparison_report(old_pdf_path, new_pdf_path, output_folder="compar
     story.append(Paragraph(f"<b>Summary of Changes:</b>", styles['h2']))
     story.append(Spacer(1, 0.1*inch))
 
-    story.append(Paragraph(f"Total words in Old PDF: {total_old_words}", styles['Normal']))
-    story.append(Paragraph(f"Total words in New PDF: {total_new_words}", styles['Normal']))
+    story.append(Paragraph(f"Total words in Old PDF: {counts['old_words']}", styles['Normal']))
+    story.append(Paragraph(f"Total words in New PDF: {counts['new_words']}", styles['Normal']))
     story.append(Spacer(1, 0.1*inch))
 
-    story.append(Paragraph(f"Newly Added Words: {added_count} ({added_percentage:.2f}%)", styles['Normal']))
-    story.append(Paragraph(f"Removed Words: {removed_count} ({removed_percentage:.2f}%)", styles['Normal']))
-    story.append(Paragraph(f"Replaced Words (estimated): {replaced_count} ({replaced_percentage:.2f}%)", styles['Normal']))
+    story.append(Paragraph(f"Newly Added Words: {counts['added']} ({percentages['added']:.2f}%)", styles['Normal']))
+    story.append(Paragraph(f"Removed Words: {counts['removed']} ({percentages['removed']:.2f}%)", styles['Normal']))
+    story.append(Paragraph(f"Replaced Words (estimated): {counts['replaced']} ({percentages['replaced']:.2f}%)", styles['Normal']))
+    if counts.get("moved"):
+        story.append(Paragraph(f"Moved Words: {counts['moved']} ({percentages['moved']:.2f}%)", styles['Normal']))
+    if counts.get("fuzzy"):
+        story.append(Paragraph(f"Words Matched Despite OCR Noise (not counted as changes): {counts['fuzzy']}", styles['Normal']))
 
+    if result is not None and details:
+        story.append(Spacer(1, 0.2*inch))
+        story.append(Paragraph(f"<b>Detailed Changes:</b>", styles['h2']))
+        # Only the text cells are Paragraphs, so they wrap within their column.
+        header = ["#", "Type", "Old page", "Old text", "New page", "New text"]
+        old_text_style = ParagraphStyle('OldText', parent=styles['Normal'], fontSize=7, leading=8.5, textColor=colors.darkred)
+        new_text_style = ParagraphStyle('NewText', parent=old_text_style, textColor=colors.darkgreen)
+        table_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 7),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+        ])
+        col_widths = [0.4*inch, 0.6*inch, 0.5*inch, 2.5*inch, 0.5*inch, 2.5*inch]
+        rows = []
+        for number, change in enumerate(iter_changes(result, max_text=DETAIL_TEXT_CHARS), 1):
+            rows.append([number, change["type"],
+                         change["old_page"] + 1 if change["old_page"] is not None else "",
+                         Paragraph(html.escape(change["old_text"]), old_text_style),
+                         change["new_page"] + 1 if change["new_page"] is not None else "",
+                         Paragraph(html.escape(change["new_text"]), new_text_style)])
+            if len(rows) == DETAIL_ROWS_PER_TABLE:
+                story.append(Table([header] + rows, colWidths=col_widths, repeatRows=1, style=table_style))
+                rows = []
+        if rows:
+            story.append(Table([header] + rows, colWidths=col_widths, repeatRows=1, style=table_style))
+
+    # reportlab reports how many flowables it has laid out so far.
+    flowable_count = len(story)
+    doc.setProgressCallBack(lambda typ, value: report("report", value, flowable_count) if typ == 'PROGRESS' else None)
     doc.build(story)
-    print(f"Generated comparison report: {report_filename}")
+
+def write_json_report(output, old_pdf_path, new_pdf_path, counts, result, details, report):
+    # Written piecewise so the opcode and change lists are never held as
+    # one big string; each opcode and change is one line of the file.
+    with _text_output(output) as f:
+        f.write("{\n")
+        f.write(f'"old": {json.dumps(_source_label(old_pdf_path))},\n')
+        f.write(f'"new": {json.dumps(_source_label(new_pdf_path))},\n')
+        f.write(f'"generated": {json.dumps(datetime.now().isoformat(timespec="seconds"))},\n')
+        f.write(f'"counts": {json.dumps(counts)},\n')
+        f.write(f'"percentages": {json.dumps({k: round(v, 4) for k, v in _percentages(counts).items()})}')
+        if result is not None:
+            f.write(',\n"opcodes": [')
+            for number, opcode in enumerate(result.opcodes):
+                f.write(("\n" if number == 0 else ",\n") + json.dumps(opcode))
+            f.write("\n]")
+            if details:
+                f.write(',\n"changes": [')
+                for number, change in enumerate(iter_changes(result)):
+                    f.write(("\n" if number == 0 else ",\n") + json.dumps(change))
+                    if number % 1000 == 0:
+                        report("report", change["opcode"], len(result.opcodes))
+                f.write("\n]")
+        f.write("\n}\n")
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border-bottom: 1px solid #ddd; padding: 2px 8px; text-align: left; vertical-align: top; }}
+td.old {{ color: #a00; }}
+td.new {{ color: #070; }}
+td.num {{ text-align: right; }}
+</style></head><body>
+"""
+
+def write_html_report(output, old_pdf_path, new_pdf_path, counts, result, details, report):
+    base_name_old = _base_name(old_pdf_path)
+    base_name_new = _base_name(new_pdf_path)
+    title = html.escape(f"PDF Comparison Report: {base_name_old} vs {base_name_new}")
+    percentages = _percentages(counts)
+    with _text_output(output) as f:
+        f.write(_HTML_HEAD.format(title=title))
+        f.write(f"<h1>{title}</h1>\n<p>Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>\n")
+        f.write("<h2>Summary of Changes</h2>\n<table>\n")
+        f.write(f"<tr><td>Total words in Old PDF</td><td class=\"num\">{counts['old_words']}</td><td></td></tr>\n")
+        f.write(f"<tr><td>Total words in New PDF</td><td class=\"num\">{counts['new_words']}</td><td></td></tr>\n")
+        f.write(f"<tr><td>Newly Added Words</td><td class=\"num\">{counts['added']}</td><td>{percentages['added']:.2f}%</td></tr>\n")
+        f.write(f"<tr><td>Removed Words</td><td class=\"num\">{counts['removed']}</td><td>{percentages['removed']:.2f}%</td></tr>\n")
+        f.write(f"<tr><td>Replaced Words (estimated)</td><td class=\"num\">{counts['replaced']}</td><td>{percentages['replaced']:.2f}%</td></tr>\n")
+        if counts.get("moved"):
+            f.write(f"<tr><td>Moved Words</td><td class=\"num\">{counts['moved']}</td><td>{percentages['moved']:.2f}%</td></tr>\n")
+        if counts.get("fuzzy"):
+            f.write(f"<tr><td>Words Matched Despite OCR Noise</td><td class=\"num\">{counts['fuzzy']}</td><td></td></tr>\n")
+        f.write("</table>\n")
+        if result is not None and details:
+            f.write("<h2>Detailed Changes</h2>\n<table>\n")
+            f.write("<tr><th>#</th><th>Type</th><th>Old page</th><th>Old text</th><th>New page</th><th>New text</th></tr>\n")
+            for number, change in enumerate(iter_changes(result), 1):
+                f.write(f"<tr><td class=\"num\">{number}</td><td>{change['type']}</td>"
+                        f"<td class=\"num\">{change['old_page'] + 1 if change['old_page'] is not None else ''}</td>"
+                        f"<td class=\"old\">{html.escape(change['old_text'])}</td>"
+                        f"<td class=\"num\">{change['new_page'] + 1 if change['new_page'] is not None else ''}</td>"
+                        f"<td class=\"new\">{html.escape(change['new_text'])}</td></tr>\n")
+                if number % 1000 == 0:
+                    report("report", change["opcode"], len(result.opcodes))
+            f.write("</table>\n")
+        f.write("</body></html>\n")
+
+# Report backends by format: (file extension, writer). A writer is called
+# as writer(output, old_pdf_path, new_pdf_path, counts, result, details,
+# report) where output is a file name or a binary file object, the PDFs
+# are paths, PdfInputs or in-memory PDFs (only used for their names),
+# result may be None (streamed comparisons only have counts) and
+# report(stage, done, total) forwards progress and cancellation.
+REPORT_BACKENDS = {
+    "pdf": (".pdf", write_pdf_report),
+    "json": (".json", write_json_report),
+    "html": (".html", write_html_report),
+}
+
+def generate_comparison_report(old_pdf_path, new_pdf_path, output_folder="comparison_reports", result=None, cache_dir=None, counts=None,
+                               progress=None, cancel=None, report_format="pdf", details=True):
+    """Write a comparison report in one of REPORT_BACKENDS' formats; returns its path.
+
+    With a result the report lists every change (type, pages, text and,
+    in JSON, word ranges and boxes) unless details is false; with only
+    counts it holds the summary. With output_folder None nothing is
+    written to disk and the report is returned as bytes instead.
+    """
+    report = matcha_progress.reporter(progress, cancel)
+    if report_format not in REPORT_BACKENDS:
+        raise ValueError(f"Unknown report format '{report_format}' (expected one of {', '.join(REPORT_BACKENDS)})")
+    extension, writer = REPORT_BACKENDS[report_format]
+    if output_folder is None:
+        report_filename = None
+    else:
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        report_filename = os.path.join(output_folder, f"ComparisonReport_{_base_name(old_pdf_path)}_vs_{_base_name(new_pdf_path)}_{timestamp}{extension}")
+
+    # --- Reuse the comparison from the annotation pass when we have one ---
+    # (streaming comparisons pass their accumulated counts instead)
+    if counts is None:
+        if result is None:
+            log.info("Extracting text for report...")
+            result = compare_pdfs(old_pdf_path, new_pdf_path, cache_dir=cache_dir, progress=progress, cancel=cancel)
+        counts = result.change_counts()
+
+    metrics = matcha_metrics.current()
+    report("report", 0, 1)
+    with metrics.stage("report"):
+        if report_filename is None:
+            buffer = io.BytesIO()
+            writer(buffer, old_pdf_path, new_pdf_path, counts, result, details, report)
+        else:
+            try:
+                writer(report_filename, old_pdf_path, new_pdf_path, counts, result, details, report)
+            except BaseException:
+                if os.path.exists(report_filename):
+                    os.remove(report_filename)
+                raise
+    report("report", 1, 1)
+    if report_filename is None:
+        data = buffer.getvalue()
+        metrics.count("bytes_written", len(data))
+        log.info("Generated %s comparison report in memory (%d bytes)", report_format, len(data))
+        return data
+    metrics.count("bytes_written", os.path.getsize(report_filename))
+    log.info("Generated comparison report: %s", report_filename)
+    return report_filename
+
+def generate_baseline_summary_report(summary, output_folder="comparison_reports"):
+    """PDF table ranking the revisions compared against one baseline.
+
+    summary is what matcha_baseline.compare_baseline() returns.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    base_name = os.path.splitext(os.path.basename(summary["baseline"]))[0]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_filename = os.path.join(output_folder, f"BaselineSummary_{base_name}_{timestamp}.pdf")
+
+    doc = SimpleDocTemplate(report_filename, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = [
+        Paragraph(f"Baseline Comparison Summary: {base_name}", styles['h1']),
+        Spacer(1, 0.2*inch),
+        Paragraph(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']),
+        Paragraph(f"Words in baseline: {summary['baseline_words']}", styles['Normal']),
+        Paragraph(f"Revisions compared: {len(summary['revisions'])} ({summary['failed']} failed)", styles['Normal']),
+        Spacer(1, 0.2*inch),
+    ]
+    rows = [["Rank", "Revision", "Changed", "Added", "Removed", "Replaced", "Pages"]]
+    for entry in summary["revisions"]:
+        if entry["status"] == "ok":
+            rows.append([entry["rank"], os.path.basename(entry["revision"]), f"{entry['deviation']:.2%}",
+                         entry["added"], entry["removed"], entry["replaced"], entry["changed_pages"]])
+        else:
+            rows.append([entry["rank"], os.path.basename(entry["revision"]), "failed", "", "", "", ""])
+    table = Table(rows, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
+    ]))
+    story.append(table)
+
+    metrics = matcha_metrics.current()
+    with metrics.stage("report"):
+        doc.build(story)
+    metrics.count("bytes_written", os.path.getsize(report_filename))
+    log.info("Generated baseline summary report: %s", report_filename)
+    return report_filename
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     from your_main_script import extract_text_with_positions # Import the function
 
     old_pdf = "sample_pdf/old_document.pdf" # CHANGE THIS
@@ -0,0 +1,197 @@
+import io
+import json
+import logging
+import os
+
+import matcha
+import matcha_diff
+import matcha_io
+import matcha_metrics
+import matcha_normalize
+import matcha_reports
+from matcha_words import Vocabulary, WordTable
+
+# An 'equal' run must be at least this many words long before the window is
+# cut after it; shorter runs are too likely to be coincidental matches.
+MIN_ANCHOR_WORDS = 8
+
+log = logging.getLogger("matcha")
+
+
+def iter_page_tables(pdf_path, vocab):
+    """Yield one WordTable per non-empty page, opening the PDF lazily.
+
+    A matcha_io.PdfInput's document is used as it is and left open.
+    """
+    source = matcha_io.as_input(pdf_path)
+    doc = source.document()
+    try:
+        for page_num in range(len(doc)):
+            table = WordTable(vocab)
+            table.append_page(page_num, doc.load_page(page_num).get_text("words"))
+            if len(table):
+                yield table
+    finally:
+        if source is not pdf_path:
+            source.close()
+
+
+def _top_up(pending, pages, window):
+    """Append window pages to pending's carried-over tail; return True once pages ran out.
+
+    The tail is the unmatched end of a page already seen, so it does not
+    count: otherwise a side that carries one over would fall a page
+    behind the other.
+    """
+    target = window + (1 if len(pending) else 0)
+    while pending.page_count < target:
+        page_table = next(pages, None)
+        if page_table is None:
+            return True
+        pending.extend(page_table)
+    return False
+
+
+def _cut_after_anchor(opcodes, min_anchor):
+    # Commit everything up to and including the last long 'equal' run: it is
+    # stable, so whatever follows can be re-diffed with the next pages.
+    for idx in range(len(opcodes) - 1, -1, -1):
+        tag, i1, i2, j1, j2 = opcodes[idx]
+        if tag == 'equal' and i2 - i1 >= min_anchor:
+            return idx + 1
+    return None
+
+
+def _change_record(opcode, table_old, table_new, offset_old, offset_new):
+    # matcha.change_record() with window-relative rows made document-wide.
+    record = matcha.change_record(opcode, table_old, table_new)
+    record["old"] = [offset_old + record["old"][0], offset_old + record["old"][1]]
+    record["new"] = [offset_new + record["new"][0], offset_new + record["new"][1]]
+    return record
+
+
+def stream_compare(old_pdf_path, new_pdf_path, output_folder="annotated_pdfs", report_folder=None,
+                   window=20, min_anchor=MIN_ANCHOR_WORDS, engine=matcha_diff.DEFAULT_ENGINE,
+                   granularity="line", save_mode="optimized", report_format="pdf",
+                   normalization=matcha_normalize.DEFAULT_PROFILE):
+    """Compare two PDFs with memory bounded by the window size.
+
+    Pages are pulled from both documents through generators into a window of
+    `window` pages per side, plus what is left of a page from the last window. The window is diffed page-anchored,
+    everything up to its last stable 'equal' run is committed -- highlighted
+    in the output documents and written to a changes JSONL file -- and only
+    the uncommitted tail is carried into the next window. If a full window
+    has no anchor it is committed as a whole so memory stays bounded.
+
+    The PDFs may be given as for matcha.compare_pdfs(); each is opened once
+    and read and annotated through the same document. With output_folder
+    None the annotated PDFs (stats "data") and the change list ("changes")
+    are returned as bytes instead of being written. normalization is as for
+    matcha.compare_pdfs(); one Normalizer serves all windows.
+    """
+    normalizer = None
+    if normalization != "exact":
+        normalizer = matcha_normalize.Normalizer(normalization)
+    source_old = matcha_io.as_input(old_pdf_path)
+    source_new = matcha_io.as_input(new_pdf_path)
+    if output_folder is None:
+        output_old_path = output_new_path = changes_path = None
+    else:
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        output_old_path = os.path.join(output_folder, f"annotated_OLD_{source_old.name}")
+        output_new_path = os.path.join(output_folder, f"annotated_NEW_{source_new.name}")
+        changes_path = os.path.join(output_folder, f"changes_{os.path.splitext(source_old.name)[0]}"
+                                                   f"_vs_{os.path.splitext(source_new.name)[0]}.jsonl")
+
+    vocab = Vocabulary()
+    pages_old = iter_page_tables(source_old, vocab)
+    pages_new = iter_page_tables(source_new, vocab)
+    pending_old = WordTable(vocab)
+    pending_new = WordTable(vocab)
+    offset_old = offset_new = 0
+    counts = matcha.count_changes([])
+    annotations_old = annotations_new = 0
+
+    metrics = matcha_metrics.current()
+    doc_old = doc_new = None
+    changes_buffer = io.StringIO() if changes_path is None else None
+    try:
+        doc_old, save_mode_old = matcha.open_annotation_target(source_old, output_old_path, save_mode)
+        doc_new, save_mode_new = matcha.open_annotation_target(source_new, output_new_path, save_mode)
+        with (open(changes_path, "w", encoding="utf-8") if changes_path else changes_buffer) as changes_file:
+            while True:
+                with metrics.stage("extraction"):
+                    done_old = _top_up(pending_old, pages_old, window)
+                    done_new = _top_up(pending_new, pages_new, window)
+                if not len(pending_old) and not len(pending_new):
+                    break
+
+                match_old, match_new = pending_old, pending_new
+                if normalizer is not None:
+                    with metrics.stage("normalization"):
+                        match_old, match_new = normalizer.table(pending_old), normalizer.table(pending_new)
+                with metrics.stage("matching"):
+                    opcodes = matcha_diff.hierarchical_opcodes(
+                        [match_old.page_blocks(k) for k in range(match_old.page_count)],
+                        [match_new.page_blocks(k) for k in range(match_new.page_count)],
+                        engine=engine)
+                if normalizer is not None:
+                    opcodes = matcha_normalize.to_rows(opcodes, match_old, match_new)
+                cut = None if done_old and done_new else _cut_after_anchor(opcodes, min_anchor)
+                committed = opcodes if cut is None else opcodes[:cut]
+                metrics.count("windows")
+                metrics.count("opcodes", len(committed))
+
+                # --- Write out the committed part of the window ---
+                with metrics.stage("annotation"):
+                    annotations_old += matcha.highlight_rows(
+                        doc_old, pending_old, [(i1, i2) for tag, i1, i2, j1, j2 in committed if tag in ('delete', 'replace')],
+                        [1, 0, 0], granularity)
+                    annotations_new += matcha.highlight_rows(
+                        doc_new, pending_new, [(j1, j2) for tag, i1, i2, j1, j2 in committed if tag in ('insert', 'replace')],
+                        [0, 1, 0], granularity)
+                for op in committed:
+                    if op[0] != 'equal':
+                        record = _change_record(op, pending_old, pending_new, offset_old, offset_new)
+                        changes_file.write(json.dumps(record) + "\n")
+                matcha.count_changes(committed, counts)
+
+                cut_old = committed[-1][2] if committed else 0
+                cut_new = committed[-1][4] if committed else 0
+                offset_old += cut_old
+                offset_new += cut_new
+                pending_old = pending_old.copy_rows(cut_old, len(pending_old))
+                pending_new = pending_new.copy_rows(cut_new, len(pending_new))
+            changes = changes_path if changes_buffer is None else changes_buffer.getvalue().encode("utf-8")
+    except BaseException:
+        # Failed or interrupted mid-stream: close everything and leave no partial outputs.
+        pages_old.close()
+        pages_new.close()
+        if doc_old is not None:
+            matcha.discard_annotation_target(doc_old, output_old_path, save_mode_old)
+        if doc_new is not None:
+            matcha.discard_annotation_target(doc_new, output_new_path, save_mode_new)
+        if changes_path is not None and os.path.exists(changes_path):
+            os.remove(changes_path)
+        for source, given in ((source_old, old_pdf_path), (source_new, new_pdf_path)):
+            if source is not given:
+                source.close()
+        raise
+
+    with metrics.stage("save"):
+        old_stats = matcha.finish_annotation_target(doc_old, output_old_path, save_mode_old, annotations_old)
+        new_stats = matcha.finish_annotation_target(doc_new, output_new_path, save_mode_new, annotations_new)
+    log.info("Saved annotated old PDF to: %s", output_old_path or "memory")
+    log.info("Saved annotated new PDF to: %s", output_new_path or "memory")
+    log.info("Wrote change list to: %s", changes_path or "memory")
+
+    counts["old_words"] = offset_old
+    counts["new_words"] = offset_new
+    metrics.count("words", offset_old + offset_new)
+    summary = {"old": old_stats, "new": new_stats, "changes": changes, "counts": counts}
+    if report_folder:
+        summary["report"] = matcha_reports.generate_comparison_report(source_old, source_new,
+                                                                      output_folder=report_folder, counts=counts,
+                                                                      report_format=report_format)
+    return summary
@@ -0,0 +1,304 @@
+import argparse
+import difflib
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+import zlib
+from datetime import datetime
+
+import matcha
+import matcha_cache
+import matcha_diff
+from matcha_words import Vocabulary, WordTable
+
+log = logging.getLogger("matcha")
+
+STORE_FORMAT = 1
+INDEX_FILENAME = "index.json"
+
+
+def page_fingerprints(page_table):
+    """Return (content, text) fingerprints of a one-page WordTable.
+
+    The content fingerprint covers words and their boxes/blocks/lines and
+    names the stored page; the text fingerprint covers the words only and
+    is what pages are aligned on when diffing versions.
+    """
+    text = "\0".join(page_table.texts()).encode("utf-8")
+    content = hashlib.sha256(text)
+    for name in ('x0', 'y0', 'x1', 'y1', 'block', 'line'):
+        content.update(bytes(getattr(page_table, name)))
+    return content.hexdigest(), hashlib.sha256(text).hexdigest()
+
+
+def _page_runs(page_numbers):
+    # [3, 4, 5, 9] -> [[3, 3], [9, 1]]: usually a single run per version.
+    runs = []
+    for page_num in page_numbers:
+        if runs and runs[-1][0] + runs[-1][1] == page_num:
+            runs[-1][1] += 1
+        else:
+            runs.append([page_num, 1])
+    return runs
+
+
+class VersionStore:
+    """Word data of a chain of document versions, stored as page deltas.
+
+    Pages are content-addressed: each distinct page is written once under
+    pages/, and a version records only how its page list differs from its
+    predecessor's ("copy" runs of the parent's pages plus the fingerprints
+    of new ones), so storage grows with what changed rather than with the
+    number of versions. Diffs between any two versions are answered from
+    the store without touching the PDFs: pages are aligned by text
+    fingerprint, identical pages are skipped outright, and word-level
+    diffs of changed page pairs are kept under diffs/ and reused by every
+    later diff that meets the same pair of pages.
+
+    One writer at a time; any number of readers.
+    """
+
+    def __init__(self, root, cache_words=2_000_000):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILENAME)
+        self._page_cache = matcha_cache.MemoryCache(max_words=cache_words)
+        self._resolved = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+            if self.index.get("format") != STORE_FORMAT:
+                raise ValueError(f"{root}: unsupported version store format {self.index.get('format')}")
+        else:
+            self.index = {"format": STORE_FORMAT, "versions": [], "pages": {}}
+
+    # --- Adding versions ---
+
+    def add_version(self, pdf_path, label=None, workers=1):
+        """Extract a PDF once and store it as the newest version; returns its record."""
+        digest = matcha_cache.file_digest(pdf_path)
+        label = label or f"v{len(self.index['versions']) + 1}"
+        if any(v["label"] == label for v in self.index["versions"]):
+            raise ValueError(f"Version '{label}' already exists")
+
+        table = matcha.extract_word_table(pdf_path, workers=workers)
+        fingerprints = []
+        page_numbers = []
+        new_pages = 0
+        for k in range(table.page_count):
+            page_table = table.copy_rows(table.page_starts[k], table.page_starts[k + 1]).compacted()
+            fingerprint, text_fingerprint = page_fingerprints(page_table)
+            if fingerprint not in self.index["pages"]:
+                self._write_page(fingerprint, page_table)
+                self.index["pages"][fingerprint] = {"text": text_fingerprint, "words": len(page_table)}
+                new_pages += 1
+            fingerprints.append(fingerprint)
+            page_numbers.append(page_table.page[0])
+
+        parent = self.index["versions"][-1] if self.index["versions"] else None
+        parent_fingerprints = self.resolve(parent["label"]) if parent else []
+        delta = []
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, parent_fingerprints, fingerprints, autojunk=False).get_opcodes():
+            if tag == 'equal':
+                delta.append(["copy", i1, i2])
+            elif tag != 'delete':
+                delta.append(["new", fingerprints[j1:j2]])
+        record = {
+            "label": label,
+            "source": os.path.abspath(pdf_path),
+            "digest": digest,
+            "added": datetime.now().isoformat(timespec="seconds"),
+            "parent": parent["label"] if parent else None,
+            "delta": delta,
+            "page_runs": _page_runs(page_numbers),
+            "words": len(table),
+        }
+        self.index["versions"].append(record)
+        self._resolved[label] = fingerprints
+        self._write_index()
+        log.info("Stored %s (%s): %d pages, %d new", label, pdf_path, len(fingerprints), new_pages)
+        return record
+
+    # --- Reading versions ---
+
+    def version(self, ref):
+        """Look a version up by label, or by 1-based position (as int or digits)."""
+        versions = self.index["versions"]
+        for record in versions:
+            if record["label"] == ref:
+                return record
+        if str(ref).isdigit() and 1 <= int(ref) <= len(versions):
+            return versions[int(ref) - 1]
+        raise KeyError(f"No version '{ref}'")
+
+    def versions(self):
+        return list(self.index["versions"])
+
+    def resolve(self, ref):
+        """Page fingerprints of a version, replaying deltas from its ancestors."""
+        record = self.version(ref)
+        if record["label"] not in self._resolved:
+            # Walk up to the nearest resolved ancestor, then replay down.
+            chain = []
+            while record is not None and record["label"] not in self._resolved:
+                chain.append(record)
+                record = self.version(record["parent"]) if record["parent"] else None
+            fingerprints = self._resolved[record["label"]] if record is not None else []
+            for record in reversed(chain):
+                resolved = []
+                for op in record["delta"]:
+                    resolved.extend(fingerprints[op[1]:op[2]] if op[0] == "copy" else op[1])
+                self._resolved[record["label"]] = fingerprints = resolved
+        return self._resolved[self.version(ref)["label"]]
+
+    def load_table(self, ref, vocab=None):
+        """Rebuild a version's WordTable from stored pages."""
+        record = self.version(ref)
+        page_numbers = [start + n for start, count in record["page_runs"] for n in range(count)]
+        table = WordTable(vocab)
+        for fingerprint, page_num in zip(self.resolve(ref), page_numbers):
+            start = len(table)
+            table.extend(self._read_page(fingerprint))
+            for row in range(start, len(table)):
+                table.page[row] = page_num
+        return table
+
+    # --- Diffing versions ---
+
+    def diff(self, ref_a, ref_b, engine=matcha_diff.DEFAULT_ENGINE):
+        """Diff two stored versions; returns a matcha.ComparisonResult.
+
+        The result points at the versions' source PDFs, so it can be handed
+        to create_annotated_pdfs() or the report while those still exist.
+        """
+        record_a, record_b = self.version(ref_a), self.version(ref_b)
+        vocab = Vocabulary()
+        table_a = self.load_table(ref_a, vocab)
+        table_b = self.load_table(ref_b, vocab)
+        fingerprints_a, fingerprints_b = self.resolve(ref_a), self.resolve(ref_b)
+        pages = self.index["pages"]
+        text_a = [pages[fp]["text"] for fp in fingerprints_a]
+        text_b = [pages[fp]["text"] for fp in fingerprints_b]
+
+        opcodes = []
+        for tag, p1, p2, q1, q2 in matcha_diff.get_opcodes(text_a, text_b, engine=engine):
+            i1, i2 = table_a.page_starts[p1], table_a.page_starts[p2]
+            j1, j2 = table_b.page_starts[q1], table_b.page_starts[q2]
+            if tag != 'replace':
+                opcodes.append((tag, i1, i2, j1, j2))
+            elif p2 - p1 == q2 - q1:
+                # Pages edited in place: diff them pair by pair, reusing the
+                # stored diff of any pair an earlier diff has already met.
+                for p, q in zip(range(p1, p2), range(q1, q2)):
+                    k, l = table_a.page_starts[p], table_b.page_starts[q]
+                    page_opcodes = self._page_pair_opcodes(text_a[p], text_b[q], table_a.page_view(p),
+                                                           table_b.page_view(q), engine)
+                    opcodes.extend((t, k + a1, k + a2, l + b1, l + b2) for t, a1, a2, b1, b2 in page_opcodes)
+            else:
+                span_opcodes = matcha_diff.hierarchical_opcodes([table_a.page_blocks(k) for k in range(p1, p2)],
+                                                                [table_b.page_blocks(k) for k in range(q1, q2)],
+                                                                engine=engine)
+                opcodes.extend((t, i1 + a1, i1 + a2, j1 + b1, j1 + b2) for t, a1, a2, b1, b2 in span_opcodes)
+        return matcha.ComparisonResult(record_a["source"], record_b["source"], table_a, table_b,
+                                       matcha_diff.normalize_opcodes(opcodes))
+
+    def _page_pair_opcodes(self, text_a, text_b, page_a, page_b, engine):
+        path = os.path.join(self.root, "diffs", f"{text_a[:32]}_{text_b[:32]}_{engine}.pkl")
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    return pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+        opcodes = matcha_diff.hierarchical_opcodes([page_a.page_blocks(0)], [page_b.page_blocks(0)], engine=engine)
+        self._atomic_write(path, pickle.dumps(opcodes, protocol=pickle.HIGHEST_PROTOCOL))
+        return opcodes
+
+    # --- Storage ---
+
+    def stats(self):
+        page_bytes = 0
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "pages")):
+            page_bytes += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+        return {
+            "versions": len(self.index["versions"]),
+            "stored_pages": len(self.index["pages"]),
+            "version_pages": sum(len(self.resolve(v["label"])) for v in self.index["versions"]),
+            "stored_words": sum(page["words"] for page in self.index["pages"].values()),
+            "version_words": sum(v["words"] for v in self.index["versions"]),
+            "page_bytes": page_bytes,
+        }
+
+    def _page_path(self, fingerprint):
+        return os.path.join(self.root, "pages", fingerprint[:2], f"{fingerprint}.pkl.z")
+
+    def _write_page(self, fingerprint, page_table):
+        self._atomic_write(self._page_path(fingerprint),
+                           zlib.compress(pickle.dumps(page_table, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def _read_page(self, fingerprint):
+        page_table = self._page_cache.get(fingerprint)
+        if page_table is None:
+            with open(self._page_path(fingerprint), "rb") as f:
+                page_table = pickle.loads(zlib.decompress(f.read()))
+            self._page_cache.put(fingerprint, page_table)
+        return page_table
+
+    def _write_index(self):
+        self._atomic_write(self.index_path, json.dumps(self.index, indent=1).encode("utf-8"))
+
+    def _atomic_write(self, path, data):
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+# --- Command line ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="matcha_versions", description="Store document versions and diff any two of them.")
+    parser.add_argument("store", help="version store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="add PDFs as the next versions, in order")
+    add.add_argument("pdfs", nargs="+")
+    add.add_argument("--label", help="label for the version (only with a single PDF; default v<N>)")
+    commands.add_parser("list", help="list stored versions")
+    commands.add_parser("stats", help="show how much the deltas save")
+    diff = commands.add_parser("diff", help="diff two versions without re-parsing the PDFs")
+    diff.add_argument("old", help="version label or 1-based number")
+    diff.add_argument("new")
+    diff.add_argument("--engine", default=matcha_diff.DEFAULT_ENGINE, choices=sorted(matcha_diff.DIFF_ENGINES))
+    diff.add_argument("-o", "--output-dir", help="also write annotated PDFs (needs the source PDFs) and a report here")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    store = VersionStore(args.store)
+    if args.command == "add":
+        if args.label and len(args.pdfs) > 1:
+            parser.error("--label needs a single PDF")
+        for pdf_path in args.pdfs:
+            store.add_version(pdf_path, label=args.label)
+    elif args.command == "list":
+        for position, record in enumerate(store.versions(), 1):
+            print(f"{position:>3}  {record['label']:<12} {record['words']:>8} words  {len(store.resolve(record['label'])):>5} pages  "
+                  f"{sum(len(op[1]) for op in record['delta'] if op[0] == 'new'):>4} new  {record['source']}")
+    elif args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        result = store.diff(args.old, args.new, engine=args.engine)
+        print(json.dumps(result.change_counts(), indent=2))
+        if args.output_dir:
+            import matcha_reports
+            matcha.create_annotated_pdfs(result.old_pdf_path, result.new_pdf_path, output_folder=args.output_dir, result=result)
+            matcha_reports.generate_comparison_report(result.old_pdf_path, result.new_pdf_path, output_folder=args.output_dir, result=result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
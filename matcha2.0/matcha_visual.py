@@ -0,0 +1,238 @@
+import difflib
+import hashlib
+import logging
+
+import fitz
+import numpy as np
+
+import matcha_metrics
+
+try:
+    from scipy import ndimage
+except ImportError:
+    # Optional: labels changed tiles in C; _run_regions() does without.
+    ndimage = None
+
+log = logging.getLogger("matcha")
+
+VISUAL_DPI = 72
+
+# A pixel counts as changed when its grey level moves by more than this,
+# which ignores anti-aliasing jitter between renderers and producers.
+PIXEL_THRESHOLD = 48
+
+# Pages are compared in square tiles of TILE_PIXELS; a tile is changed
+# when at least MIN_TILE_PIXELS of its pixels are.
+TILE_PIXELS = 8
+MIN_TILE_PIXELS = 3
+
+# Rectangle annotation colours; the word highlights are red (old) and
+# green (new), the visual regions use darker shades of the same.
+REGION_COLOR_OLD = [0.6, 0, 0]
+REGION_COLOR_NEW = [0, 0.5, 0]
+
+
+def page_fingerprint(doc, page):
+    """Hash what a page draws: its content streams and the resources they use.
+
+    Images and form XObjects are hashed by their stream data rather than
+    their xref numbers, so the same page in two different files hashes the
+    same. Pages with equal fingerprints render identically and are never
+    rasterized.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(page.mediabox), page.rotation)).encode("ascii"))
+    for xref in page.get_contents():
+        digest.update(doc.xref_stream(xref) or b"")
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+        digest.update(repr(image[1:]).encode("utf-8", "replace"))
+    for xobject in page.get_xobjects():
+        digest.update(doc.xref_stream(xobject[0]) or b"")
+        digest.update(repr(xobject[1:]).encode("utf-8", "replace"))
+    for font in page.get_fonts(full=True):
+        # (ext, type, basefont, name, encoding): the font program itself is
+        # too expensive to hash for every page.
+        digest.update(repr(font[1:6]).encode("utf-8", "replace"))
+    return digest.hexdigest()
+
+
+def word_rects(table):
+    """Word boxes of a WordTable grouped by page number."""
+    rects = {}
+    for row in range(len(table)):
+        rects.setdefault(table.page[row], []).append(table.rect(row))
+    return rects
+
+
+def _render(page, dpi):
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    # samples (a copy), not samples_mv: the view dies with the pixmap.
+    pixels = np.frombuffer(pixmap.samples, dtype=np.uint8)
+    return pixels.reshape(pixmap.height, pixmap.stride)[:, :pixmap.width]
+
+
+def changed_tiles(pixels_a, pixels_b, tile=TILE_PIXELS, threshold=PIXEL_THRESHOLD, min_pixels=MIN_TILE_PIXELS):
+    """Boolean (rows, columns) grid of the tiles that differ between two renderings.
+
+    Renderings of different sizes are compared on a white canvas covering both.
+    """
+    height = max(pixels_a.shape[0], pixels_b.shape[0])
+    width = max(pixels_a.shape[1], pixels_b.shape[1])
+    rows, columns = -(-height // tile), -(-width // tile)
+    canvas = np.full((2, rows * tile, columns * tile), 255, dtype=np.int16)
+    canvas[0, :pixels_a.shape[0], :pixels_a.shape[1]] = pixels_a
+    canvas[1, :pixels_b.shape[0], :pixels_b.shape[1]] = pixels_b
+    changed = np.abs(canvas[0] - canvas[1]) > threshold
+    return changed.reshape(rows, tile, columns, tile).sum(axis=(1, 3), dtype=np.int32) >= min_pixels
+
+
+def _mask_rects(tiles, page, rects, scale, tile):
+    # Clear the tiles under words. Text is the word diff's job, and a single
+    # replaced word can reflow (and so "visually change") a whole page.
+    matrix = page.rotation_matrix * fitz.Matrix(1 / (scale * tile), 1 / (scale * tile))
+    for rect in rects:
+        r = fitz.Rect(rect) * matrix
+        tiles[max(0, int(r.y0)):max(0, int(r.y1) + 1), max(0, int(r.x0)):max(0, int(r.x1) + 1)] = False
+
+
+def _tile_regions(tiles):
+    # Bounding boxes (x0, y0, x1, y1, in tiles) of 8-connected groups of changed tiles.
+    if ndimage is not None:
+        labels, _ = ndimage.label(tiles, structure=np.ones((3, 3), dtype=bool))
+        return [(xs.start, ys.start, xs.stop, ys.stop) for ys, xs in ndimage.find_objects(labels)]
+    return _run_regions(tiles)
+
+
+def _run_regions(tiles):
+    # Connected components over horizontal runs of changed tiles rather than
+    # single tiles: the Python work grows with the number of runs, which
+    # stays small even on a page that changed all over.
+    padded = np.zeros((tiles.shape[0], tiles.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = tiles
+    edges = np.diff(padded, axis=1)
+    runs = []          # (y, x0, x1) with x1 exclusive, row by row
+    row_starts = [0]
+    for y in range(tiles.shape[0]):
+        starts = np.flatnonzero(edges[y] == 1)
+        if len(starts):
+            stops = np.flatnonzero(edges[y] == -1)
+            runs.extend((y, int(x0), int(x1)) for x0, x1 in zip(starts, stops))
+        row_starts.append(len(runs))
+
+    parent = list(range(len(runs)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for y in range(1, tiles.shape[0]):
+        # Runs on neighbouring rows touch (diagonally, too) if their spans
+        # overlap once widened by one tile; both rows are sorted by x.
+        above, above_stop = row_starts[y - 1], row_starts[y]
+        for k in range(row_starts[y], row_starts[y + 1]):
+            _, x0, x1 = runs[k]
+            while above < above_stop and runs[above][2] < x0:
+                above += 1
+            j = above
+            while j < above_stop and runs[j][1] <= x1:
+                root_j, root_k = find(j), find(k)
+                if root_j != root_k:
+                    parent[max(root_j, root_k)] = min(root_j, root_k)
+                j += 1
+
+    boxes = {}
+    for k, (y, x0, x1) in enumerate(runs):
+        root = find(k)
+        box = boxes.get(root)
+        if box is None:
+            boxes[root] = [x0, y, x1, y + 1]
+        else:
+            box[0], box[2], box[3] = min(box[0], x0), max(box[2], x1), y + 1
+    # Roots are each group's first run, so this is row-major scan order.
+    return [tuple(boxes[root]) for root in sorted(boxes)]
+
+
+def _page_regions(page, regions, scale, tile):
+    # Tile boxes in rendered (rotated) pixels -> unrotated page coordinates,
+    # which is what annotations are placed in.
+    matrix = fitz.Matrix(scale * tile, scale * tile) * page.derotation_matrix
+    return [(fitz.Rect(region) * matrix) & page.rect for region in regions]
+
+
+def compare_pages(doc_old, doc_new, dpi=VISUAL_DPI, masks_old=None, masks_new=None, on_page=None):
+    """Find the regions whose rendering differs between two open documents.
+
+    Pages are aligned on their page_fingerprint(); identical pages are
+    skipped, pages that changed are paired in order and rasterized at dpi,
+    and pages without a counterpart, or whose size or rotation changed, are
+    changed as a whole. masks_old and masks_new ({page number: [boxes]},
+    e.g. from word_rects()) blank out areas that are not to be compared.
+    on_page(done, total) is called after each rasterized pair. Returns
+    ({page: [Rect]} for the old and the new document, stats).
+    """
+    metrics = matcha_metrics.current()
+    fingerprints_old = [page_fingerprint(doc_old, page) for page in doc_old]
+    fingerprints_new = [page_fingerprint(doc_new, page) for page in doc_new]
+
+    pairs = []
+    skipped = 0
+    regions_old, regions_new = {}, {}
+    matcher = difflib.SequenceMatcher(None, fingerprints_old, fingerprints_new, autojunk=False)
+    for tag, p1, p2, q1, q2 in matcher.get_opcodes():
+        if tag == 'equal':
+            skipped += p2 - p1
+            continue
+        paired = min(p2 - p1, q2 - q1)
+        for p, q in zip(range(p1, p1 + paired), range(q1, q1 + paired)):
+            if doc_old[p].rotation == doc_new[q].rotation and doc_old[p].rect == doc_new[q].rect:
+                pairs.append((p, q))
+            else:
+                regions_old[p] = [doc_old[p].rect]
+                regions_new[q] = [doc_new[q].rect]
+        for p in range(p1 + paired, p2):
+            regions_old[p] = [doc_old[p].rect]
+        for q in range(q1 + paired, q2):
+            regions_new[q] = [doc_new[q].rect]
+
+    scale = 72 / dpi
+    for done, (p, q) in enumerate(pairs, 1):
+        page_old, page_new = doc_old[p], doc_new[q]
+        tiles = changed_tiles(_render(page_old, dpi), _render(page_new, dpi))
+        if masks_old and p in masks_old:
+            _mask_rects(tiles, page_old, masks_old[p], scale, TILE_PIXELS)
+        if masks_new and q in masks_new:
+            _mask_rects(tiles, page_new, masks_new[q], scale, TILE_PIXELS)
+        regions = _tile_regions(tiles)
+        if regions:
+            regions_old[p] = [r for r in _page_regions(page_old, regions, scale, TILE_PIXELS) if not r.is_empty]
+            regions_new[q] = [r for r in _page_regions(page_new, regions, scale, TILE_PIXELS) if not r.is_empty]
+        if on_page is not None:
+            on_page(done, len(pairs))
+
+    stats = {
+        "pages_skipped": skipped,
+        "pages_rendered": len(pairs),
+        "regions": sum(len(rects) for rects in regions_old.values()) + sum(len(rects) for rects in regions_new.values()),
+    }
+    metrics.count("visual_pages_rendered", stats["pages_rendered"])
+    metrics.count("visual_regions", stats["regions"])
+    log.debug("Visual diff: %d pages rendered, %d skipped, %d regions",
+              stats["pages_rendered"], stats["pages_skipped"], stats["regions"])
+    return regions_old, regions_new, stats
+
+
+def add_region_annotations(doc, regions, color):
+    """Frame each region ({page: [Rect]}) with a rectangle annotation; returns how many were added."""
+    annotation_count = 0
+    for page_num, rects in regions.items():
+        page = doc.load_page(page_num)
+        for rect in rects:
+            annot = page.add_rect_annot(rect)
+            annot.set_colors(stroke=color)
+            annot.set_border(width=1)
+            annot.update()
+            annotation_count += 1
+    return annotation_count
@@ -0,0 +1,209 @@
+from array import array
+
+
+class Vocabulary:
+    """Shared string table mapping token text to small integer IDs.
+
+    Both documents of a comparison intern into the same vocabulary, so
+    their token columns can be matched as plain integers.
+    """
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self.ids = {}
+        for text in strings:
+            self.intern(text)
+
+    def intern(self, text):
+        token_id = self.ids.get(text)
+        if token_id is None:
+            token_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return token_id
+
+    def __len__(self):
+        return len(self.strings)
+
+    def copy(self):
+        """Independent copy: the same IDs for the strings known so far, new ones interned separately."""
+        vocab = Vocabulary.__new__(Vocabulary)
+        vocab.strings = list(self.strings)
+        vocab.ids = dict(self.ids)
+        return vocab
+
+    def __getitem__(self, token_id):
+        return self.strings[token_id]
+
+    def __getstate__(self):
+        # The reverse index is rebuilt on load; no need to pickle it twice.
+        return self.strings
+
+    def __setstate__(self, strings):
+        self.strings = list(strings)
+        self.ids = {text: token_id for token_id, text in enumerate(self.strings)}
+
+
+class WordTable:
+    """Columnar store for the words extracted from one PDF.
+
+    One row per word: page number, bounding box, PyMuPDF block/line numbers
+    and an interned token ID. page_starts holds the first row of every
+    non-empty page plus a final end offset, mirroring the per-page lists
+    that extract_text_with_positions() used to return. Tables produced by
+    page_view()/rows() share their parent's buffers instead of copying.
+    """
+
+    def __init__(self, vocab=None):
+        self.vocab = vocab if vocab is not None else Vocabulary()
+        self.page = array('i')
+        self.x0 = array('d')
+        self.y0 = array('d')
+        self.x1 = array('d')
+        self.y1 = array('d')
+        self.block = array('i')
+        self.line = array('i')
+        self.token = array('i')
+        self.page_starts = array('i', [0])
+
+    # --- Building ---
+
+    def append_page(self, page_num, words):
+        """Append the non-blank words of one page as returned by get_text("words")."""
+        count = 0
+        intern = self.vocab.intern
+        for w in words:
+            text = w[4].strip()
+            if not text:
+                continue
+            self.page.append(page_num)
+            self.x0.append(w[0])
+            self.y0.append(w[1])
+            self.x1.append(w[2])
+            self.y1.append(w[3])
+            self.block.append(w[5] if len(w) > 5 else 0)
+            self.line.append(w[6] if len(w) > 6 else 0)
+            self.token.append(intern(text))
+            count += 1
+        if count:
+            self.page_starts.append(self.page_starts[-1] + count)
+
+    def extend(self, other):
+        """Append all rows of another table, re-interning its tokens if needed."""
+        base = self.page_starts[-1]
+        for name in ('page', 'x0', 'y0', 'x1', 'y1', 'block', 'line'):
+            getattr(self, name).extend(getattr(other, name))
+        if other.vocab is self.vocab:
+            self.token.extend(other.token)
+        else:
+            mapping = [self.vocab.intern(text) for text in other.vocab.strings]
+            self.token.extend(mapping[t] for t in other.token)
+        self.page_starts.extend(base + start for start in other.page_starts[1:])
+
+    def remapped(self, vocab):
+        """Return this table with its tokens re-interned into another vocabulary.
+
+        Only the token column is rebuilt; every other column is shared.
+        """
+        table = WordTable(vocab)
+        for name in ('page', 'x0', 'y0', 'x1', 'y1', 'block', 'line', 'page_starts'):
+            setattr(table, name, getattr(self, name))
+        if vocab is self.vocab:
+            table.token = self.token
+        else:
+            mapping = [vocab.intern(text) for text in self.vocab.strings]
+            table.token = array('i', (mapping[t] for t in self.token))
+        return table
+
+    def copy_rows(self, start, stop):
+        """Copy rows [start, stop) into a new, independent table.
+
+        Unlike rows(), the copy keeps page boundaries (the first and last
+        page may be partial) and lets the parent's buffers be released.
+        """
+        table = WordTable(self.vocab)
+        for name in ('page', 'x0', 'y0', 'x1', 'y1', 'block', 'line', 'token'):
+            getattr(table, name).extend(getattr(self, name)[start:stop])
+        if stop > start:
+            table.page_starts.extend(b - start for b in self.page_starts if start < b < stop)
+            table.page_starts.append(stop - start)
+        return table
+
+    def compacted(self):
+        """Copy of this table with a fresh vocabulary holding only the strings it uses.
+
+        Used before persisting a slice of a document, which would otherwise
+        drag the whole document's vocabulary along.
+        """
+        table = WordTable()
+        for name in ('page', 'x0', 'y0', 'x1', 'y1', 'block', 'line', 'page_starts'):
+            setattr(table, name, array(getattr(table, name).typecode, getattr(self, name)))
+        strings = self.vocab.strings
+        intern = table.vocab.intern
+        table.token = array('i', (intern(strings[t]) for t in self.token))
+        return table
+
+    @classmethod
+    def from_pages(cls, pages_content, vocab=None):
+        """Build a table from the legacy list-of-pages-of-6-tuples format."""
+        table = cls(vocab)
+        for page_words in pages_content:
+            if page_words:
+                table.append_page(page_words[0][0], [(w[1], w[2], w[3], w[4], w[5]) for w in page_words])
+        return table
+
+    # --- Access ---
+
+    def __len__(self):
+        return len(self.token)
+
+    @property
+    def page_count(self):
+        return len(self.page_starts) - 1
+
+    def rows(self, start, stop):
+        """Zero-copy view of rows [start, stop) as a WordTable."""
+        view = WordTable.__new__(WordTable)
+        view.vocab = self.vocab
+        for name in ('page', 'x0', 'y0', 'x1', 'y1', 'block', 'line', 'token'):
+            setattr(view, name, memoryview(getattr(self, name))[start:stop])
+        view.page_starts = array('i', [0, stop - start])
+        return view
+
+    def page_view(self, index):
+        """Zero-copy view of the index-th non-empty page."""
+        return self.rows(self.page_starts[index], self.page_starts[index + 1])
+
+    def text(self, row):
+        return self.vocab.strings[self.token[row]]
+
+    def texts(self, start=0, stop=None):
+        strings = self.vocab.strings
+        return [strings[t] for t in self.token[start:stop]]
+
+    def rect(self, row):
+        return (self.x0[row], self.y0[row], self.x1[row], self.y1[row])
+
+    def page_blocks(self, index):
+        """Token IDs of one page grouped by PyMuPDF text block."""
+        blocks = []
+        prev_block = None
+        for row in range(self.page_starts[index], self.page_starts[index + 1]):
+            if self.block[row] != prev_block:
+                blocks.append([])
+                prev_block = self.block[row]
+            blocks[-1].append(self.token[row])
+        return blocks
+
+    # --- Compatibility with the tuple-based API ---
+
+    def word(self, row):
+        return (self.page[row], self.x0[row], self.y0[row], self.x1[row], self.y1[row], self.text(row))
+
+    def words(self):
+        """Flat list of (page_num, x0, y0, x1, y1, text) tuples."""
+        return [self.word(row) for row in range(len(self))]
+
+    def pages(self):
+        """Per-page lists of 6-tuples, as extract_text_with_positions() returns."""
+        return [[self.word(row) for row in range(start, stop)]
+                for start, stop in zip(self.page_starts, self.page_starts[1:])]
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import fitz  # PyMuPDF
+import pytest
+
+# The matcha modules are plain scripts next to this folder, not a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_pdf(path, pages, fontsize=10):
+    """Write a PDF with one page per list of text lines; returns path (or bytes if path is None)."""
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        y = 50
+        for line in lines:
+            page.insert_text((50, y), line, fontsize=fontsize)
+            y += fontsize * 2
+    try:
+        if path is None:
+            return doc.tobytes()
+        doc.save(path)
+        return path
+    finally:
+        doc.close()
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    def make(name, pages):
+        return write_pdf(os.fspath(tmp_path / name), pages)
+    return make
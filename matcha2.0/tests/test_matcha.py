@@ -0,0 +1,194 @@
+import inspect
+import os
+import re
+
+import fitz
+import pytest
+
+import matcha
+import matcha_io
+
+
+def test_compare_text_content_yields_changes(make_pdf):
+    old = matcha.extract_text_with_positions(make_pdf("old.pdf", [["the quick brown fox jumps"]]))
+    new = matcha.extract_text_with_positions(make_pdf("new.pdf", [["the quick red fox jumps"]]))
+    records = list(matcha.compare_text_content(old, new))
+    assert [(r["op"], r["old_text"], r["new_text"]) for r in records] == [("replace", "brown", "red")]
+
+
+def test_compare_text_content_of_identical_documents(make_pdf):
+    words = matcha.extract_text_with_positions(make_pdf("same.pdf", [["one two three"], ["four five"]]))
+    assert list(matcha.compare_text_content(words, words)) == []
+
+
+def test_comparison_result_without_sources(make_pdf):
+    table = matcha.extract_word_table(make_pdf("doc.pdf", [["alpha beta"]]))
+    result = matcha.ComparisonResult(None, None, table, table, [('equal', 0, 2, 0, 2)])
+    assert result.old_source is None and result.old_pdf_path is None
+    assert result.change_counts()["old_words"] == 2
+
+
+def test_compare_pdfs_in_memory(make_pdf):
+    old = open(make_pdf("old.pdf", [["keep this line"]]), "rb").read()
+    result = matcha.compare_pdfs(old, matcha_io.PdfInput(make_pdf("new.pdf", [["keep that line"]])))
+    assert result.change_counts()["replaced"] == 1
+    stats = matcha.create_annotated_pdfs(old, None, output_folder=None, result=result)
+    assert stats["new"]["path"] is None and stats["new"]["data"].startswith(b"%PDF")
+
+
+def test_compare_pdfs_defaults_to_the_page_anchored_diff(make_pdf):
+    # The frontends all diff page-anchored; a plain library call should agree with them.
+    old = make_pdf("old.pdf", [["the same words here"], ["the same words here too"]])
+    new = make_pdf("new.pdf", [["the same words here too"]])
+    assert matcha.compare_pdfs(old, new).opcodes == [('delete', 0, 4, 0, 0), ('equal', 4, 9, 0, 5)]
+    assert matcha.compare_pdfs(old, new, hierarchical=False).opcodes != matcha.compare_pdfs(old, new).opcodes
+
+
+def parallel_pair(make_pdf):
+    pages_old = [[f"page {n} line {k} {'moved' if (n + k) % 7 == 0 else 'kept'} text" for k in range(6)] for n in range(12)]
+    pages_new = [[line.replace("moved", "changed") for line in page] for page in pages_old]
+    return make_pdf("old.pdf", pages_old), make_pdf("new.pdf", pages_new)
+
+
+def test_parallel_extraction_matches_serial(make_pdf):
+    pdfs = parallel_pair(make_pdf)
+    serial = matcha.extract_documents(pdfs, workers=1)
+    parallel = matcha.extract_documents(pdfs, workers=4)
+    for table_serial, table_parallel in zip(serial, parallel):
+        for name in ('page', 'x0', 'y0', 'x1', 'y1', 'block', 'line', 'token', 'page_starts'):
+            assert getattr(table_parallel, name) == getattr(table_serial, name), name
+        assert table_parallel.vocab.strings == table_serial.vocab.strings
+
+
+def without_file_id(data):
+    # MuPDF gives every save a fresh random /ID; everything else must match.
+    return re.sub(rb"/ID\s*\[<[0-9A-Fa-f]*>\s*<[0-9A-Fa-f]*>\]", b"/ID[]", data)
+
+
+def test_parallel_annotated_pdfs_match_serial(make_pdf):
+    pdfs = parallel_pair(make_pdf)
+    outputs = []
+    for workers in (1, 3):
+        result = matcha.compare_pdfs(*pdfs, workers=workers)
+        stats = matcha.create_annotated_pdfs(*pdfs, output_folder=None, result=result)
+        outputs.append((result.opcodes, without_file_id(stats["old"]["data"]), without_file_id(stats["new"]["data"])))
+    assert outputs[0][0] == outputs[1][0]
+    assert outputs[0][1] == outputs[1][1] and outputs[0][2] == outputs[1][2]
+
+
+def layout_table():
+    """Two pages: a block of two lines and a one-line block, then one line."""
+    table = matcha.WordTable()
+    words = []
+    for block, line, texts in ((0, 0, "a b c"), (0, 1, "d e"), (1, 0, "f g")):
+        y = 50 + 40 * block + 15 * line
+        words.extend((50 + 30 * k, y, 75 + 30 * k, y + 10, text, block, line) for k, text in enumerate(texts.split()))
+    table.append_page(0, words)
+    table.append_page(1, [(50, 50, 75, 60, "h", 0, 0), (80, 50, 105, 60, "i", 0, 0)])
+    return table
+
+
+def highlights(granularity, spans):
+    doc = fitz.open()
+    doc.new_page()
+    doc.new_page()
+    pages = []
+    count = matcha.highlight_rows(doc, layout_table(), spans, [0, 1, 0], granularity,
+                                  on_page=lambda done, total: pages.append((done, total)))
+    quads = [[len(annot.vertices) // 4 for annot in page.annots()] for page in doc]
+    doc.close()
+    assert count == sum(len(page) for page in quads)
+    return quads, pages
+
+
+@pytest.mark.parametrize("granularity, expected", [
+    # Quads of each highlight annotation, per page: one quad per text line.
+    ("word", [[1, 1, 1, 1, 1, 1, 1], [1, 1]]),
+    ("line", [[1, 1, 1], [1]]),
+    ("block", [[2, 1], [1]]),
+])
+def test_highlight_runs_merge_by_granularity(granularity, expected):
+    quads, pages = highlights(granularity, [(0, len(layout_table()))])
+    assert quads == expected
+    assert pages == [(1, 2), (2, 2)]
+
+
+def test_highlight_runs_do_not_cross_unchanged_words():
+    quads, _ = highlights("line", [(0, 1), (2, 4)])
+    # "a", then "c" and "d", which are on different lines of the block.
+    assert quads == [[1, 1, 1], []]
+    quads, _ = highlights("block", [(0, 1), (2, 4)])
+    assert quads == [[1, 2], []]
+
+
+def annotate_first_word(doc):
+    doc[0].add_highlight_annot(doc[0].get_text("words")[0][:4])
+    return 1
+
+
+@pytest.mark.parametrize("save_mode", matcha.SAVE_MODES)
+def test_save_modes_write_the_annotation(make_pdf, tmp_path, save_mode):
+    source = make_pdf("doc.pdf", [["first words"], ["second page"]])
+    output = str(tmp_path / f"{save_mode}.pdf")
+    stats = matcha.save_annotated_pdf(source, output, annotate_first_word, save_mode)
+    assert stats["save_mode"] == save_mode and stats["annotations"] == 1
+    assert stats["path"] == output and stats["bytes"] == os.path.getsize(output)
+    with fitz.open(output) as doc:
+        assert [annot.type[1] for annot in doc[0].annots()] == ["Highlight"]
+        assert doc.page_count == 2
+    with open(source, "rb") as f:
+        original = f.read()
+    with open(output, "rb") as f:
+        written = f.read()
+    # Only an incremental save keeps the source bytes and appends to them.
+    assert written.startswith(original) == (save_mode == "incremental")
+
+
+def test_incremental_save_to_memory_becomes_fast(make_pdf):
+    source = make_pdf("doc.pdf", [["some words"]])
+    stats = matcha.save_annotated_pdf(source, None, annotate_first_word, "incremental")
+    assert stats["save_mode"] == "fast" and stats["path"] is None
+    with fitz.open(stream=stats["data"], filetype="pdf") as doc:
+        assert len(list(doc[0].annots())) == 1
+
+
+def test_optimized_save_is_smallest(make_pdf, tmp_path):
+    source = make_pdf("doc.pdf", [[f"line {k} of many words" for k in range(30)] for _ in range(5)])
+    sizes = {mode: matcha.save_annotated_pdf(source, str(tmp_path / f"{mode}.pdf"), annotate_first_word, mode)["bytes"]
+             for mode in matcha.SAVE_MODES}
+    assert sizes["optimized"] <= sizes["fast"]
+
+
+def test_unknown_save_mode(make_pdf, tmp_path):
+    with pytest.raises(ValueError, match="Unknown save mode"):
+        matcha.save_annotated_pdf(make_pdf("doc.pdf", [["x"]]), str(tmp_path / "out.pdf"), annotate_first_word, "lazy")
+
+
+def test_change_records_describe_each_change():
+    table_old, table_new = layout_table(), matcha.WordTable()
+    table_new.append_page(0, [(50, 50, 75, 60, "a", 0, 0), (80, 50, 105, 60, "x", 0, 0)])
+    opcodes = [('equal', 0, 1, 0, 1), ('replace', 1, 5, 1, 2), ('delete', 5, 9, 2, 2)]
+    result = matcha.ComparisonResult(None, None, table_old, table_new, opcodes)
+    changes = matcha.iter_changes(result, max_text=5)
+    assert inspect.isgenerator(changes)
+
+    replace, delete = changes
+    assert (replace["op"], replace["opcode"], replace["old"], replace["new"]) == ("replace", 1, [1, 5], [1, 2])
+    assert (replace["old_page"], replace["new_page"], replace["page"]) == (0, 0, 0)
+    assert replace["old_text"] == "b c d..." and replace["new_text"] == "x"
+    # One box per text line the change covers: "b c" and "d e".
+    assert replace["old_boxes"] == [[0, 80, 50, 135, 60], [0, 50, 65, 105, 75]]
+    # Removed at the end: placed on the new document's last page.
+    assert (delete["new_page"], delete["page"], delete["new_boxes"]) == (None, 0, [])
+    assert delete["old_text"] == "f g h..."
+
+
+def test_unified_diff_of_change_records(make_pdf):
+    old = matcha.extract_text_with_positions(make_pdf("old.pdf", [["keep this"], ["same page", "drop me please"]]))
+    new = matcha.extract_text_with_positions(make_pdf("new.pdf", [["keep that"], ["same page"]]))
+    records = matcha.compare_text_content(old, new)
+    assert inspect.isgenerator(records)
+    lines = list(matcha.unified_diff(records, "a.pdf", "b.pdf"))
+    assert lines == ["--- a.pdf", "+++ b.pdf",
+                     "@@ -p1:2,1 +p1:2,1 @@ replace", "-this", "+that",
+                     "@@ -p2:5,3 +5,0 @@ delete", "-drop me please"]
@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+import matcha_baseline
+import matcha_progress
+
+
+def test_revisions_do_not_grow_the_baseline_vocabulary(make_pdf):
+    baseline = matcha_baseline.PreparedBaseline.load(make_pdf("base.pdf", [["one two three four"]]))
+    words_before = len(baseline.table.vocab)
+    for n in range(3):
+        revision = make_pdf(f"rev{n}.pdf", [[f"one two changed{n} four extra{n}"]])
+        result = baseline.compare(revision)
+        assert result.change_counts()["replaced"] == 1 and result.change_counts()["added"] == 1
+        assert result.table_new.texts() == ["one", "two", f"changed{n}", "four", f"extra{n}"]
+    assert len(baseline.table.vocab) == words_before
+
+
+def test_compare_baseline_ranks_revisions(make_pdf, tmp_path):
+    base = make_pdf("base.pdf", [["a b c d e f g h i j"]])
+    small = make_pdf("small.pdf", [["a b c d e f g h i x"]])
+    large = make_pdf("large.pdf", [["a b x y z f g h i j"]])
+    output = str(tmp_path / "out")
+    summary = matcha_baseline.compare_baseline(base, [small, large], output_folder=output, summary_report=False)
+    assert [entry["revision"] for entry in summary["revisions"]] == [large, small]
+    assert [entry["changed_words"] for entry in summary["revisions"]] == [3, 1]
+    assert summary["failed"] == 0
+    with open(os.path.join(output, matcha_baseline.SUMMARY_FILENAME), encoding="utf-8") as f:
+        assert json.load(f)["baseline_words"] == 10
+
+
+def test_compare_baseline_reports_revision_stages_and_clears_the_baseline(make_pdf, tmp_path):
+    base = make_pdf("base.pdf", [["a b c"], ["d e f"]])
+    revision = make_pdf("rev.pdf", [["a b x"], ["d e f"]])
+    stages = []
+    matcha_baseline.compare_baseline(base, [revision], output_folder=str(tmp_path / "out"), summary_report=False,
+                                     report=True, report_format="json",
+                                     progress=lambda stage, done, total: stages.append(stage))
+    assert {"revisions", "extraction", "annotation", "report"} <= set(stages)
+    assert matcha_baseline._baseline is None
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_cancel_stops_a_baseline_run_inside_a_revision(make_pdf, tmp_path, jobs):
+    base = make_pdf("base.pdf", [[f"page {n} words"] for n in range(6)])
+    revisions = [make_pdf(f"rev{k}.pdf", [[f"page {n} changed{k}"] for n in range(6)]) for k in range(2)]
+    cancel = matcha_progress.CancelToken()
+
+    def progress(stage, done, total):
+        if stage == "annotation" or (stage == "revisions" and jobs > 1):
+            cancel.cancel()
+
+    with pytest.raises(matcha_progress.ComparisonCancelled):
+        matcha_baseline.compare_baseline(base, revisions, output_folder=str(tmp_path / "out"), jobs=jobs,
+                                         summary_report=False, progress=progress, cancel=cancel)
+    assert not os.path.exists(tmp_path / "out" / matcha_baseline.SUMMARY_FILENAME)
+    assert matcha_baseline._baseline is None
+    if jobs == 1:
+        assert not os.listdir(tmp_path / "out" / "0001_rev0")
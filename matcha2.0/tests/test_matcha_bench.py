@@ -0,0 +1,22 @@
+import matcha
+import matcha_bench
+
+
+def test_generate_pair_is_reproducible(tmp_path):
+    first = tmp_path / "a"
+    second = tmp_path / "b"
+    first.mkdir()
+    second.mkdir()
+    paths_a = matcha_bench.generate_pair(str(first), pages=2, words_per_page=100, seed=3)
+    paths_b = matcha_bench.generate_pair(str(second), pages=2, words_per_page=100, seed=3)
+    table_a, table_b = (matcha.extract_word_table(paths[1]) for paths in (paths_a, paths_b))
+    assert table_a.texts(0, len(table_a)) == table_b.texts(0, len(table_b))
+
+
+def test_time_stages_reports_pipeline_stages(tmp_path):
+    old_pdf, new_pdf = matcha_bench.generate_pair(str(tmp_path), pages=3, words_per_page=100, edit_rate=0.05)
+    timings, counts = matcha_bench.time_stages(old_pdf, new_pdf, str(tmp_path))
+    assert set(matcha_bench.STAGES) <= set(timings)
+    assert all(seconds > 0 for stage, seconds in timings.items() if stage in matcha_bench.STAGES)
+    assert counts["opcodes"] > 1 and counts["old_words"] == 300
+    assert any(name.startswith("annotated_NEW_") for name in (p.name for p in tmp_path.iterdir()))
@@ -0,0 +1,37 @@
+import os
+
+import matcha
+import matcha_cache
+
+
+def test_cache_entries_hold_only_their_own_words(make_pdf, tmp_path):
+    old = make_pdf("old.pdf", [["alpha beta gamma"]])
+    new = make_pdf("new.pdf", [["alpha delta epsilon zeta"]])
+    memory_cache = matcha_cache.MemoryCache()
+    cache_dir = str(tmp_path / "cache")
+    table_old, table_new = matcha.extract_documents([old, new], cache_dir=cache_dir, memory_cache=memory_cache)
+    assert len(table_old.vocab) == 6
+
+    for path, words in ((old, ["alpha", "beta", "gamma"]), (new, ["alpha", "delta", "epsilon", "zeta"])):
+        digest = matcha_cache.file_digest(path)
+        for entry in (memory_cache.get(digest), matcha_cache.load_extraction(cache_dir, digest)):
+            assert sorted(entry.vocab.strings) == sorted(words)
+            assert entry.texts() == words
+
+
+def test_cached_extraction_is_reused(make_pdf, tmp_path):
+    pdf = make_pdf("doc.pdf", [["one two"], ["three"]])
+    cache_dir = str(tmp_path / "cache")
+    first = matcha.extract_word_table(pdf, cache_dir=cache_dir)
+    assert os.listdir(cache_dir) == [os.path.basename(matcha_cache.cache_file_path(cache_dir, matcha_cache.file_digest(pdf)))]
+    second = matcha.extract_word_table(pdf, cache_dir=cache_dir)
+    assert second.words() == first.words()
+
+
+def test_memory_cache_evicts_by_words(make_pdf):
+    tables = [matcha.extract_word_table(make_pdf(f"d{n}.pdf", [["w " * 10]])) for n in range(3)]
+    cache = matcha_cache.MemoryCache(max_words=25)
+    for n, table in enumerate(tables):
+        cache.put(str(n), table)
+    assert cache.get("0") is None and cache.get("2") is tables[2]
+    assert cache.stats()["words"] == 20
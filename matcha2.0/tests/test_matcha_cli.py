@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+
+import pytest
+
+import matcha_cli
+import matcha_diff
+
+
+def options(**overrides):
+    opts = {"cache_dir": None, "engine": matcha_diff.DEFAULT_ENGINE, "hierarchical": True, "granularity": "line",
+            "save_mode": "fast", "detect_moves": False, "normalization": "exact", "fuzzy_threshold": None,
+            "visual": False, "visual_dpi": 72, "report": False, "report_format": "pdf", "stream_window": 0}
+    opts.update(overrides)
+    return opts
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def read_results(output_dir):
+    with open(os.path.join(output_dir, "results.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+# --- Manifests and directories ---
+
+def test_csv_manifest_resolves_paths_against_itself(tmp_path):
+    manifest = write(str(tmp_path / "m" / "pairs.csv"), "old,new,id\na/old.pdf,b/new.pdf,first\nx.pdf,y.pdf,\n")
+    pairs = matcha_cli.read_manifest(manifest)
+    assert pairs[0] == {"id": "first", "old": str(tmp_path / "m" / "a" / "old.pdf"), "new": str(tmp_path / "m" / "b" / "new.pdf")}
+    assert pairs[1]["id"] == "000002_y"
+
+
+def test_jsonl_manifest(tmp_path):
+    manifest = write(str(tmp_path / "pairs.jsonl"), '{"old": "a.pdf", "new": "b.pdf"}\n\n{"old": "c.pdf", "new": "d.pdf", "id": "cd"}\n')
+    assert [pair["id"] for pair in matcha_cli.read_manifest(manifest)] == ["000001_b", "cd"]
+
+
+@pytest.mark.parametrize("pair_id", ["../x", "../../x", "a/b", "a\\b", "/abs", "..", ".", "c:evil"])
+def test_manifest_rejects_ids_outside_the_output_dir(tmp_path, pair_id):
+    manifest = write(str(tmp_path / "pairs.jsonl"), json.dumps({"old": "a.pdf", "new": "b.pdf", "id": pair_id}) + "\n")
+    with pytest.raises(ValueError, match="plain folder name"):
+        matcha_cli.read_manifest(manifest)
+
+
+def test_manifest_rejects_duplicate_ids(tmp_path):
+    manifest = write(str(tmp_path / "pairs.csv"), "old,new,id\na.pdf,b.pdf,same\nc.pdf,d.pdf,same\n")
+    with pytest.raises(ValueError, match="repeats the id"):
+        matcha_cli.read_manifest(manifest)
+
+
+def test_manifest_needs_old_and_new(tmp_path):
+    manifest = write(str(tmp_path / "pairs.csv"), "old,new\na.pdf,\n")
+    with pytest.raises(ValueError, match="needs both"):
+        matcha_cli.read_manifest(manifest)
+
+
+def test_pair_directories(tmp_path, caplog):
+    for name in ("old/a.pdf", "old/sub/b.pdf", "old/orphan.pdf", "old/notes.txt", "new/a.pdf", "new/sub/b.pdf"):
+        write(str(tmp_path / name), "")
+    with caplog.at_level(logging.WARNING, logger="matcha"):
+        pairs = matcha_cli.pair_directories(str(tmp_path / "old"), str(tmp_path / "new"))
+    assert [(pair["id"], pair["new"]) for pair in pairs] == [
+        ("a", str(tmp_path / "new" / "a.pdf")),
+        ("sub__b", os.path.join(str(tmp_path / "new"), "sub", "b.pdf")),
+    ]
+    assert "orphan.pdf" in caplog.text
+
+
+# --- Running batches ---
+
+@pytest.fixture
+def pairs(make_pdf):
+    return [{"id": name, "old": make_pdf(f"{name}_old.pdf", [[f"{name} one two"]]),
+             "new": make_pdf(f"{name}_new.pdf", [[f"{name} one three"]])} for name in ("a", "b", "c")]
+
+
+def test_batch_resumes_completed_pairs(pairs, tmp_path):
+    output_dir = str(tmp_path / "out")
+    broken = dict(pairs[1], old=pairs[1]["old"] + ".missing")
+    assert matcha_cli.run_batch([pairs[0], broken, pairs[2]], output_dir, options(), jobs=2) == 1
+    assert matcha_cli.is_complete(pairs[0], output_dir) and not matcha_cli.is_complete(broken, output_dir)
+    assert {r["id"]: r["status"] for r in read_results(output_dir)} == {"a": "ok", "b": "error", "c": "ok"}
+
+    # Only the failed pair runs again.
+    assert matcha_cli.run_batch(pairs, output_dir, options(), jobs=2) == 0
+    assert [r["id"] for r in read_results(output_dir)][3:] == ["b"]
+    assert all(matcha_cli.is_complete(pair, output_dir) for pair in pairs)
+
+
+def test_unpicklable_options_fail_per_pair(pairs, tmp_path):
+    output_dir = str(tmp_path / "out")
+    assert matcha_cli.run_batch(pairs, output_dir, options(unpicklable=lambda: None), jobs=1) == 3
+    results = read_results(output_dir)
+    assert sorted(r["id"] for r in results) == ["a", "b", "c"]
+    assert all(r["status"] == "error" for r in results)
+    with open(os.path.join(output_dir, "a", matcha_cli.SUMMARY_FILENAME), encoding="utf-8") as f:
+        assert json.load(f)["status"] == "error"
+
+
+def crash_on_b(pair, output_dir, opts):
+    if pair["id"] == "b":
+        os._exit(1)
+    return matcha_cli.run_pair(pair, output_dir, opts)
+
+
+def test_worker_crash_does_not_abort_the_batch(pairs, tmp_path, monkeypatch):
+    monkeypatch.setattr(matcha_cli, "run_pair", crash_on_b)
+    output_dir = str(tmp_path / "out")
+    failures = matcha_cli.run_batch(pairs, output_dir, options(), jobs=1)
+    results = {r["id"]: r for r in read_results(output_dir)}
+    assert sorted(results) == ["a", "b", "c"]
+    assert results["b"]["status"] == "error" and "BrokenProcessPool" in results["b"]["error"]
+    assert failures == sum(1 for r in results.values() if r["status"] != "ok")
+
+
+def test_main_reports_bad_manifests(tmp_path):
+    manifest = write(str(tmp_path / "pairs.csv"), "old,new,id\na.pdf,b.pdf,../x\n")
+    with pytest.raises(SystemExit) as exit_info:
+        matcha_cli.main(["--manifest", manifest, "-o", str(tmp_path / "out")])
+    assert exit_info.value.code == 2
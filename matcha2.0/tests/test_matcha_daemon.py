@@ -0,0 +1,138 @@
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import matcha_client
+import matcha_daemon
+
+
+def wait_for(service, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = service.get(job_id)
+        if job["status"] in matcha_client.FINISHED_STATES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def pdfs(make_pdf):
+    return (make_pdf("old.pdf", [["the quick brown fox"], ["jumps over the dog"]]),
+            make_pdf("new.pdf", [["the quick red fox"], ["jumps over the dog"]]))
+
+
+@pytest.fixture
+def service():
+    service = matcha_daemon.ComparisonService(jobs=1, workers=1)
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def server(service):
+    server = matcha_daemon.make_server(service, port=0, token="secret")
+    service.start()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_job_spec_validates(pdfs):
+    old, new = pdfs
+    spec = matcha_daemon.job_spec({"old": old, "new": new, "output_dir": "out"})
+    assert spec["report_dir"] == os.path.abspath("out") and spec["report"]
+    with pytest.raises(ValueError, match="Missing 'output_dir'"):
+        matcha_daemon.job_spec({"old": old, "new": new})
+    with pytest.raises(ValueError, match="No such file"):
+        matcha_daemon.job_spec({"old": old + ".missing", "new": new, "output_dir": "out"})
+    with pytest.raises(ValueError, match="fuzzy_threshold"):
+        matcha_daemon.job_spec({"old": old, "new": new, "output_dir": "out", "fuzzy_threshold": True})
+
+
+def test_job_runs_to_done(service, pdfs, tmp_path):
+    service.start()
+    job = service.submit({"old": pdfs[0], "new": pdfs[1], "output_dir": str(tmp_path / "out"), "report_format": "json"})
+    assert job["status"] in ("queued", "running")
+    job = wait_for(service, job["id"])
+    assert job["status"] == "done", job.get("error")
+    assert job["result"]["replaced"] == 1
+    assert os.path.isfile(job["result"]["annotated"]["new"]) and os.path.isfile(job["result"]["report"])
+    assert "extraction" in job["stages"]
+    assert service.stats()["jobs"] == {"done": 1}
+
+
+def test_queued_job_can_be_cancelled(service, pdfs, tmp_path):
+    # Not started yet, so the job stays queued until the dispatcher runs.
+    job = service.submit({"old": pdfs[0], "new": pdfs[1], "output_dir": str(tmp_path / "out")})
+    assert service.cancel(job["id"])["status"] == "cancelled"
+    service.start()
+    later = service.submit({"old": pdfs[0], "new": pdfs[1], "output_dir": str(tmp_path / "out2"), "report": False})
+    assert wait_for(service, later["id"])["status"] == "done"
+    assert service.get(job["id"])["status"] == "cancelled"
+    assert not os.path.exists(tmp_path / "out")
+    assert service.cancel("nope") is None
+
+
+def test_client_round_trip(server, pdfs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = matcha_client.DaemonClient(server, token="secret")
+    # Relative paths are resolved by the client, not in the daemon's directory.
+    job = client.submit(os.path.relpath(pdfs[0]), os.path.relpath(pdfs[1]), "out", report=False)
+    assert job["spec"]["output_dir"] == str(tmp_path / "out")
+    job = client.wait(job["id"], poll_interval=0.05)
+    assert job["status"] == "done"
+    assert [entry["id"] for entry in client.jobs()] == [job["id"]]
+
+
+def test_requests_need_the_token(server):
+    with pytest.raises(matcha_client.DaemonError, match="access token"):
+        matcha_client.DaemonClient(server, token="wrong").health()
+    with pytest.raises(matcha_client.DaemonError, match="access token"):
+        matcha_client.DaemonClient(server, token="").jobs()
+
+
+def test_post_must_be_json(server, pdfs):
+    # A web page can send this without a CORS preflight.
+    body = json.dumps({"old": pdfs[0], "new": pdfs[1], "output_dir": "out"}).encode("utf-8")
+    request = urllib.request.Request(server + "/jobs", data=body, method="POST",
+                                     headers={"Content-Type": "text/plain", matcha_client.TOKEN_HEADER: "secret"})
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=10)
+    assert error.value.code == 415
+
+
+@pytest.mark.parametrize("length, status", [("abc", 400), ("-1", 400), (str(matcha_daemon.MAX_REQUEST_BYTES + 1), 413)])
+def test_bad_content_length_is_rejected(server, length, status):
+    host, port = server[len("http://"):].split(":")
+    connection = http.client.HTTPConnection(host, int(port), timeout=5)
+    try:
+        connection.putrequest("POST", "/jobs")
+        connection.putheader("Content-Type", "application/json")
+        connection.putheader(matcha_client.TOKEN_HEADER, "secret")
+        connection.putheader("Content-Length", length)
+        connection.endheaders()
+        # The connection stays open: a handler reading to EOF would time out here.
+        response = connection.getresponse()
+        assert response.status == status
+        assert "error" in json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_token_file_is_created_once(tmp_path):
+    token_file = str(tmp_path / "config" / "daemon_token")
+    assert matcha_client.read_token(token_file) is None
+    token = matcha_client.ensure_token(token_file)
+    assert token and matcha_client.ensure_token(token_file) == token
+    assert matcha_client.read_token(token_file) == token
+    if os.name != "nt":
+        assert os.stat(token_file).st_mode & 0o777 == 0o600
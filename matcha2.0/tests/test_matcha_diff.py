@@ -0,0 +1,98 @@
+import difflib
+import random
+
+import pytest
+
+import matcha_diff
+
+
+def assert_valid(opcodes, seq_a, seq_b):
+    # Contiguous, covering both sequences, equal spans really equal and in
+    # SequenceMatcher's normal form (no empty spans, no neighbours to merge).
+    i = j = 0
+    prev_tag = None
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        assert i1 <= i2 and j1 <= j2 and (i1 < i2 or j1 < j2)
+        if tag == 'equal':
+            assert seq_a[i1:i2] == seq_b[j1:j2]
+        elif tag == 'replace':
+            assert i1 < i2 and j1 < j2
+        elif tag == 'delete':
+            assert j1 == j2
+        else:
+            assert tag == 'insert' and i1 == i2
+        assert not (prev_tag == 'equal' and tag == 'equal')
+        assert not (prev_tag not in (None, 'equal') and tag != 'equal')
+        prev_tag = tag
+        i, j = i2, j2
+    assert (i, j) == (len(seq_a), len(seq_b))
+
+
+def edited(rnd, seq, vocabulary, edits):
+    seq = list(seq)
+    for _ in range(edits):
+        pos = rnd.randrange(len(seq) + 1)
+        kind = rnd.choice(("insert", "delete", "replace", "duplicate"))
+        if kind == "insert":
+            seq[pos:pos] = rnd.choices(vocabulary, k=rnd.randint(1, 5))
+        elif kind == "delete":
+            del seq[pos:pos + rnd.randint(1, 5)]
+        elif kind == "replace":
+            seq[pos:pos + rnd.randint(1, 3)] = rnd.choices(vocabulary, k=rnd.randint(1, 3))
+        else:
+            seq[pos:pos] = seq[max(0, pos - 8):pos]
+    return seq
+
+
+@pytest.mark.parametrize("engine", sorted(matcha_diff.DIFF_ENGINES))
+@pytest.mark.parametrize("seed", range(40))
+def test_random_opcodes_are_valid(engine, seed):
+    rnd = random.Random(seed)
+    # Small vocabularies give repeated tokens, the case patience has to fall back on.
+    vocabulary = [f"w{n}" for n in range(rnd.choice((3, 20, 500)))]
+    seq_a = rnd.choices(vocabulary, k=rnd.randint(0, 400))
+    seq_b = edited(rnd, seq_a, vocabulary, rnd.randint(0, 12))
+    assert_valid(matcha_diff.get_opcodes(seq_a, seq_b, engine=engine), seq_a, seq_b)
+
+
+@pytest.mark.parametrize("engine", sorted(matcha_diff.DIFF_ENGINES))
+def test_edge_cases(engine):
+    for seq_a, seq_b in (([], []), ([], ["a"]), (["a"], []), (["a", "b"], ["a", "b"]), (["a"] * 50, ["a"] * 49)):
+        assert_valid(matcha_diff.get_opcodes(seq_a, seq_b, engine=engine), seq_a, seq_b)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_patience_matches_difflib_on_sparse_edits(seed):
+    # Distinct words with a few single-word edits: both engines must agree exactly.
+    rnd = random.Random(seed)
+    seq_a = [f"word{n}" for n in range(rnd.randint(50, 2000))]
+    seq_b = list(seq_a)
+    for pos in sorted(rnd.sample(range(len(seq_a)), rnd.randint(1, 10)), reverse=True):
+        kind = rnd.choice(("insert", "delete", "replace"))
+        if kind == "insert":
+            seq_b.insert(pos, f"new{pos}")
+        elif kind == "delete":
+            del seq_b[pos]
+        else:
+            seq_b[pos] = f"changed{pos}"
+    expected = difflib.SequenceMatcher(None, seq_a, seq_b, autojunk=False).get_opcodes()
+    assert matcha_diff.get_opcodes(seq_a, seq_b, engine="patience") == expected
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_hierarchical_opcodes_are_valid(seed):
+    rnd = random.Random(seed)
+    vocabulary = [f"w{n}" for n in range(50)]
+    pages_a = [[rnd.choices(vocabulary, k=rnd.randint(1, 12)) for _ in range(rnd.randint(1, 4))] for _ in range(8)]
+    pages_b = [[edited(rnd, block, vocabulary, rnd.random() < 0.2) for block in page] for page in pages_a]
+    pages_b = [[block for block in page if block] for page in pages_b]
+    tokens_a = [t for page in pages_a for block in page for t in block]
+    tokens_b = [t for page in pages_b for block in page for t in block]
+    for engine in matcha_diff.DIFF_ENGINES:
+        assert_valid(matcha_diff.hierarchical_opcodes(pages_a, pages_b, engine=engine), tokens_a, tokens_b)
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError, match="Unknown diff engine"):
+        matcha_diff.get_opcodes([], [], engine="nope")
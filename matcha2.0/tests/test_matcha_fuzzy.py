@@ -0,0 +1,57 @@
+import matcha
+import matcha_fuzzy
+
+
+def assert_tiles(opcodes, old_words, new_words):
+    # Every word of both documents is in exactly one opcode.
+    covered_old, covered_new = [0] * old_words, [0] * new_words
+    for tag, i1, i2, j1, j2 in opcodes:
+        for i in range(i1, i2):
+            covered_old[i] += 1
+        for j in range(j1, j2):
+            covered_new[j] += 1
+    assert covered_old == [1] * old_words
+    assert covered_new == [1] * new_words
+
+
+def test_ocr_confusions_are_similar():
+    matcher = matcha_fuzzy.WordMatcher(["modern", "rnodern", "clause", "c1ause", "office", "0ffice", "payment"])
+    assert matcher.similar(0, 1)
+    assert matcher.similar(2, 3)
+    assert matcher.similar(4, 5)
+    assert not matcher.similar(0, 6)
+
+
+def test_digits_must_agree():
+    matcher = matcha_fuzzy.WordMatcher(["2024", "2O24", "2025"])
+    assert matcher.similar(0, 1)
+    assert not matcher.similar(0, 2)
+
+
+def test_bounded_distance_stops_at_limit():
+    assert matcha_fuzzy.bounded_distance("kitten", "sitting", 3) == 3
+    assert matcha_fuzzy.bounded_distance("kitten", "sitting", 2) == 3
+    assert matcha_fuzzy.bounded_distance("a", "abcdef", 2) == 3
+
+
+def test_fuzzy_words_are_not_changes(make_pdf):
+    old = make_pdf("old.pdf", [["the modern payment clause is due on delivery of the office goods"]])
+    new = make_pdf("new.pdf", [["the rnodern payment c1ause is due 0n delivery of the 0ffice parcels"]])
+    result = matcha.compare_pdfs(old, new, fuzzy_threshold=matcha_fuzzy.DEFAULT_THRESHOLD)
+    changes = [(r["old_text"], r["new_text"]) for r in matcha.iter_changes(result)]
+    assert changes == [("goods", "parcels")]
+    assert result.change_counts()["fuzzy"] == 4
+    assert_tiles(result.opcodes, len(result.table_old), len(result.table_new))
+
+
+def test_moved_words_are_not_realigned(make_pdf):
+    moved = "this clause about liability and indemnity was moved from the front of the contract to the back"
+    filler = [" ".join(f"filler{k}w{n}" for n in range(8)) for k in range(6)]
+    old = make_pdf("old.pdf", [[moved] + filler + ["alpha beta gamma delta epsilon"]])
+    new = make_pdf("new.pdf", [filler + ["omega psi " + moved + " chi phi"]])
+    plain = matcha.compare_pdfs(old, new, detect_moves=True)
+    result = matcha.compare_pdfs(old, new, detect_moves=True, fuzzy_threshold=matcha_fuzzy.DEFAULT_THRESHOLD)
+    assert_tiles(result.opcodes, len(result.table_old), len(result.table_new))
+    counts = result.change_counts()
+    assert counts["moved"] == 17
+    assert counts == plain.change_counts()
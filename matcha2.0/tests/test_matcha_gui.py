@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("tkinter")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code):
+    # A fresh interpreter: this one has long since imported PyMuPDF.
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    # The last line: PyMuPDF may print a deprecation notice of its own.
+    return completed.stdout.splitlines()[-1].split()
+
+
+def test_importing_the_gui_defers_the_pdf_libraries():
+    loaded = run_python(
+        "import sys, matcha_gui\n"
+        "print(*(name in sys.modules for name in ('fitz', 'pymupdf', 'reportlab', 'numpy', 'matcha', 'matcha_reports')))\n")
+    assert loaded == ["False"] * 6
+
+
+def test_load_pipeline_imports_the_comparison_modules_once():
+    loaded = run_python(
+        "import sys, matcha_gui\n"
+        "first = matcha_gui.load_pipeline()\n"
+        "print(first == matcha_gui.load_pipeline(), matcha_gui.matcha is sys.modules['matcha'],\n"
+        "      'fitz' in sys.modules, 'reportlab' in sys.modules)\n")
+    # reportlab waits for the first PDF report.
+    assert loaded == ["True", "True", "True", "False"]
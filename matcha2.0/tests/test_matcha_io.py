@@ -0,0 +1,91 @@
+import io
+import pathlib
+
+import pytest
+
+import matcha
+import matcha_cache
+import matcha_io
+
+
+@pytest.fixture
+def pdf_path(make_pdf):
+    return make_pdf("input.pdf", [["alpha beta gamma"], ["delta epsilon"]])
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+SOURCES = {
+    "path": lambda path: path,
+    "pathlib": pathlib.Path,
+    "bytes": read,
+    "bytearray": lambda path: bytearray(read(path)),
+    "memoryview": lambda path: memoryview(read(path)),
+    "BytesIO": lambda path: io.BytesIO(read(path)),
+    "mmap": lambda path: matcha_io.PdfInput(path, use_mmap=True),
+}
+
+
+@pytest.mark.parametrize("kind", SOURCES)
+def test_every_source_reads_the_same_pdf(pdf_path, kind):
+    with matcha_io.as_input(SOURCES[kind](pdf_path)) as source:
+        assert source.in_memory == (kind in ("bytes", "bytearray", "memoryview", "BytesIO"))
+        assert source.digest() == matcha_cache.file_digest(pdf_path)
+        assert source.document().page_count == 2
+        assert source.document() is source.document()
+        # Worker processes get the path to open, or a copy of the bytes.
+        assert source.worker_source() == (read(pdf_path) if source.in_memory else pdf_path)
+        table = matcha.extract_word_table(source)
+    assert table.texts() == ["alpha", "beta", "gamma", "delta", "epsilon"]
+
+
+def test_names():
+    assert matcha_io.PdfInput(b"%PDF").name == "document.pdf"
+    assert matcha_io.PdfInput(b"%PDF", name="given.pdf").name == "given.pdf"
+    assert matcha_io.source_name(pathlib.Path("dir") / "file.pdf") == "file.pdf"
+
+
+def test_open_file_objects_are_read_and_named(pdf_path):
+    with open(pdf_path, "rb") as f:
+        source = matcha_io.PdfInput(f)
+    assert source.in_memory and source.name == "input.pdf"
+    assert source.document().page_count == 2
+    source.close()
+
+
+def test_mmap_is_released_on_close_and_reopened_from_the_path(pdf_path):
+    source = matcha_io.PdfInput(pdf_path, use_mmap=True)
+    source.document()
+    source.close()
+    assert source._mmap is None and source._data is None
+    assert source.document().page_count == 2
+    source.close()
+
+
+@pytest.mark.parametrize("kind", ["bytes", "memoryview", "mmap"])
+def test_in_memory_sources_save_incrementally(pdf_path, tmp_path, kind):
+    source = matcha_io.as_input(SOURCES[kind](pdf_path))
+    output = str(tmp_path / "out.pdf")
+
+    def annotate(doc):
+        doc[0].add_highlight_annot(doc[0].get_text("words")[0][:4])
+        return 1
+
+    stats = matcha.save_annotated_pdf(source, output, annotate, "incremental")
+    source.close()
+    assert stats["save_mode"] == "incremental"
+    assert read(output).startswith(read(pdf_path))
+
+
+def test_compare_in_memory_matches_paths(pdf_path, make_pdf):
+    other = make_pdf("other.pdf", [["alpha beta"], ["delta epsilon zeta"]])
+    expected = matcha.compare_pdfs(pdf_path, other).opcodes
+    assert matcha.compare_pdfs(io.BytesIO(read(pdf_path)), memoryview(read(other))).opcodes == expected
+
+
+def test_unsupported_source():
+    with pytest.raises(TypeError, match="Expected a path"):
+        matcha_io.PdfInput(42)
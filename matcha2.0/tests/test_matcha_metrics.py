@@ -0,0 +1,86 @@
+import json
+import logging
+import threading
+
+import matcha
+import matcha_metrics
+
+
+class ListSink:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+
+def test_job_collects_stages_and_counters():
+    sink = ListSink()
+    metrics = matcha_metrics.Metrics(job_name="unit", sinks=[sink])
+    with metrics.job():
+        assert matcha_metrics.current() is metrics
+        with metrics.stage("extraction"):
+            metrics.count("pages", 2)
+        with metrics.stage("extraction"):
+            metrics.count("pages")
+    assert matcha_metrics.current() is not metrics
+    [record] = sink.records
+    assert record["job"] == "unit" and record["counters"] == {"pages": 3}
+    assert list(record["stages"]) == ["extraction"] and record["wall_seconds"] >= record["stages"]["extraction"]
+
+
+def test_jobs_in_threads_are_separate():
+    records = {}
+
+    def run(name):
+        sink = ListSink()
+        with matcha_metrics.Metrics(job_name=name, sinks=[sink]).job():
+            matcha_metrics.current().count(name)
+        records[name] = sink.records[0]
+
+    threads = [threading.Thread(target=run, args=(f"job{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert {name: record["counters"] for name, record in records.items()} == {f"job{n}": {f"job{n}": 1} for n in range(4)}
+
+
+def test_pipeline_reports_into_the_current_job(make_pdf):
+    sink = ListSink()
+    with matcha_metrics.Metrics(sinks=[sink]).job():
+        matcha.compare_pdfs(make_pdf("old.pdf", [["a b c"]]), make_pdf("new.pdf", [["a x c"]]))
+    record = sink.records[0]
+    assert {"extraction", "matching"} <= set(record["stages"])
+    assert record["counters"]["pages"] == 2 and record["counters"]["words"] == 6
+
+
+def test_json_lines_sink_appends(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    for name in ("first", "second"):
+        with matcha_metrics.Metrics(job_name=name, sinks=[matcha_metrics.JsonLinesSink(str(path))]).job() as metrics:
+            with metrics.stage("matching"):
+                pass
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [line["job"] for line in lines] == ["first", "second"]
+
+
+def test_prometheus_sink_writes_text_format(tmp_path):
+    path = tmp_path / "matcha.prom"
+    with matcha_metrics.Metrics(job_name='pair "7"', sinks=[matcha_metrics.PrometheusTextSink(str(path))]).job() as metrics:
+        with metrics.stage("save"):
+            metrics.count("bytes_written", 10)
+    text = path.read_text(encoding="utf-8")
+    assert 'matcha_stage_seconds{job="pair \\"7\\"",stage="save"}' in text
+    assert 'matcha_bytes_written_total{job="pair \\"7\\""} 10' in text
+    assert [p.name for p in tmp_path.iterdir()] == ["matcha.prom"]
+
+
+def test_failing_sink_does_not_break_the_job(tmp_path, caplog):
+    broken = matcha_metrics.JsonLinesSink(str(tmp_path / "missing" / "metrics.jsonl"))
+    sink = ListSink()
+    with caplog.at_level(logging.WARNING, logger="matcha"):
+        with matcha_metrics.Metrics(sinks=[broken, sink]).job():
+            pass
+    assert len(sink.records) == 1
+    assert "Could not write metrics" in caplog.text
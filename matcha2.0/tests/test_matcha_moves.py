@@ -0,0 +1,54 @@
+import fitz
+import pytest
+
+import matcha
+import matcha_moves
+
+
+def test_find_moves_extends_shingle_hits():
+    a = list(range(100, 120))
+    b = [1, 2] + a + [3]
+    moves = matcha_moves.find_moves(a, [(0, 20)], b, [(0, 23)], shingle=4, min_words=10)
+    assert moves == [(0, 2, 20)]
+
+
+def test_find_moves_ignores_short_runs_and_reuses_no_word():
+    a = list(range(12))
+    # Two copies of the old run on the new side, and a coincidence too short to be a move.
+    b = a + [50] + a + [50] + a[:5]
+    moves = matcha_moves.find_moves(a, [(0, 12)], b, [(0, len(b))], shingle=4, min_words=8)
+    assert moves == [(0, 0, 12)]
+
+
+def test_apply_moves_splits_the_changed_spans():
+    # Old: 0..9 deleted at the front; new: 0..9 inserted at the back.
+    opcodes = [('delete', 0, 10, 0, 0), ('equal', 10, 15, 0, 5), ('replace', 15, 16, 5, 16)]
+    result = matcha_moves.apply_moves(opcodes, [(0, 6, 10)])
+    assert result == [('move', 0, 10, 6, 16), ('equal', 10, 15, 0, 5), ('replace', 15, 16, 5, 6)]
+
+
+def test_apply_moves_without_moves_copies_the_opcodes():
+    opcodes = [('equal', 0, 3, 0, 3)]
+    assert matcha_moves.apply_moves(opcodes, []) == opcodes
+
+
+def test_moved_paragraph_end_to_end(make_pdf, tmp_path):
+    moved = "this whole paragraph about payment terms moved from the start to the end of the document"
+    filler = [f"unchanged line number {k} of the filler text" for k in range(4)]
+    old = make_pdf("old.pdf", [[moved] + filler])
+    new = make_pdf("new.pdf", [filler + [moved]])
+
+    plain = matcha.compare_pdfs(old, new)
+    assert plain.change_counts()["moved"] == 0
+    result = matcha.compare_pdfs(old, new, detect_moves=True)
+    counts = result.change_counts()
+    assert counts["moved"] == len(moved.split())
+    assert counts["added"] == counts["removed"] == counts["replaced"] == 0
+    [(_, i1, i2, j1, j2)] = [op for op in result.opcodes if op[0] == 'move']
+    assert result.table_old.texts(i1, i2) == result.table_new.texts(j1, j2) == moved.split()
+
+    matcha.create_annotated_pdfs(old, new, output_folder=str(tmp_path), result=result)
+    for name in ("annotated_OLD_old.pdf", "annotated_NEW_new.pdf"):
+        with fitz.open(str(tmp_path / name)) as doc:
+            colors = [annot.colors["stroke"] for annot in doc[0].annots()]
+        assert colors and all(color == pytest.approx(matcha.MOVED_COLOR) for color in colors)
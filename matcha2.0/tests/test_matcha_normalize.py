@@ -0,0 +1,88 @@
+import pytest
+
+import matcha_diff
+import matcha_normalize
+from matcha_words import WordTable
+
+
+def table_of(*lines, block=0):
+    """A one-page WordTable with one text line per argument."""
+    table = WordTable()
+    words = []
+    for line_no, line in enumerate(lines):
+        for k, text in enumerate(line.split()):
+            words.append((10.0 * k, 20.0 * line_no, 10.0 * k + 8, 20.0 * line_no + 10, text, block, line_no))
+    table.append_page(0, words)
+    return table
+
+
+def normalized_texts(normalized):
+    return [normalized.vocab.strings[t] for t in normalized.token]
+
+
+@pytest.mark.parametrize("profile, matching", [
+    ("exact", set()),
+    ("text", {"case", "ligature"}),
+    ("punctuation", {"case", "ligature", "punctuation"}),
+    ("loose", {"case", "ligature", "punctuation", "numbers"}),
+])
+def test_profiles(profile, matching):
+    pairs = {
+        "case": ("Figure", "figure"),
+        "ligature": ("ﬁle", "file"),
+        "punctuation": ("end.", "end"),
+        "numbers": ("page12", "page13"),
+    }
+    for name, (old, new) in pairs.items():
+        table_old, table_new = matcha_normalize.normalize_tables([table_of(old), table_of(new)], profile)
+        assert (table_old.token.tolist() == table_new.token.tolist()) == (name in matching), name
+
+
+def test_punctuation_only_words_are_dropped():
+    table = table_of("one — two ,")
+    normalized = matcha_normalize.Normalizer("punctuation").table(table)
+    assert normalized_texts(normalized) == ["one", "two"]
+    # A dropped word belongs to the token before it.
+    assert normalized.source_rows.tolist() == [0, 2, 4]
+
+
+def test_dehyphenation_joins_words_across_line_ends():
+    normalizer = matcha_normalize.Normalizer("text")
+    joined = normalizer.table(table_of("in concur-", "rence with"))
+    assert normalized_texts(joined) == ["in", "concurrence", "with"]
+    assert joined.source_rows.tolist() == [0, 1, 3, 4]
+    assert normalized_texts(normalizer.table(table_of("in concur\u00adrence"))) == ["in", "concurrence"]
+
+
+@pytest.mark.parametrize("lines", [
+    ("a well-", "Known name"),    # next word starts upper case
+    ("a well- known",),           # same line
+    ("page 12-", "three"),        # no letter before the hyphen
+])
+def test_dehyphenation_keeps_other_hyphens(lines):
+    table = table_of(*lines)
+    normalized = matcha_normalize.Normalizer("text").table(table)
+    assert len(normalized) == len(table)
+
+
+def test_dehyphenation_needs_the_same_block():
+    table = WordTable()
+    table.append_page(0, [(0, 0, 10, 10, "concur-", 0, 0), (0, 20, 10, 30, "rence", 1, 0)])
+    assert len(matcha_normalize.Normalizer("text").table(table)) == 2
+
+
+def test_to_rows_maps_opcodes_back_to_table_rows():
+    table_old = table_of("The concur-", "rence of Events, here")
+    table_new = table_of("the concurrence of events here today")
+    norm_old, norm_new = matcha_normalize.normalize_tables([table_old, table_new], "punctuation")
+    opcodes = matcha_diff.get_opcodes(norm_old.token, norm_new.token)
+    assert [op[0] for op in opcodes] == ["equal", "insert"]
+
+    rows = matcha_normalize.to_rows(opcodes, norm_old, norm_new)
+    # The hyphenated pair and the dropped comma stay inside the equal run.
+    assert rows == [("equal", 0, 6, 0, 5), ("insert", 6, 6, 5, 6)]
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match="Unknown normalization profile"):
+        matcha_normalize.Normalizer("fuzzy")
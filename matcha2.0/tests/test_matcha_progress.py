@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+import matcha
+import matcha_progress
+import matcha_reports
+
+
+@pytest.fixture
+def pdfs(make_pdf):
+    pages_old = [[f"page {n} line {k} of the old text" for k in range(5)] for n in range(4)]
+    pages_new = [[line.replace("old", "new") for line in page] for page in pages_old]
+    return make_pdf("old.pdf", pages_old), make_pdf("new.pdf", pages_new)
+
+
+def cancel_at(token, stage, when=lambda done, total: True):
+    # A progress callback that cancels token once stage reaches `when`.
+    seen = []
+
+    def progress(name, done, total):
+        seen.append((name, done, total))
+        if name == stage and when(done, total):
+            token.cancel()
+    progress.seen = seen
+    return progress
+
+
+def test_reporter_checks_before_reporting():
+    token = matcha_progress.CancelToken()
+    calls = []
+    report = matcha_progress.reporter(lambda *args: calls.append(args), token)
+    report("extraction", 1, 2)
+    token.cancel()
+    with pytest.raises(matcha_progress.ComparisonCancelled):
+        report("extraction", 2, 2)
+    assert calls == [("extraction", 1, 2)]
+
+
+def test_compare_pdfs_reports_and_finishes(pdfs):
+    token = matcha_progress.CancelToken()
+    progress = cancel_at(token, "never")
+    matcha.compare_pdfs(*pdfs, progress=progress, cancel=token)
+    stages = [name for name, done, total in progress.seen]
+    assert stages[0] == "extraction" and "matching" in stages
+    assert ("extraction", 8, 8) in progress.seen
+
+
+def test_cancel_during_extraction(pdfs):
+    token = matcha_progress.CancelToken()
+    progress = cancel_at(token, "extraction", lambda done, total: done == 1)
+    with pytest.raises(matcha_progress.ComparisonCancelled):
+        matcha.compare_pdfs(*pdfs, progress=progress, cancel=token)
+    assert max(done for name, done, total in progress.seen) < 8
+
+
+def test_cancel_after_last_annotated_page(pdfs, tmp_path):
+    result = matcha.compare_pdfs(*pdfs)
+    token = matcha_progress.CancelToken()
+    progress = cancel_at(token, "annotation", lambda done, total: done == total)
+    with pytest.raises(matcha_progress.ComparisonCancelled):
+        matcha.create_annotated_pdfs(*pdfs, output_folder=str(tmp_path / "out"), result=result,
+                                     progress=progress, cancel=token)
+    assert ("save", 2, 2) not in progress.seen
+    assert not os.path.exists(tmp_path / "out" / "annotated_NEW_new.pdf")
+
+
+@pytest.mark.parametrize("save_mode", matcha.SAVE_MODES)
+def test_cancel_while_annotating_writes_nothing(pdfs, tmp_path, save_mode):
+    result = matcha.compare_pdfs(*pdfs)
+    token = matcha_progress.CancelToken()
+    # Every page changed, so the first half of the annotated pages is the
+    # old document's: cancel on its last one.
+    progress = cancel_at(token, "annotation", lambda done, total: done == total // 2)
+    with pytest.raises(matcha_progress.ComparisonCancelled):
+        matcha.create_annotated_pdfs(*pdfs, output_folder=str(tmp_path / "out"), result=result, save_mode=save_mode,
+                                     progress=progress, cancel=token)
+    assert os.listdir(tmp_path / "out") == []
+
+
+@pytest.mark.parametrize("save_mode", matcha.SAVE_MODES)
+def test_cancel_before_new_pdf_is_written(pdfs, tmp_path, save_mode):
+    result = matcha.compare_pdfs(*pdfs)
+    token = matcha_progress.CancelToken()
+    progress = cancel_at(token, "save", lambda done, total: done == 1)
+    with pytest.raises(matcha_progress.ComparisonCancelled):
+        matcha.create_annotated_pdfs(*pdfs, output_folder=str(tmp_path), result=result, save_mode=save_mode,
+                                     progress=progress, cancel=token)
+    assert os.path.exists(tmp_path / "annotated_OLD_old.pdf")
+    assert not os.path.exists(tmp_path / "annotated_NEW_new.pdf")
+
+
+@pytest.mark.parametrize("report_format", sorted(matcha_reports.REPORT_BACKENDS))
+def test_cancel_during_report(pdfs, tmp_path, report_format):
+    result = matcha.compare_pdfs(*pdfs)
+    token = matcha_progress.CancelToken()
+    progress = cancel_at(token, "report")
+    with pytest.raises(matcha_progress.ComparisonCancelled):
+        matcha_reports.generate_comparison_report(*pdfs, output_folder=str(tmp_path), result=result,
+                                                  report_format=report_format, progress=progress, cancel=token)
+    assert ("report", 1, 1) not in progress.seen
@@ -0,0 +1,21 @@
+import fitz
+
+import matcha
+import matcha_reports
+
+
+def test_pdf_report_wraps_change_text_inside_the_page(make_pdf, tmp_path):
+    added = "an <added> & rather long sentence that cannot possibly fit on one line of the column"
+    old = make_pdf("old.pdf", [["the first line", "the second line"]])
+    new = make_pdf("new.pdf", [["the first line", added, "the second line"]])
+    result = matcha.compare_pdfs(old, new)
+    path = matcha_reports.generate_comparison_report(old, new, output_folder=str(tmp_path / "report"), result=result)
+
+    with fitz.open(path) as doc:
+        words = [w for page in doc for w in page.get_text("words")]
+        width = doc[0].rect.width
+    assert all(w[2] <= width for w in words)
+    cell = [w for w in words if w[4] in added.split()]
+    # Every word made it into the cell (escaped, not parsed as markup), over several lines.
+    assert " ".join(w[4] for w in cell[-len(added.split()):]) == added
+    assert len({round(w[3]) for w in cell[-len(added.split()):]}) > 1
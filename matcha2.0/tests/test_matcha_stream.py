@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+import matcha
+import matcha_stream
+
+
+def page_text(n, word="word"):
+    return [f"page {n} has {word} one two three four five six seven eight"]
+
+
+@pytest.fixture
+def stream_pair(make_pdf):
+    old = make_pdf("old.pdf", [page_text(n) for n in range(8)])
+    new = [page_text(n) for n in range(8)]
+    new[1] = page_text(1, "changed")
+    new[4] = page_text(4) + ["an added line"]
+    new[6] = ["page 6 has one two three four five six seven eight"]
+    return old, make_pdf("new.pdf", new)
+
+def changes_of(summary):
+    return [json.loads(line) for line in summary["changes"].decode("utf-8").splitlines()]
+
+
+def expected_changes(old, new):
+    result = matcha.compare_pdfs(old, new, hierarchical=True)
+    records = []
+    for record in matcha.iter_changes(result):
+        del record["opcode"]
+        records.append(record)
+    return result.change_counts(), records
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 20])
+def test_stream_matches_compare_pdfs(stream_pair, window):
+    old, new = stream_pair
+    counts, records = expected_changes(old, new)
+    summary = matcha_stream.stream_compare(old, new, output_folder=None, window=window)
+    assert summary["counts"] == counts
+    assert changes_of(summary) == records
+
+
+def test_window_without_anchor_is_committed_whole(stream_pair):
+    old, new = stream_pair
+    counts, records = expected_changes(old, new)
+    # No 'equal' run is ever long enough, so every full window is forced out.
+    summary = matcha_stream.stream_compare(old, new, output_folder=None, window=2, min_anchor=10 ** 6)
+    assert summary["counts"]["old_words"] == counts["old_words"]
+    assert summary["counts"]["new_words"] == counts["new_words"]
+    changes = changes_of(summary)
+    # Cutting windows blindly may widen a change, but never loses one.
+    for record in records:
+        assert any(change["new"][0] <= record["new"][0] and record["new"][1] <= change["new"][1]
+                   and change["old"][0] <= record["old"][0] and record["old"][1] <= change["old"][1]
+                   for change in changes)
+    assert summary["new"]["annotations"] > 0
+
+@pytest.mark.parametrize("save_mode", ["incremental", "fast"])
+def test_failure_mid_stream_leaves_no_outputs(stream_pair, tmp_path, monkeypatch, save_mode):
+    old, new = stream_pair
+    calls = []
+    highlight_rows = matcha.highlight_rows
+
+    def failing_highlight_rows(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 2:
+            raise RuntimeError("disk full")
+        return highlight_rows(*args, **kwargs)
+
+    monkeypatch.setattr(matcha, "highlight_rows", failing_highlight_rows)
+    output = tmp_path / "out"
+    with pytest.raises(RuntimeError):
+        matcha_stream.stream_compare(old, new, output_folder=str(output), window=1, save_mode=save_mode)
+    assert os.listdir(output) == []
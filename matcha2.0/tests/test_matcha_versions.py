@@ -0,0 +1,61 @@
+import pytest
+
+import matcha
+import matcha_versions
+
+
+def page(n, tag="v1"):
+    return [f"page {n} first line {tag}" if k == 0 else f"page {n} line {k} stays the same" for k in range(4)]
+
+
+@pytest.fixture
+def versions(make_pdf):
+    v1 = [page(n) for n in range(6)]
+    v2 = list(v1)
+    v2[2] = page(2, "v2")
+    v3 = v2[:4] + [page(9, "v3")] + v2[5:]
+    v3.pop(1)
+    return [make_pdf(f"v{k}.pdf", pages) for k, pages in enumerate((v1, v2, v3), 1)]
+
+
+def test_versions_round_trip(versions, tmp_path):
+    store = matcha_versions.VersionStore(str(tmp_path / "store"))
+    for pdf in versions:
+        store.add_version(pdf)
+    # A fresh store has nothing resolved yet and replays the deltas from disk.
+    reopened = matcha_versions.VersionStore(str(tmp_path / "store"))
+    for number, pdf in enumerate(versions, 1):
+        expected = matcha.extract_word_table(pdf).words()
+        assert store.load_table(f"v{number}").words() == expected
+        assert reopened.load_table(number).words() == expected
+
+
+def test_deltas_only_store_changed_pages(versions, tmp_path):
+    store = matcha_versions.VersionStore(str(tmp_path / "store"))
+    records = [store.add_version(pdf) for pdf in versions]
+    assert records[0]["delta"] == [["new", store.resolve("v1")]]
+    assert [op[0] for op in records[1]["delta"]] == ["copy", "new", "copy"]
+    assert sum(len(op[1]) for op in records[2]["delta"] if op[0] == "new") == 1
+    stats = store.stats()
+    assert (stats["versions"], stats["stored_pages"], stats["version_pages"]) == (3, 8, 17)
+
+
+def test_diff_matches_a_fresh_comparison(versions, tmp_path):
+    store = matcha_versions.VersionStore(str(tmp_path / "store"))
+    for pdf in versions:
+        store.add_version(pdf)
+    for ref_a, ref_b in (("v1", "v2"), ("v1", "v3"), ("v2", "v3")):
+        result = store.diff(ref_a, ref_b)
+        fresh = matcha.compare_pdfs(store.version(ref_a)["source"], store.version(ref_b)["source"], hierarchical=True)
+        assert result.change_counts() == fresh.change_counts()
+        # The second time, changed page pairs come from the stored diffs.
+        assert store.diff(ref_a, ref_b).opcodes == result.opcodes
+
+
+def test_labels_are_unique(versions, tmp_path):
+    store = matcha_versions.VersionStore(str(tmp_path / "store"))
+    store.add_version(versions[0], label="draft")
+    with pytest.raises(ValueError, match="already exists"):
+        store.add_version(versions[1], label="draft")
+    with pytest.raises(KeyError):
+        store.version("v9")
@@ -0,0 +1,98 @@
+import fitz
+import numpy as np
+import pytest
+
+import matcha
+import matcha_visual
+
+
+def white(height, width):
+    return np.full((height, width), 255, dtype=np.uint8)
+
+
+def test_changed_tiles_pads_different_sizes_with_white():
+    small = white(16, 16)
+    large = white(16, 24)
+    large[:, 16:] = 0
+    tiles = matcha_visual.changed_tiles(small, large, tile=8)
+    assert tiles.shape == (2, 3)
+    assert tiles.tolist() == [[False, False, True], [False, False, True]]
+    # White padding matches a white margin.
+    assert not matcha_visual.changed_tiles(small, white(16, 24), tile=8).any()
+
+
+def test_changed_tiles_ignores_small_differences():
+    a = white(8, 8)
+    b = white(8, 8)
+    b[0, 0] = 255 - matcha_visual.PIXEL_THRESHOLD  # below the threshold
+    b[4, 4:4 + matcha_visual.MIN_TILE_PIXELS - 1] = 0  # too few pixels
+    assert not matcha_visual.changed_tiles(a, b).any()
+    b[5, 5] = 0
+    assert matcha_visual.changed_tiles(a, b).all()
+
+
+@pytest.fixture(params=["default", "runs"])
+def tile_regions(request, monkeypatch):
+    if request.param == "runs":
+        monkeypatch.setattr(matcha_visual, "ndimage", None)
+    return matcha_visual._tile_regions
+
+
+def test_tile_regions_are_8_connected(tile_regions):
+    tiles = np.zeros((6, 8), dtype=bool)
+    tiles[0, 0] = tiles[1, 1] = tiles[2, 0] = True   # diagonal neighbours
+    tiles[0, 5:8] = tiles[1, 4] = True               # a run and a tile below its start
+    tiles[4:6, 3] = True                             # separate
+    assert [tuple(map(int, region)) for region in tile_regions(tiles)] == [(0, 0, 2, 3), (4, 0, 8, 2), (3, 4, 4, 6)]
+
+
+def test_tile_regions_of_a_mostly_changed_grid(tile_regions):
+    tiles = np.ones((50, 40), dtype=bool)
+    tiles[:, 20] = False
+    tiles[::2, 10] = False
+    assert [tuple(map(int, region)) for region in tile_regions(tiles)] == [(0, 0, 20, 50), (21, 0, 40, 50)]
+    assert tile_regions(np.zeros((3, 3), dtype=bool)) == []
+
+
+def draw_pdf(path, pages):
+    """One page per (text, rect or None): text near the top, a filled rectangle below it."""
+    doc = fitz.open()
+    for text, rect in pages:
+        page = doc.new_page()
+        page.insert_text((50, 60), text, fontsize=12)
+        if rect is not None:
+            page.draw_rect(fitz.Rect(rect), color=(0, 0, 0), fill=(0, 0, 0))
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_word_rects_mask_text_changes(tmp_path):
+    old = draw_pdf(str(tmp_path / "old.pdf"), [("hello there", None)])
+    new = draw_pdf(str(tmp_path / "new.pdf"), [("hello world", None)])
+    with fitz.open(old) as doc_old, fitz.open(new) as doc_new:
+        regions_old, regions_new, _ = matcha_visual.compare_pages(doc_old, doc_new)
+        assert regions_new and regions_old
+        masks_old = matcha_visual.word_rects(matcha.extract_word_table(old))
+        masks_new = matcha_visual.word_rects(matcha.extract_word_table(new))
+        regions_old, regions_new, stats = matcha_visual.compare_pages(doc_old, doc_new, masks_old=masks_old,
+                                                                      masks_new=masks_new)
+    assert regions_old == regions_new == {}
+    assert stats["pages_rendered"] == 1
+
+
+def test_identical_pages_are_skipped(tmp_path):
+    pages = [("page one", None), ("page two", (100, 200, 200, 300)), ("page three", None)]
+    old = draw_pdf(str(tmp_path / "old.pdf"), pages)
+    pages[1] = ("page two", (100, 400, 200, 500))
+    new = draw_pdf(str(tmp_path / "new.pdf"), pages)
+    rendered = []
+    with fitz.open(old) as doc_old, fitz.open(new) as doc_new:
+        regions_old, regions_new, stats = matcha_visual.compare_pages(
+            doc_old, doc_new, on_page=lambda done, total: rendered.append((done, total)))
+    assert stats["pages_skipped"] == 2 and stats["pages_rendered"] == 1
+    assert rendered == [(1, 1)]
+    assert list(regions_old) == list(regions_new) == [1]
+    # Both the old and the new position of the rectangle are framed.
+    assert len(regions_new[1]) == 2
+    assert any(rect.intersects(fitz.Rect(100, 400, 200, 500)) for rect in regions_new[1])